@@ -0,0 +1,330 @@
+# admission.py
+"""
+ユーザー・チャンネルごとのトークンバケットによる受付制御。
+
+大きな BibTeX が一度に大量に送られても全員の待ち時間が読めるように、
+予算を超えた処理はキューに積み、ユーザー間で公平（ラウンドロビン）な順に実行する。
+キューで待つ間も、ワーカーや Lambda の呼び出しは塞がない。
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable
+
+# この文字数ごとに1トークン消費する（大きな貼り付けほど多く消費する）
+COST_UNIT_CHARS = 10000
+# 使われなくなったバケットを捨てる間隔（秒）
+PRUNE_INTERVAL = 60
+
+
+class TokenBucket:
+    """一定速度で補充されるトークンバケット"""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        """初期化
+
+        Args:
+            rate: 1秒あたりに補充するトークン数
+            capacity: 貯められるトークンの上限
+            now: 現在時刻
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+
+    def wait_time(self, now: float, cost: float) -> float:
+        """cost 分のトークンが貯まるまでの秒数を返す。"""
+        self._refill(now)
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+    def consume(self, now: float, cost: float) -> None:
+        self._refill(now)
+        self.tokens -= min(cost, self.capacity)
+
+
+    def is_full(self, now: float) -> bool:
+        """トークンが上限まで貯まっている（作り直したバケットと同じ状態）かどうか。"""
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class Ticket:
+    """キューに積まれた1件の処理"""
+
+    def __init__(
+        self,
+        user: str,
+        channel: str,
+        cost: float,
+        job: Callable[[], None],
+        on_rejected: Callable[["AdmissionRejected"], None] | None = None,
+        queued_at: float = 0.0,
+    ):
+        self.user = user
+        self.channel = channel
+        self.cost = cost
+        self.job = job
+        self.on_rejected = on_rejected
+        self.queued_at = queued_at
+
+
+class AdmissionRejected(Exception):
+    """予算を超えて積むキューがない、キューが満杯、または待ち時間の上限を超えた場合に送出される例外"""
+
+
+class AdmissionController:
+    """ユーザーとチャンネルの両方の予算を満たした処理だけを実行させる受付制御
+
+    呼び出したスレッドは待たせない。予算を超えた処理は、dispatch があればキューに積み、
+    順番が来たらタイマーのスレッドから dispatch に渡して（server.py では WorkerPool に積み直して）実行させる。
+    dispatch がない場合（Lambda）は、待つと呼び出しが長引いて Slack のリトライを招くため、すぐに拒否する。
+    予算とキューはプロセス内のものなので、Lambda では実行環境ごとの上限にしかならない。
+    """
+
+    def __init__(
+        self,
+        user_rate: float = 0.2,
+        user_burst: float = 5,
+        channel_rate: float = 0.5,
+        channel_burst: float = 10,
+        max_queue: int = 100,
+        max_wait: float = 30,
+        clock: Callable[[], float] = time.monotonic,
+        dispatch: Callable[[Callable[[], None]], bool] | None = None,
+    ):
+        """初期化
+
+        Args:
+            user_rate: ユーザーごとの1秒あたりの補充トークン数
+            user_burst: ユーザーごとのトークン上限
+            channel_rate: チャンネルごとの1秒あたりの補充トークン数
+            channel_burst: チャンネルごとのトークン上限
+            max_queue: キューに積める処理数の上限
+            max_wait: キューで待つ最大秒数
+            clock: 現在時刻を返す関数
+            dispatch: 順番が来た処理を受け取って別のスレッドで実行させる関数（受け付けられなければ False を返す）。
+                None の場合、予算を超えた処理は拒否する
+        """
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.clock = clock
+        self.dispatch = dispatch
+        self._lock = threading.Lock()
+        self._user_buckets: dict[str, TokenBucket] = {}
+        self._channel_buckets: dict[str, TokenBucket] = {}
+        # ユーザーごとの待ち行列。先頭のユーザーから順に1件ずつ取り出す（ラウンドロビン）
+        self._queues: OrderedDict[str, deque[Ticket]] = OrderedDict()
+        self._queued = 0
+        # 次にキューを進めるタイマーと、その時刻
+        self._timer: threading.Timer | None = None
+        self._timer_due = 0.0
+        self._pruned_at = clock()
+
+
+    def _buckets(self, user: str, channel: str, now: float) -> tuple[TokenBucket, TokenBucket]:
+        user_bucket = self._user_buckets.get(user)
+        if user_bucket is None:
+            user_bucket = self._user_buckets[user] = TokenBucket(self.user_rate, self.user_burst, now)
+        channel_bucket = self._channel_buckets.get(channel)
+        if channel_bucket is None:
+            channel_bucket = self._channel_buckets[channel] = TokenBucket(self.channel_rate, self.channel_burst, now)
+        return user_bucket, channel_bucket
+
+
+    def _prune(self, now: float) -> None:
+        """トークンが上限まで戻り、キューにも積まれていないバケットを捨てる（常駐プロセスで増え続けないようにする）。"""
+        if now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        queued_channels = {ticket.channel for queue in self._queues.values() for ticket in queue}
+        for buckets, queued in ((self._user_buckets, self._queues), (self._channel_buckets, queued_channels)):
+            for key in [key for key, bucket in buckets.items() if key not in queued and bucket.is_full(now)]:
+                del buckets[key]
+
+
+    def _wait_time(self, ticket: Ticket, now: float) -> float:
+        user_bucket, channel_bucket = self._buckets(ticket.user, ticket.channel, now)
+        return max(user_bucket.wait_time(now, ticket.cost), channel_bucket.wait_time(now, ticket.cost))
+
+
+    def _grant(self, ticket: Ticket, now: float) -> None:
+        user_bucket, channel_bucket = self._buckets(ticket.user, ticket.channel, now)
+        user_bucket.consume(now, ticket.cost)
+        channel_bucket.consume(now, ticket.cost)
+
+
+    def _fair_order(self) -> list[Ticket]:
+        """キューの中身を実行される順（ユーザー間のラウンドロビン）に並べる。"""
+        order = []
+        queues = list(self._queues.values())
+        depth = max((len(q) for q in queues), default=0)
+        for i in range(depth):
+            order.extend(q[i] for q in queues if i < len(q))
+        return order
+
+
+    def _drain(self, now: float) -> list[Ticket]:
+        """実行可能になった処理を公平な順に許可し、許可した順に返す。"""
+        granted = []
+        progressed = True
+        while progressed and self._queues:
+            progressed = False
+            for user in list(self._queues):
+                queue = self._queues[user]
+                if self._wait_time(queue[0], now) > 0:
+                    continue
+                ticket = queue.popleft()
+                self._grant(ticket, now)
+                self._queued -= 1
+                granted.append(ticket)
+                progressed = True
+                # 許可したユーザーは列の最後に回す
+                del self._queues[user]
+                if queue:
+                    self._queues[user] = queue
+        return granted
+
+
+    def _expire(self, now: float) -> list[Ticket]:
+        """max_wait を超えて待っている処理をキューから取り除いて返す。"""
+        expired = [ticket for ticket in self._fair_order() if now - ticket.queued_at >= self.max_wait]
+        for ticket in expired:
+            self._remove(ticket)
+        return expired
+
+
+    def _schedule(self, now: float) -> None:
+        """次に許可できるか、待ち時間の上限を迎える時刻にキューを進めるタイマーを仕掛ける。"""
+        if not self._queues:
+            return
+        delay = min(
+            min(self._wait_time(q[0], now) for q in self._queues.values()),
+            min(q[0].queued_at for q in self._queues.values()) + self.max_wait - now,
+        )
+        due = now + max(delay, 0.001)
+        if self._timer is not None:
+            if self._timer_due <= due:
+                return
+            self._timer.cancel()
+        self._timer = threading.Timer(due - now, self.drain)
+        self._timer.daemon = True
+        self._timer_due = due
+        self._timer.start()
+
+
+    def run(
+        self,
+        user: str,
+        channel: str,
+        job: Callable[[], None],
+        cost: float = 1,
+        on_queued: Callable[[int], None] | None = None,
+        on_rejected: Callable[[AdmissionRejected], None] | None = None,
+    ) -> bool:
+        """予算内であればすぐに job を実行する。超えていれば待たずに、キューに積んで返る。
+
+        Args:
+            user: ユーザーID
+            channel: チャンネルID
+            job: 実行する処理
+            cost: 消費するトークン数
+            on_queued: キューに積まれたときに順番（1始まり）を受け取るコールバック
+            on_rejected: キューに積んだ処理が実行されずに終わったときに理由を受け取るコールバック
+        返り値:
+            job を実行した場合は True、キューに積んだ場合は False
+        Raises:
+            AdmissionRejected: 予算を超えていて dispatch がない場合、またはキューが満杯の場合
+        """
+        ticket = Ticket(user, channel, cost, job, on_rejected)
+        with self._lock:
+            now = self.clock()
+            self._prune(now)
+            if user not in self._queues and self._wait_time(ticket, now) == 0:
+                self._grant(ticket, now)
+                position = 0
+            else:
+                if self.dispatch is None or self._queued >= self.max_queue:
+                    raise AdmissionRejected("混雑しているため受け付けられませんでした")
+                ticket.queued_at = now
+                self._queues.setdefault(user, deque()).append(ticket)
+                self._queued += 1
+                position = self._fair_order().index(ticket) + 1
+                self._schedule(now)
+
+        if position == 0:
+            job()
+            return True
+        logging.info("受付制御によりキューに積みました: user=%s, channel=%s, position=%d", user, channel, position)
+        if on_queued:
+            on_queued(position)
+        return False
+
+
+    def drain(self) -> None:
+        """順番が来た処理を公平な順に dispatch に渡し、max_wait を超えて待っている処理を拒否する。"""
+        with self._lock:
+            self._timer = None
+            now = self.clock()
+            expired = self._expire(now)
+            granted = self._drain(now)
+            self._schedule(now)
+
+        for ticket in granted:
+            if not self.dispatch(ticket.job):
+                self._reject(ticket, AdmissionRejected("混雑しているため受け付けられませんでした"))
+        for ticket in expired:
+            self._reject(ticket, AdmissionRejected("順番待ちがタイムアウトしました"))
+
+
+    def _reject(self, ticket: Ticket, error: AdmissionRejected) -> None:
+        logging.warning("受付制御により処理しませんでした: user=%s, channel=%s: %s", ticket.user, ticket.channel, error)
+        if ticket.on_rejected:
+            try:
+                ticket.on_rejected(error)
+            except Exception as e:
+                logging.error(f"拒否の通知でエラー: {e}", exc_info=True)
+
+
+    def _remove(self, ticket: Ticket) -> None:
+        queue = self._queues.get(ticket.user)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            self._queued -= 1
+            if not queue:
+                del self._queues[ticket.user]
+
+
+def estimate_cost(text: str) -> float:
+    """メッセージの大きさから消費トークン数を見積もる。"""
+    return 1 + len(text) // COST_UNIT_CHARS
+
+
+def create_admission_controller() -> AdmissionController:
+    """環境変数の設定から受付制御を作成する。"""
+    return AdmissionController(
+        user_rate=float(os.environ.get("ADMISSION_USER_RATE", 0.2)),
+        user_burst=float(os.environ.get("ADMISSION_USER_BURST", 5)),
+        channel_rate=float(os.environ.get("ADMISSION_CHANNEL_RATE", 0.5)),
+        channel_burst=float(os.environ.get("ADMISSION_CHANNEL_BURST", 10)),
+        max_queue=int(os.environ.get("ADMISSION_MAX_QUEUE", 100)),
+        max_wait=float(os.environ.get("ADMISSION_MAX_WAIT", 30)),
+    )
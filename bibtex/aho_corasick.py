@@ -0,0 +1,97 @@
+# bibtex/aho_corasick.py
+"""
+Aho–Corasick 法による複数パターンの同時検索。
+
+パターン数に関係なく、テキストを1回走査するだけですべての出現位置を見つける。
+"""
+
+from collections import deque
+from typing import Iterable, Iterator
+
+
+class AhoCorasick:
+    """複数の文字列パターンを同時に検索するオートマトン"""
+
+    def __init__(
+        self,
+        patterns: Iterable[tuple[str, str]],
+        ignore_case: bool = False,
+        exact_patterns: Iterable[tuple[str, str]] = (),
+    ):
+        """初期化
+
+        Args:
+            patterns: (パターン, 一致したときに返す値) の組
+            ignore_case: 大文字・小文字を区別せずに検索するかどうか
+            exact_patterns: ignore_case の場合も、大文字・小文字まで同じときだけ一致させる (パターン, 値) の組
+        """
+        self.ignore_case = ignore_case
+        # 状態ごとの遷移・失敗時の遷移先・その状態で一致するパターン（長さ・値・大文字・小文字まで比べる場合の元のパターン）
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._outputs: list[list[tuple[int, str, str | None]]] = [[]]
+        for pattern, value in patterns:
+            self._add(self._normalize(pattern), value)
+        for pattern, value in exact_patterns:
+            self._add(self._normalize(pattern), value, exact=pattern if ignore_case else None)
+        self._build()
+
+
+    def _normalize(self, text: str) -> str:
+        if not self.ignore_case:
+            return text
+        lowered = text.lower()
+        # 小文字にすると長さが変わる文字（İ など）がある場合は1文字ずつ変換し、位置を保つ
+        if len(lowered) != len(text):
+            lowered = "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+        return lowered
+
+
+    def _add(self, pattern: str, value: str, exact: str | None = None) -> None:
+        if not pattern:
+            return
+        state = 0
+        for c in pattern:
+            next_state = self._goto[state].get(c)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+                self._goto[state][c] = next_state
+            state = next_state
+        self._outputs[state].append((len(pattern), value, exact))
+
+
+    def _build(self) -> None:
+        """幅優先探索で失敗時の遷移先を求め、一致するパターンを引き継ぐ。"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and c not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(c, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+
+
+    def __len__(self) -> int:
+        """状態数"""
+        return len(self._goto)
+
+
+    def iter_matches(self, text: str) -> Iterator[tuple[int, int, str]]:
+        """テキスト中のすべての一致を (開始位置, 終了位置, 値) で返す（重なりも含む）。"""
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        state = 0
+        for i, c in enumerate(self._normalize(text)):
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            if outputs[state]:
+                for length, value, exact in outputs[state]:
+                    if exact is None or text[i + 1 - length:i + 1] == exact:
+                        yield i + 1 - length, i + 1, value
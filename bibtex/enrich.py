@@ -0,0 +1,370 @@
+# bibtex/enrich.py
+"""
+DOI・arXiv ID から書誌情報（年・ページ・会議名/論文誌名など）を取得し、足りないフィールドを補う。
+
+1回のリクエストに含まれる識別子をまとめて集め、キャッシュにないものだけを
+並行数を制限したスレッドで取得する。接続はスレッドごとに保持して使い回す。
+取得結果は SQLite に有効期限付きで保存し、同じ識別子は再び取得しない。
+
+環境変数（create_enricher）:
+- BIB_BOT_ENRICH=1: 補完を有効にする
+- ENRICH_CACHE_PATH: キャッシュの SQLite ファイルのパス
+- ENRICH_CACHE_TTL: キャッシュの保持秒数
+- ENRICH_MAX_WORKERS: 同時に行う取得の数
+- CROSSREF_API_URL / ARXIV_API_URL: 取得先（テスト用の代替サーバーも指定できる）
+"""
+
+import http.client
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Iterable
+from urllib.parse import quote, urlencode, urlsplit
+
+from bibtexparser.library import Library
+from bibtexparser.model import Entry, Field
+
+from deadline import Deadline
+
+DEFAULT_CROSSREF_URL = "https://api.crossref.org"
+DEFAULT_ARXIV_URL = "http://export.arxiv.org"
+# 取得結果を保持する秒数（見つからなかった識別子も同じ期間覚えておく）
+DEFAULT_TTL = 30 * 24 * 60 * 60
+DEFAULT_TIMEOUT = 10.0
+# arXiv API に1回で問い合わせる ID の数
+ARXIV_BATCH_SIZE = 50
+# 期限がある場合に、取得を待つのに使ってよい残り時間の割合（残りはエントリの整形に使う）
+ENRICH_TIME_SHARE = 0.5
+
+_DOI_URL = re.compile(r"^https?://(?:dx\.)?doi\.org/", re.I)
+_ARXIV_URL = re.compile(r"arxiv\.org/(?:abs|pdf)/([^\s?#]+?)(?:\.pdf)?/?$", re.I)
+_ARXIV_VERSION = re.compile(r"v\d+$")
+_ATOM = "{http://www.w3.org/2005/Atom}"
+
+
+class MetadataStore:
+    """取得した書誌情報を SQLite に有効期限付きで保存するキャッシュ"""
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL, clock: Callable[[], float] = time.time):
+        """初期化
+
+        Args:
+            path: SQLite のファイルパス
+            ttl: 保持する秒数
+            clock: 現在時刻（UNIX時間）を返す関数
+        """
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata ("
+            "identifier TEXT PRIMARY KEY, fields TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+
+    def get_many(self, identifiers: Iterable[str]) -> dict[str, dict[str, str]]:
+        """有効期限内の取得結果を {識別子: フィールド} で返す。"""
+        identifiers = list(identifiers)
+        found: dict[str, dict[str, str]] = {}
+        now = self.clock()
+        with self._lock:
+            # SQLite の変数の上限を超えないように分けて問い合わせる
+            for i in range(0, len(identifiers), 500):
+                chunk = identifiers[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT identifier, fields FROM metadata WHERE expires_at > ? AND identifier IN ({placeholders})",
+                    (now, *chunk),
+                )
+                for identifier, fields in rows:
+                    found[identifier] = json.loads(fields)
+        return found
+
+
+    def put_many(self, results: dict[str, dict[str, str]]) -> None:
+        """取得結果をまとめて保存する。"""
+        expires_at = self.clock() + self.ttl
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO metadata (identifier, fields, expires_at) VALUES (?, ?, ?)",
+                [(identifier, json.dumps(fields), expires_at) for identifier, fields in results.items()],
+            )
+
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class MetadataFetcher:
+    """Crossref と arXiv の API から書誌情報を並行して取得する"""
+
+    def __init__(
+        self,
+        crossref_url: str = DEFAULT_CROSSREF_URL,
+        arxiv_url: str = DEFAULT_ARXIV_URL,
+        max_workers: int = 8,
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        """初期化
+
+        Args:
+            crossref_url: Crossref API のベース URL
+            arxiv_url: arXiv API のベース URL
+            max_workers: 同時に行う取得の数
+            timeout: 1回の取得のタイムアウト（秒）
+        """
+        self.crossref_url = crossref_url.rstrip("/")
+        self.arxiv_url = arxiv_url.rstrip("/")
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._local = threading.local()
+        self._executor: ThreadPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+
+
+    def fetch_many(
+        self, dois: list[str], arxiv_ids: list[str], time_limit: float | None = None
+    ) -> dict[str, dict[str, str]]:
+        """DOI と arXiv ID の書誌情報を取得し、{識別子: フィールド} で返す。
+
+        見つからなかった識別子は空の辞書になる。取得に失敗した識別子は結果に含めない（次回また取得する）。
+        time_limit 秒を過ぎたら、まだ始まっていない取得を取り消し、終わった分だけを返す。
+        """
+        tasks = [(self._fetch_doi, doi) for doi in dois]
+        tasks += [
+            (self._fetch_arxiv_batch, arxiv_ids[i:i + ARXIV_BATCH_SIZE])
+            for i in range(0, len(arxiv_ids), ARXIV_BATCH_SIZE)
+        ]
+        if not tasks:
+            return {}
+
+        results: dict[str, dict[str, str]] = {}
+        futures = [self._get_executor().submit(func, arg) for func, arg in tasks]
+        if time_limit is not None:
+            _, not_done = wait(futures, timeout=max(0.0, time_limit))
+            if not_done:
+                for future in not_done:
+                    future.cancel()
+                logging.warning("時間内に終わらなかった書誌情報の取得 %d 件を待たずに整形します。", len(not_done))
+                futures = [future for future in futures if future not in not_done]
+        for future in futures:
+            try:
+                results.update(future.result())
+            except Exception as e:
+                logging.warning("書誌情報の取得に失敗しました: %s", e)
+        return results
+
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # スレッドごとの接続を使い回すため、プールはリクエストをまたいで保持する
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="enrich")
+            return self._executor
+
+
+    def close(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+    def _fetch_doi(self, doi: str) -> dict[str, dict[str, str]]:
+        status, body = self._get(f"{self.crossref_url}/works/{quote(doi, safe='/:')}")
+        key = doi_key(doi)
+        if status == 404:
+            return {key: {}}
+        if status != 200:
+            raise RuntimeError(f"Crossref から HTTP {status} が返されました: {doi}")
+        return {key: crossref_fields(json.loads(body).get("message") or {})}
+
+
+    def _fetch_arxiv_batch(self, arxiv_ids: list[str]) -> dict[str, dict[str, str]]:
+        query = urlencode({"id_list": ",".join(arxiv_ids), "max_results": len(arxiv_ids)})
+        status, body = self._get(f"{self.arxiv_url}/api/query?{query}")
+        if status != 200:
+            raise RuntimeError(f"arXiv から HTTP {status} が返されました")
+        results = {arxiv_key(arxiv_id): {} for arxiv_id in arxiv_ids}
+        results.update(arxiv_fields(body))
+        return results
+
+
+    def _get(self, url: str) -> tuple[int, bytes]:
+        """GET して (ステータス, 本文) を返す。接続はスレッドごとに保持し、切れていたら1回だけ繋ぎ直す。
+
+        タイムアウトなどで失敗した接続は途中の状態のまま使い回せないため、閉じて捨てる（次の呼び出しで繋ぎ直す）。
+        """
+        parts = urlsplit(url)
+        target = parts.path + (f"?{parts.query}" if parts.query else "")
+        for attempt in range(2):
+            conn = self._connection(parts.scheme, parts.netloc, fresh=attempt > 0)
+            try:
+                conn.request("GET", target, headers={"Accept": "application/json", "User-Agent": "bib_bot"})
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (OSError, http.client.HTTPException) as e:
+                self._drop_connection(parts.scheme, parts.netloc)
+                # 使い回した接続が相手から切られていた場合だけ繋ぎ直す
+                if attempt or not isinstance(e, (http.client.RemoteDisconnected, ConnectionError, http.client.BadStatusLine)):
+                    raise
+        raise AssertionError("unreachable")
+
+
+    def _connection(self, scheme: str, netloc: str, fresh: bool = False) -> http.client.HTTPConnection:
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        key = (scheme, netloc)
+        conn = connections.get(key)
+        if conn is None or fresh:
+            connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = connections[key] = connection_class(netloc, timeout=self.timeout)
+        return conn
+
+
+    def _drop_connection(self, scheme: str, netloc: str) -> None:
+        conn = getattr(self._local, "connections", {}).pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+
+class MetadataEnricher:
+    """Library のエントリに足りないフィールドを、取得した書誌情報で補う"""
+
+    def __init__(self, fetcher: MetadataFetcher, store: MetadataStore | None = None):
+        """初期化
+
+        Args:
+            fetcher: 書誌情報の取得に使う MetadataFetcher
+            store: 取得結果のキャッシュ（None の場合はキャッシュしない）
+        """
+        self.fetcher = fetcher
+        self.store = store
+
+
+    def enrich(self, library: Library, deadline: Deadline | None = None) -> None:
+        """Library のすべてのエントリの識別子をまとめて解決し、足りないフィールドを追加する。
+
+        deadline が与えられた場合、取得を待つのは残り時間の ENRICH_TIME_SHARE までにする
+        （間に合わなかった識別子はキャッシュにあるものだけで補う）。
+        """
+        identifiers = {}
+        for entry in library.entries:
+            identifier = entry_identifier(entry)
+            if identifier:
+                identifiers[id(entry)] = identifier
+        if not identifiers:
+            return
+
+        keys = set(identifiers.values())
+        resolved = self.store.get_many(keys) if self.store else {}
+        missing = keys - resolved.keys()
+        if missing:
+            dois = sorted(key.removeprefix("doi:") for key in missing if key.startswith("doi:"))
+            arxiv_ids = sorted(key.removeprefix("arxiv:") for key in missing if key.startswith("arxiv:"))
+            time_limit = deadline.remaining() * ENRICH_TIME_SHARE if deadline is not None else None
+            if time_limit is not None and time_limit <= 0:
+                logging.warning("残り時間がないため、書誌情報 %d 件を取得せずに整形します。", len(missing))
+                fetched = {}
+            else:
+                fetched = self.fetcher.fetch_many(dois, arxiv_ids, time_limit=time_limit)
+            if self.store and fetched:
+                self.store.put_many(fetched)
+            resolved.update(fetched)
+
+        for entry in library.entries:
+            fields = resolved.get(identifiers.get(id(entry)))
+            if fields:
+                fill_missing_fields(entry, fields)
+
+
+def doi_key(doi: str) -> str:
+    return f"doi:{doi.lower()}"
+
+
+def arxiv_key(arxiv_id: str) -> str:
+    return f"arxiv:{arxiv_id}"
+
+
+def entry_identifier(entry: Entry) -> str | None:
+    """エントリの DOI または arXiv ID を、キャッシュのキーの形式で返す。"""
+    fields = entry.fields_dict
+    if (doi := fields.get("doi")) and str(doi.value).strip():
+        return doi_key(_DOI_URL.sub("", str(doi.value).strip()))
+    url = str(fields["url"].value) if "url" in fields else ""
+    if _DOI_URL.match(url):
+        return doi_key(_DOI_URL.sub("", url))
+
+    prefix = fields.get("archiveprefix")
+    if prefix and str(prefix.value).lower() == "arxiv" and (eprint := fields.get("eprint")):
+        return arxiv_key(_ARXIV_VERSION.sub("", str(eprint.value).strip()))
+    if match := _ARXIV_URL.search(url):
+        return arxiv_key(_ARXIV_VERSION.sub("", match.group(1)))
+    return None
+
+
+def crossref_fields(message: dict) -> dict[str, str]:
+    """Crossref の works API の message から BibTeX のフィールドを作る。"""
+    fields: dict[str, str] = {}
+    for date_key in ("published-print", "published-online", "issued"):
+        date_parts = (message.get(date_key) or {}).get("date-parts") or [[]]
+        if date_parts[0] and date_parts[0][0]:
+            fields["year"] = str(date_parts[0][0])
+            break
+    if page := message.get("page"):
+        fields["pages"] = re.sub(r"\s*[-–]+\s*", "--", page)
+    if container := message.get("container-title"):
+        venue_key = "booktitle" if message.get("type") == "proceedings-article" else "journal"
+        fields[venue_key] = container[0]
+    if volume := message.get("volume"):
+        fields["volume"] = str(volume)
+    if issue := message.get("issue"):
+        fields["number"] = str(issue)
+    return fields
+
+
+def arxiv_fields(atom: bytes) -> dict[str, dict[str, str]]:
+    """arXiv API の Atom から {識別子: フィールド} を作る。"""
+    results = {}
+    for entry in ET.fromstring(atom).iter(f"{_ATOM}entry"):
+        entry_id = entry.findtext(f"{_ATOM}id") or ""
+        match = _ARXIV_URL.search(entry_id)
+        published = entry.findtext(f"{_ATOM}published") or ""
+        if match and published[:4].isdigit():
+            results[arxiv_key(_ARXIV_VERSION.sub("", match.group(1)))] = {"year": published[:4]}
+    return results
+
+
+def fill_missing_fields(entry: Entry, fields: dict[str, str]) -> None:
+    """エントリにないフィールドだけを追加する（会議名・論文誌名はどちらもない場合のみ）。"""
+    existing = entry.fields_dict
+    has_venue = "journal" in existing or "booktitle" in existing
+    for key, value in fields.items():
+        if key in existing or (has_venue and key in ("journal", "booktitle")):
+            continue
+        entry.fields.append(Field(key=key, value=value))
+
+
+def create_enricher() -> MetadataEnricher | None:
+    """環境変数の設定に応じて MetadataEnricher を作成する。BIB_BOT_ENRICH=1 でなければ None を返す。"""
+    if os.environ.get("BIB_BOT_ENRICH") != "1":
+        return None
+    fetcher = MetadataFetcher(
+        crossref_url=os.environ.get("CROSSREF_API_URL", DEFAULT_CROSSREF_URL),
+        arxiv_url=os.environ.get("ARXIV_API_URL", DEFAULT_ARXIV_URL),
+        max_workers=int(os.environ.get("ENRICH_MAX_WORKERS", 8)),
+    )
+    store = MetadataStore(
+        os.environ.get("ENRICH_CACHE_PATH", "/tmp/bib_bot_metadata.sqlite3"),
+        ttl=float(os.environ.get("ENRICH_CACHE_TTL", DEFAULT_TTL)),
+    )
+    return MetadataEnricher(fetcher, store)
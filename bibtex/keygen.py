@@ -0,0 +1,160 @@
+# bibtex/keygen.py
+"""
+引用キーの生成。
+
+パターン（例: "{authors}-{year}-{firstword}"）からキーを作り、すでに発行したキーと重なったら
+"-2", "-3", ... を付ける。発行済みのキーはハッシュ集合で持ち、ベースごとに次の番号を覚えておくため、
+5万件のような大きな文献リストでも1件あたり O(1) で決まる。
+既存の .bib ファイルのキーを読み込んだり、ファイルに保存したりして、まとめて重複を避けることもできる。
+"""
+
+import re
+import unicodedata
+from typing import Iterable
+
+from bibtexparser.model import Entry
+
+DEFAULT_PATTERN = "{authors}-{year}-{firstword}"
+
+# タイトルの最初の単語を選ぶときに読み飛ばす単語
+STOP_WORDS = frozenset({
+    "a", "an", "the", "on", "of", "in", "for", "to", "and", "with", "from", "by", "at", "is", "are", "do", "does",
+    "how", "what", "why", "when", "which", "can", "towards", "toward",
+})
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+_ENTRY_KEY = re.compile(r"@\s*\w+\s*[{(]\s*([^,\s{}()]+)\s*,")
+_LATEX = re.compile(r"\\[A-Za-z]+|[{}\\]")
+
+
+def _ascii(text: str) -> str:
+    """LaTeX コマンド・中括弧・アクセントを除き、小文字の ASCII にする。"""
+    text = _LATEX.sub("", text)
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+
+
+def _last_name(author: str) -> str:
+    """"Last, First" または "First Last" から姓を取り出す。"""
+    author = author.strip()
+    if "," in author:
+        last = author.split(",", 1)[0]
+    else:
+        parts = author.split()
+        last = parts[-1] if parts else ""
+    return re.sub(r"[^a-z0-9-]+", "", _ascii(last).replace(" ", "-")).strip("-")
+
+
+def _authors(value: str) -> list[str]:
+    return [name for name in re.split(r"\s+and\s+", value.strip()) if name.strip()]
+
+
+class KeyIndex:
+    """発行済みの引用キーの索引"""
+
+    def __init__(self, keys: Iterable[str] = ()):
+        """初期化
+
+        Args:
+            keys: すでに使われているキー
+        """
+        self._issued: set[str] = set(keys)
+        # ベースごとの、次に試す番号
+        self._next_suffix: dict[str, int] = {}
+
+
+    def __len__(self) -> int:
+        return len(self._issued)
+
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._issued
+
+
+    def issue(self, base: str) -> str:
+        """base が未使用ならそのまま、使用済みなら番号を付けたキーを発行する。"""
+        if base not in self._issued:
+            self._issued.add(base)
+            return base
+        suffix = self._next_suffix.get(base, 2)
+        while f"{base}-{suffix}" in self._issued:
+            suffix += 1
+        key = f"{base}-{suffix}"
+        self._next_suffix[base] = suffix + 1
+        self._issued.add(key)
+        return key
+
+
+    @classmethod
+    def from_bib(cls, text: str) -> "KeyIndex":
+        """BibTeX の文字列に含まれるエントリのキーから索引を作る。"""
+        return cls(match.group(1) for match in _ENTRY_KEY.finditer(text))
+
+
+    @classmethod
+    def load(cls, path: str) -> "KeyIndex":
+        """save で保存した索引（1行に1キー）、または .bib ファイルから索引を作る。"""
+        with open(path, "r", encoding="utf-8") as f:
+            if path.endswith(".bib"):
+                return cls.from_bib(f.read())
+            return cls(line.rstrip("\n") for line in f if line.strip())
+
+
+    def save(self, path: str) -> None:
+        """索引を1行に1キーで保存する。"""
+        with open(path, "w", encoding="utf-8") as f:
+            for key in sorted(self._issued):
+                f.write(key + "\n")
+
+
+class KeyGenerator:
+    """パターンから引用キーを作り、索引を使って重複しないようにする
+
+    パターンで使える項目:
+    - {firstauthor}: 筆頭著者の姓
+    - {authors}: ACL Anthology と同じ形式の著者（"smith", "smith-jones", "smith-etal"）
+    - {year}: 年
+    - {firstword}: タイトルの最初の（ありふれた単語を除く）単語
+    """
+
+    def __init__(self, pattern: str = DEFAULT_PATTERN, index: KeyIndex | None = None):
+        """初期化
+
+        Args:
+            pattern: キーのパターン
+            index: 発行済みのキーの索引（None の場合は空の索引を使う）
+        """
+        unknown = set(_PLACEHOLDER.findall(pattern)) - {"firstauthor", "authors", "year", "firstword"}
+        if unknown:
+            raise ValueError(f"キーのパターンに使えない項目があります: {', '.join(sorted(unknown))}")
+        self.pattern = pattern
+        self.index = index if index is not None else KeyIndex()
+
+
+    def base_key(self, entry: Entry) -> str:
+        """重複を考えない、エントリのキーを返す。"""
+        fields = entry.fields_dict
+        authors = _authors(str(fields["author"].value)) if "author" in fields else []
+        last_names = [_last_name(author) for author in authors[:3]]
+        if len(authors) > 2:
+            authors_part = f"{last_names[0]}-etal"
+        else:
+            authors_part = "-".join(name for name in last_names if name)
+
+        year = re.sub(r"\D", "", str(fields["year"].value))[:4] if "year" in fields else ""
+        words = re.findall(r"[a-z0-9]+", _ascii(str(fields["title"].value))) if "title" in fields else []
+        firstword = next((word for word in words if word not in STOP_WORDS), words[0] if words else "")
+
+        values = {
+            "firstauthor": last_names[0] if last_names else "",
+            "authors": authors_part,
+            "year": year,
+            "firstword": firstword,
+        }
+        key = _PLACEHOLDER.sub(lambda m: values[m.group(1)], self.pattern)
+        # 空の項目で区切り文字が続いたり端に残ったりしないようにする
+        key = re.sub(r"([-_:.])[-_:.]+", r"\1", key).strip("-_:.")
+        return key or entry.key
+
+
+    def generate(self, entry: Entry) -> str:
+        """エントリのキーを発行する。"""
+        return self.index.issue(self.base_key(entry))
@@ -0,0 +1,111 @@
+# bibtex/latex_lexer.py
+"""
+フィールドの値を、通常の文字列・中括弧のグループ・LaTeX コマンドに分割する。
+
+タイトルの整形・LaTeX コマンドの警告・クォート形式の選択で同じ結果を使うため、値ごとにキャッシュする。
+"""
+
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+# 通常の文字列・コマンド（\name または \ と1文字）・中括弧
+_LEX = re.compile(r"[^{}\\]+|\\(?:[A-Za-z@]+\*?|.)?|[{}]", re.S)
+
+
+class Token(NamedTuple):
+    """値の一部"""
+    kind: str  # "text"・"group"・"command" のいずれか
+    text: str  # 元の文字列（グループは中括弧を、コマンドは直後の引数を含む）
+    has_command: bool = False  # グループの中に LaTeX コマンドを含むかどうか
+
+
+class LexedValue(NamedTuple):
+    """値を分割した結果"""
+    tokens: tuple[Token, ...]
+    has_latex: bool  # 中括弧の中に LaTeX コマンド（例: {\a}）を含むかどうか
+
+
+TEXT = "text"
+GROUP = "group"
+COMMAND = "command"
+
+
+@lru_cache(maxsize=4096)
+def lex(value: str) -> LexedValue:
+    """値をトークンに分割する。
+
+    - 対応する閉じ括弧のある {...} はグループ（入れ子も含めて1つ）
+    - 中括弧の外の \\name は、直後に続くグループ（引数）と合わせて1つのコマンド
+    - 対応のない中括弧と空の {} は通常の文字列として扱う
+
+    Args:
+        value: フィールドの値
+    返り値:
+        LexedValue
+    """
+    tokens: list[Token] = []
+    # 閉じていない { は文字列として扱う（先に位置を求めておくことで、入力を1回読むだけで済む）
+    unmatched = _unmatched_braces(value)
+    text: list[str] = []
+    depth = 0
+    group_start = 0
+    group_has_command = False
+    attach = False
+    pos_after_command = -1
+    for match in _LEX.finditer(value):
+        token = match.group()
+        c = token[0]
+        if depth:
+            if c == "{":
+                depth += 1
+            elif c == "}":
+                depth -= 1
+                if not depth:
+                    raw = value[group_start:match.end()]
+                    if attach:
+                        tokens[-1] = Token(COMMAND, tokens[-1].text + raw)
+                        pos_after_command = match.end()
+                    elif raw == "{}":
+                        text.append(raw)
+                    else:
+                        _flush_text(text, tokens)
+                        tokens.append(Token(GROUP, raw, group_has_command))
+            elif c == "\\":
+                group_has_command = True
+            continue
+        if c == "{" and match.start() not in unmatched:
+            depth = 1
+            group_start = match.start()
+            group_has_command = False
+            # コマンドの直後のグループはその引数とみなす
+            attach = not text and bool(tokens) and tokens[-1].kind == COMMAND and group_start == pos_after_command
+        elif c == "\\":
+            _flush_text(text, tokens)
+            tokens.append(Token(COMMAND, token))
+            pos_after_command = match.end()
+            continue
+        else:
+            text.append(token)
+        pos_after_command = -1
+    _flush_text(text, tokens)
+    return LexedValue(tuple(tokens), any(token.has_command for token in tokens))
+
+
+def _unmatched_braces(value: str) -> set[int]:
+    """対応する閉じ括弧のない { の位置を返す。"""
+    stack: list[int] = []
+    for match in _LEX.finditer(value):
+        c = match.group()[0]
+        if c == "{":
+            stack.append(match.start())
+        elif c == "}" and stack:
+            stack.pop()
+    return set(stack)
+
+
+def _flush_text(text: list[str], tokens: list[Token]) -> None:
+    """続けて読んだ文字列を1つのトークンにまとめる（1文字ずつ連結すると入力長の2乗の時間がかかるため）。"""
+    if text:
+        tokens.append(Token(TEXT, "".join(text)))
+        text.clear()
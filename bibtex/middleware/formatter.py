@@ -4,6 +4,19 @@ from bibtexparser.model import Entry
 from bibtexparser.middlewares.middleware import BlockMiddleware
 from bibtexparser.model import Field
 from load_resource import load_venue_dict
+from venue_misses import venue_miss_recorder
+from ..published_index import PublishedIndex
+
+
+# Slack から来る任意の文字列に使うため、どの正規表現もバックトラックが入力長の2乗にならない形にする
+# （空白の連続の途中から試さないよう、先頭の空白には直前が空白でないことを条件にする）
+_VOLUME = re.compile(r"[,.]\s+(?:Volume|Vol\.?|No\.?|Part|Issue)\s+\d", re.IGNORECASE)
+# 括弧の中に開き括弧を含めないことで、閉じていない括弧が多くても各文字を1回しか読まない
+_PARENTHESIZED = re.compile(r"[\(（]([^\(（\)）]*)[\)）](?=\s*(?::|$))")
+_BRACED = re.compile(r"{([^{}]+)}")
+_TRAILING_YEAR = re.compile(r"(?<![\s\-\u2013\u2014])[\s\-\u2013\u2014]*\d{4}$")
+_PROCEEDINGS_PREFIX = re.compile(r"^(?:In\s+)?(?:Proceedings|Proc\.)\s+of\s+(?:the\s+)?(?:\d{4}|\d+(?:st|nd|rd|th))?\s*", re.IGNORECASE)
+_JOURNAL_NOISE = re.compile(r"(?<!\s)\s+(?:Vol(?:ume)?|No|Issue)\.?\s*\d+|(?<!\s)\s*\(\d{4}\)", re.IGNORECASE)
 
 
 class BibTeXFormatterMiddleware(BlockMiddleware):
@@ -13,23 +26,40 @@ class BibTeXFormatterMiddleware(BlockMiddleware):
     ARTICLE_ORDER = ["title", "author", "journal", "volume", "number", "pages", "year", "url"]
     ARXIV_ORDER = ["title", "author", "journal", "year", "url"]
     INPROCEEDINGS_ORDER = ["title", "author", "booktitle", "pages", "year", "url"]
+    # これより長い会議名・論文誌名は整形しない（異常な入力で処理が長引かないようにする）
+    MAX_VENUE_LENGTH = 1000
     
-    def __init__(self, abbreviation_mode: str = "both", warning_callback: Callable[[str], None] | None = None, *args, **kwargs):
+    def __init__(
+        self,
+        abbreviation_mode: str = "both",
+        warning_callback: Callable[[str], None] | None = None,
+        published_index: PublishedIndex | None = None,
+        *args,
+        **kwargs,
+    ):
         """初期化
         
         Args:
             abbreviation_mode: "short" (略称のみ), "long" (正式名称のみ), "both" (両方、略称を先に)
             warning_callback: 警告メッセージを通知するコールバック関数
+            published_index: arXiv論文の出版版を引く索引（None の場合は arXiv のまま整形する）
         """
         super().__init__(*args, **kwargs)
         self.abbreviation_mode = abbreviation_mode
         self.warning_callback = warning_callback
+        self.published_index = published_index
     
 
     def transform_entry(self, entry: Entry, *args, **kwargs) -> Entry:
         """エントリを整形する"""
         # arXivの場合、journalフィールドをeprintから作成
         is_arxiv = self._is_arxiv(entry)
+        # 出版版が索引にあれば、arXiv版の代わりにそちらを使う
+        if is_arxiv and self.published_index is not None:
+            published = self._find_published_version(entry)
+            if published is not None:
+                entry = self._use_published_version(entry, published)
+                is_arxiv = False
         if is_arxiv:
             entry = self._create_arxiv_journal(entry)
             entry.entry_type = "article"
@@ -60,6 +90,27 @@ class BibTeXFormatterMiddleware(BlockMiddleware):
         return (prefix := entry.fields_dict.get("archiveprefix")) and prefix.value == "arXiv"
     
 
+    def _find_published_version(self, entry: Entry) -> dict[str, str] | None:
+        """arXiv ID（eprint）、見つからなければタイトルで出版版を探す"""
+        fields = entry.fields_dict
+        eprint = str(fields["eprint"].value) if "eprint" in fields else None
+        title = str(fields["title"].value) if "title" in fields else None
+        return self.published_index.lookup(arxiv_id=eprint, title=title)
+
+
+    def _use_published_version(self, entry: Entry, published: dict[str, str]) -> Entry:
+        """arXiv版の書誌情報を出版版のものに置き換える"""
+        published = dict(published)
+        entry.entry_type = published.pop("entry_type", "inproceedings")
+        replaced = {"journal", "booktitle", "year", "pages", "url", "doi", "eprint", "archiveprefix", "primaryclass"}
+        entry.fields = [field for field in entry.fields if field.key.lower() not in replaced]
+        entry.fields.extend(Field(key=key, value=value) for key, value in published.items())
+        if self.warning_callback:
+            venue = published.get("booktitle") or published.get("journal") or ""
+            self.warning_callback(f"arXiv版の代わりに出版版（{venue} {published.get('year', '')}）の情報を使いました。")
+        return entry
+
+
     def _create_arxiv_journal(self, entry: Entry) -> Entry:
         """arXivのjournalフィールドをeprintから作成"""
         if "journal" not in entry.fields_dict and "eprint" in entry.fields_dict:
@@ -133,6 +184,10 @@ class BibTeXFormatterMiddleware(BlockMiddleware):
 
             # 現在の値を処理
             original_value = str(entry.fields_dict[key].value)
+            if len(original_value) > self.MAX_VENUE_LENGTH:
+                if self.warning_callback:
+                    self.warning_callback(f"{key} が長すぎる（{len(original_value)}文字）ため、整形せずにそのまま出力します。")
+                continue
             long_name, short_name = self.process_venue_text(original_value)
 
             # 略称が必要なモードで、かつ抽出できなかった場合は生成を試みる
@@ -178,24 +233,25 @@ class BibTeXFormatterMiddleware(BlockMiddleware):
 
         # 2. Volume情報の削除 (', Volume 1 - Articles' 等)
         # カッコ(略称)の後にVolumeが来ることが多いため、先に削除
-        keywords = r"Volume|Vol\.?|No\.?|Part|Issue"
-        volume_pattern = rf"[,.]\s+({keywords})\s+\d+.*$"
-        cleaned = re.sub(volume_pattern, "", cleaned, flags=re.IGNORECASE).strip()
+        # Volume 以降は末尾まで削除する
+        volume = _VOLUME.search(cleaned)
+        if volume:
+            cleaned = cleaned[:volume.start()].strip()
 
         # 3. カッコ部分の抽出と削除
         # (xxx) または （xxx） をターゲットにする。末尾またはコロンの前を許容
-        match = re.search(r'\s*[\(（]([^\)）]*)[\)）]\s*(?=:|$)', cleaned)
+        match = _PARENTHESIZED.search(cleaned)
         if match:
             content = match.group(1)
-            # カッコを除去したベーステキストを一旦キープ
-            post_match = cleaned[match.end():]
-            cleaned = (cleaned[:match.start()] + post_match).strip()
+            # カッコとその前後の空白を除去したベーステキストを一旦キープ
+            post_match = cleaned[match.end():].lstrip()
+            cleaned = (cleaned[:match.start()].rstrip() + post_match).strip()
         
             # --- 略称の整形ロジック ---
             # a. {}を除去 (LaTeX対策)
-            abbr = re.sub(r"{(.+?)}", r"\1", content)
+            abbr = _BRACED.sub(r"\1", content)
             # b. 年号を除去 (末尾の数字4桁)
-            abbr = re.sub(r'[\s\-\u2013\u2014]*\d{4}$', '', abbr).strip()
+            abbr = _TRAILING_YEAR.sub("", abbr).strip()
         
             if abbr and abbr.isupper():
                 extracted_abbr = abbr
@@ -206,34 +262,38 @@ class BibTeXFormatterMiddleware(BlockMiddleware):
         return cleaned, extracted_abbr
     
 
-    def build_short_venue(self, long_name: str, is_booktitle: bool = True, warning_callback: Callable[[str], None] | None = None) -> str:
-        """journal/booktitle 共通の略称生成ロジック"""
-        if not long_name:
-            return ""
-
-        venue_dict = load_venue_dict()
-        if venue_dict is None:
-            raise ValueError("論文誌名辞書の読み込みに失敗しました。")
-
+    @staticmethod
+    def normalize_venue_name(long_name: str, is_booktitle: bool = True) -> str:
+        """辞書を引くための Venue 名（コロン以降・波括弧・カンマ・ピリオド・前置きなどを除いたもの）を返す"""
         # --- 共通のクリーニング ---
         # 1. コロン以降を削除
         name = long_name.split(":", 1)[0]
         # 2. 波括弧 {A} -> A
-        name = re.sub(r"{(.+?)}", r"\1", name)
+        name = _BRACED.sub(r"\1", name)
         # 3. カンマ、ピリオドを削除
         name = name.translate(str.maketrans("", "", ",.")).strip()
 
         # --- 個別のノイズ削除 ---
         if is_booktitle:
             # Proceedings of... などの前置きを削除
-            pattern = r'^(?:In\s+)?(?:Proceedings|Proc\.)\s+of\s+(?:the\s+)?(?:\d{4}|\d+(?:st|nd|rd|th))?\s*'
-            name = re.sub(pattern, '', name, flags=re.IGNORECASE | re.VERBOSE)
+            name = _PROCEEDINGS_PREFIX.sub("", name)
         else:
             # Vol.XX, No.XX, (20xx) などを削除
-            pattern = r'\s+(?:Vol(?:ume)?|No|Issue)\.?\s*\d+|\s*\(\d{4}\)'
-            name = re.sub(pattern, '', name, flags=re.IGNORECASE)
+            name = _JOURNAL_NOISE.sub("", name)
+
+        return name.strip()
+
+
+    def build_short_venue(self, long_name: str, is_booktitle: bool = True, warning_callback: Callable[[str], None] | None = None) -> str:
+        """journal/booktitle 共通の略称生成ロジック"""
+        if not long_name:
+            return ""
+
+        venue_dict = load_venue_dict()
+        if venue_dict is None:
+            raise ValueError("論文誌名辞書の読み込みに失敗しました。")
 
-        name = name.strip()
+        name = self.normalize_venue_name(long_name, is_booktitle)
         words = name.split()
         if not words:
             return ""
@@ -255,6 +315,8 @@ class BibTeXFormatterMiddleware(BlockMiddleware):
             return name
 
         # --- 3. 最終手段：イニシャル抽出 ---
+        # 辞書に足すべき名前を集計する（正規化した名前は辞書のキーと同じ形）
+        venue_miss_recorder.record(name, is_booktitle)
         venue_type = "会議名" if is_booktitle else "ジャーナル名"
         if warning_callback:
             warning_callback(f"*! ! ! {venue_type}が辞書に見つからなかったため、イニシャルで作成します。*")
@@ -1,6 +1,6 @@
 from bibtexparser.middlewares import BlockMiddleware
 from bibtexparser.model import Entry
-import re
+from ..latex_lexer import lex
 
 class QuoteStyleMiddleware(BlockMiddleware):
     """
@@ -18,7 +18,7 @@ class QuoteStyleMiddleware(BlockMiddleware):
 
             if key == "title":
                 # LaTeXコマンド（例: {\a}）が含まれているかチェック
-                if re.search(r'\{[^}]*\\', raw_val):
+                if lex(raw_val).has_latex:
                     # "TITLE_VALUE"
                     quoted = f'"{raw_val}"'
                 else:
@@ -1,34 +1,60 @@
 from typing import Callable
 from bibtexparser.model import Entry
 from bibtexparser.middlewares.middleware import BlockMiddleware
-from titlecase import titlecase, set_small_word_list
-import re
+from load_resource import load_protected_terms
+from ..latex_lexer import lex
+from ..title_case import build_term_matcher, format_title
+
+
+_term_matcher = None
+# Title Case にする言語（language フィールドがない場合も英語とみなす）
+ENGLISH_LANGUAGES = frozenset({"en", "eng", "english", "en-us", "en-gb", "american", "british"})
+
+
+def _get_term_matcher():
+    """保護する用語のオートマトンを初回だけ作る。"""
+    global _term_matcher
+    if _term_matcher is None:
+        terms = load_protected_terms()
+        _term_matcher = build_term_matcher(terms["ignore_case"], terms["case_sensitive"])
+    return _term_matcher
 
 
 class TitleFormatterMiddleware(BlockMiddleware):
-    """タイトルフィールドにtitlecaseを適用するMiddleware"""
+    """タイトルフィールドをTitle Caseに整形するMiddleware"""
+
+    # これより長いタイトルは整形しない（異常な入力で処理が長引かないようにする）
+    MAX_TITLE_LENGTH = 2000
 
     def __init__(self, warning_callback: Callable[[str], None] | None = None, *args, **kwargs):
         """初期化"""
         super().__init__(*args, **kwargs)
         self.warning_callback = warning_callback
-        new_small_words = r'a|an|and|as|at|but|by|en|for|if|in|of|on|or|the|to|v\.?|via|vs\.?|with'
-        set_small_word_list(new_small_words)
+        self.term_matcher = _get_term_matcher()
     
 
     def transform_entry(self, entry: Entry, *args, **kwargs) -> Entry:
         """エントリのtitleフィールドを整形する"""
         if "title" in entry.fields_dict:
             title = entry.fields_dict["title"].value
+            if len(title) > self.MAX_TITLE_LENGTH:
+                if self.warning_callback:
+                    self.warning_callback(f"タイトルが長すぎる（{len(title)}文字）ため、整形せずにそのまま出力します。")
+                return entry
 
             # LaTeXコマンドのチェック (例: {\a})
-            if self.warning_callback and re.search(r'\{[^}]*\\', title):
+            if self.warning_callback and lex(title).has_latex:
                 msg = (
                     f"タイトルに `{{\\a}}` のようなLaTeX コマンドが含まれている可能性があります: `{title}`\n"
                     r"正しく整形されない可能性が高いため、ご注意ください🙇‍♂️"
                 )
                 self.warning_callback(msg)
 
+            # 英語以外のタイトルは大文字・小文字の規則が異なるため整形しない
+            language = entry.fields_dict.get("language")
+            if language is not None and str(language.value).strip().lower() not in ENGLISH_LANGUAGES:
+                return entry
+
             formatted_title = self._format_title(title)
             
             # titleフィールドを更新
@@ -41,53 +67,5 @@ class TitleFormatterMiddleware(BlockMiddleware):
     
 
     def _format_title(self, title: str) -> str:
-        """タイトルをtitlecase形式に整形"""
-        # 保護する部分を保存
-        protected_parts = []
-        is_latex = bool(re.search(r'\{[^}]*\\', title))
-        
-        def protect_match(match):
-            protected_parts.append(match.group(0))
-            return f"<<protected-{len(protected_parts)-1}>>"
-        
-        # 1. 中括弧で囲まれた部分を保護
-        def protect_braces(match):
-            if is_latex:
-                # LaTeXコマンドがある場合は中括弧を保持
-                content = match.group(0)
-            else:
-                # 通常の場合は中括弧を削除
-                content = match.group(1)
-            protected_parts.append(content)
-            return f"<<protected-{len(protected_parts)-1}>>"
-        
-        title = re.sub(r'\{([^}]+)\}', protect_braces, title)
-        
-        # LaTeXコマンドが含まれている場合は、titlecaseを適用せずにそのまま返す
-        if is_latex:
-            # 保護された部分を復元（is_latexの場合は中括弧ごと保護されている）
-            for i, protected in enumerate(protected_parts):
-                title = title.replace(f"<<protected-{i}>>", protected)
-            return title
-
-        # 2. コロン（:または：）の前の部分が1単語だけなら保護
-        # コロンの位置を探す
-        colon_match = re.search(r'[:：]', title)
-        if colon_match:
-            before_part = title[:colon_match.start()].strip()
-            # スペースが含まれていない（＝1単語）なら保護
-            if before_part and not re.search(r'\s', before_part):
-                # すでに別の保護（中括弧など）がかかっていない場合のみ保護
-                if not before_part.startswith("<<protected-"):
-                    prefix = title[:colon_match.start()]
-                    protected_prefix = re.sub(r'\S+', protect_match, prefix, count=1)
-                    title = protected_prefix + title[colon_match.start():]
-        
-        # titlecaseライブラリを使用
-        formatted = titlecase(title)
-        
-        # 保護された部分を復元
-        for i, protected in enumerate(protected_parts):
-            formatted = formatted.replace(f"<<protected-{i}>>", protected)
-        
-        return formatted
+        """タイトルをtitlecase形式に整形（LaTeXコマンドを含む場合は、中括弧とコマンドを残して整形する）"""
+        return format_title(title, self.term_matcher)
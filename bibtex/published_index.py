@@ -0,0 +1,135 @@
+# bibtex/published_index.py
+"""
+arXiv ID・論文タイトルから出版版（会議・論文誌）の書誌情報を引く、ディスク上の索引。
+
+索引ファイルはオープンアドレス法のハッシュ表で、mmap したまま参照する。
+1回の参照はハッシュ値から求めた位置を数か所読むだけなので、索引の大きさによらず O(1) で、
+プロセスに読み込むのは参照したページだけになる。索引は tools/build_published_index.py で作る。
+
+ファイル形式（リトルエンディアン）:
+- ヘッダー: マジック（8バイト）、スロット数（uint32）、レコード数（uint32）
+- スロット: (キーのハッシュ uint64, データの位置 uint32, データの長さ uint32) × スロット数。ハッシュ 0 は空き
+- データ: "キー\\0フィールドのJSON" の並び
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import unicodedata
+from typing import Iterable
+
+MAGIC = b"BIBPUB01"
+_HEADER = struct.Struct("<8sII")
+_SLOT = struct.Struct("<QII")
+
+_BRACES_AND_COMMANDS = re.compile(r"\\[A-Za-z]+|[{}\\]")
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+_ARXIV_VERSION = re.compile(r"v\d+$")
+
+
+def normalize_title(title: str) -> str:
+    """表記の揺れ（大文字・小文字、中括弧、LaTeX コマンド、記号、アクセント）を除いたタイトルを返す。"""
+    title = _BRACES_AND_COMMANDS.sub("", title)
+    title = unicodedata.normalize("NFKD", title).encode("ascii", "ignore").decode("ascii")
+    return _NON_ALNUM.sub(" ", title.lower()).strip()
+
+
+def arxiv_index_key(arxiv_id: str) -> str:
+    return "arxiv:" + _ARXIV_VERSION.sub("", arxiv_id.strip())
+
+
+def title_index_key(title: str) -> str:
+    return "title:" + normalize_title(title)
+
+
+def _hash(key: str) -> int:
+    # 0 は空きスロットの印なので使わない
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+
+def write_index(path: str, records: Iterable[tuple[str, dict[str, str]]]) -> int:
+    """(キー, フィールド) の組から索引ファイルを書き出し、レコード数を返す。同じキーは後のものを使う。"""
+    items: dict[str, bytes] = {}
+    for key, fields in records:
+        items[key] = key.encode("utf-8") + b"\0" + json.dumps(fields, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    # 負荷率を 0.5 以下にして、探索が数スロットで終わるようにする
+    n_slots = 8
+    while n_slots < len(items) * 2:
+        n_slots *= 2
+    slots = [(0, 0, 0)] * n_slots
+    data = bytearray()
+    for key, payload in items.items():
+        h = _hash(key)
+        i = h % n_slots
+        while slots[i][0]:
+            i = (i + 1) % n_slots
+        slots[i] = (h, len(data), len(payload))
+        data += payload
+
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, n_slots, len(items)))
+        for slot in slots:
+            f.write(_SLOT.pack(*slot))
+        f.write(data)
+    return len(items)
+
+
+class PublishedIndex:
+    """mmap した索引ファイルから出版版の書誌情報を引く"""
+
+    def __init__(self, path: str):
+        """初期化
+
+        Args:
+            path: tools/build_published_index.py で作った索引ファイルのパス
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # 索引を作り直したら変わる値（整形結果のキャッシュのキーに含める）
+        self.version = f"{st.st_ino}:{st.st_mtime_ns}:{st.st_size}"
+        magic, self._n_slots, self._n_records = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"出版版の索引ファイルではありません: {path}")
+        self._data_start = _HEADER.size + self._n_slots * _SLOT.size
+
+
+    def __len__(self) -> int:
+        return self._n_records
+
+
+    def get(self, key: str) -> dict[str, str] | None:
+        """キーに対応するフィールドを返す。なければ None を返す。"""
+        h = _hash(key)
+        encoded = key.encode("utf-8") + b"\0"
+        i = h % self._n_slots
+        while True:
+            slot_hash, offset, length = _SLOT.unpack_from(self._mm, _HEADER.size + i * _SLOT.size)
+            if not slot_hash:
+                return None
+            if slot_hash == h:
+                start = self._data_start + offset
+                if self._mm[start:start + len(encoded)] == encoded:
+                    return json.loads(self._mm[start + len(encoded):start + length])
+            i = (i + 1) % self._n_slots
+
+
+    def lookup(self, arxiv_id: str | None = None, title: str | None = None) -> dict[str, str] | None:
+        """arXiv ID、見つからなければタイトルで出版版を探す。"""
+        if arxiv_id:
+            fields = self.get(arxiv_index_key(arxiv_id))
+            if fields is not None:
+                return fields
+        if title and normalize_title(title):
+            return self.get(title_index_key(title))
+        return None
+
+
+    def close(self) -> None:
+        self._mm.close()
@@ -1,6 +1,10 @@
+import hashlib
+import mmap
 import re
-from typing import Callable
-from collections import defaultdict
+import threading
+import time
+from typing import Callable, Iterable, Iterator
+from collections import OrderedDict, defaultdict
 
 import bibtexparser
 from bibtexparser.middlewares.fieldkeys import NormalizeFieldKeys
@@ -12,16 +16,62 @@ from bibtexparser.library import Library
 from bibtexparser.model import Entry as BibtexEntry
 from bibtexparser.model import DuplicateFieldKeyBlock
 from bibtexparser.model import ParsingFailedBlock
+from bibtexparser.model import ImplicitComment
 from bibtexparser.writer import BibtexFormat
 
+from deadline import Deadline, DeadlineExceeded
+from load_resource import load_published_index, venue_dict_version
+
 from .middleware.quotestylemiddleware import QuoteStyleMiddleware
 from .middleware.formatter import BibTeXFormatterMiddleware
 from .middleware.title_formatter import TitleFormatterMiddleware
+from .enrich import MetadataEnricher
+from .splitter import parse_buffer
+from .published_index import PublishedIndex
+from .keygen import KeyGenerator
 
 
 README_URL = "https://github.com/Naiseki/gw_2025_b3_2_1/blob/main/README.md"
 
 
+class FormatCache:
+    """エントリ単位の整形結果のキャッシュ。
+
+    元の BibTeX 文字列（付随するコメントを含む）のハッシュ・abbreviation_mode・Venue名辞書と出版版の索引のバージョンをキーに、
+    整形結果とその際に出た警告を保持する。件数の上限を超えたら古いものから捨てる。
+    """
+
+    def __init__(self, max_entries: int = 2000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._items: OrderedDict[tuple[str, str, str], tuple[str, tuple[str, ...]]] = OrderedDict()
+
+
+    @staticmethod
+    def make_key(raw: str, abbreviation_mode: str, version: str = "") -> tuple[str, str, str]:
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest(), abbreviation_mode, version
+
+
+    def get(self, key: tuple[str, str, str]) -> tuple[str, tuple[str, ...]] | None:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+
+    def put(self, key: tuple[str, str, str], result: str, warnings: list[str]) -> None:
+        with self._lock:
+            self._items[key] = (result, tuple(warnings))
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
 def _build_parse_stack() -> list[Middleware]:
     """パーススタックを構築する。"""
     stack: list[Middleware] = default_parse_stack(allow_inplace_modification=True)
@@ -30,10 +80,20 @@ def _build_parse_stack() -> list[Middleware]:
     return stack
 
 
-def _parse_bibtex_entries(raw_bib: str, warning_callback: Callable[[str], None] | None = None) -> Library:
-    """BibTeXエントリをパースしてLibraryオブジェクトを返す。"""
-    parse_stack = _build_parse_stack()
-    library = bibtexparser.parse_string(raw_bib, parse_stack=parse_stack, allow_duplicate_fields=True)
+def parse_library(raw_bib: str | mmap.mmap) -> Library:
+    """BibTeX をパースして Library を返す（@string の参照は解決し、解析に失敗したブロックも残す）。
+
+    raw_bib は文字列か mmap したファイル。ブロックの raw は元のバッファの位置だけを持ち、参照されたときに切り出す。
+    """
+    return parse_buffer(raw_bib, parse_stack=_build_parse_stack(), allow_duplicate_fields=True)
+
+
+def _parse_bibtex_entries(raw_bib: str | mmap.mmap, warning_callback: Callable[[str], None] | None = None) -> Library:
+    """BibTeXエントリをパースしてLibraryオブジェクトを返す。
+
+    raw_bib は文字列か mmap したファイル。ブロックの raw は元のバッファの位置だけを持ち、参照されたときに切り出す。
+    """
+    library = parse_library(raw_bib)
 
     if library.failed_blocks:
         if warning_callback:
@@ -49,18 +109,199 @@ def _parse_bibtex_entries(raw_bib: str, warning_callback: Callable[[str], None]
     return library
 
 
+def _build_bibtex_format() -> BibtexFormat:
+    """出力フォーマットを構築する。"""
+    format = BibtexFormat()
+    format.trailing_comma = True
+    format.block_separator = "\n"
+    format.indent = "    "
+    return format
+
+
+def _build_unparse_stack(
+    abbreviation_mode: str = "both",
+    warning_callback: Callable[[str], None] | None = None,
+    published_index: PublishedIndex | None = None,
+) -> list[Middleware]:
+    """整形用のアンパーススタックを構築する。"""
+    return [
+        TitleFormatterMiddleware(warning_callback=warning_callback), 
+        BibTeXFormatterMiddleware(
+            abbreviation_mode=abbreviation_mode,
+            warning_callback=warning_callback,
+            published_index=published_index,
+        ),
+        # LatexEncodingMiddleware(enclose_urls=False), 
+        QuoteStyleMiddleware()
+    ]
+
+
+def _block_separator(format: BibtexFormat, block, next_block) -> str:
+    """ブロック間の区切り文字を返す（bibtexparser.writer と同じ規則）。"""
+    if isinstance(next_block, ImplicitComment):
+        if next_block.get_parser_metadata("attached_before"):
+            return ""
+    elif isinstance(block, ImplicitComment):
+        if block.get_parser_metadata("attached_after"):
+            return ""
+    return format.block_separator
+
+
+def iter_simplified_bibtex_entries(
+    raw_bib: str | mmap.mmap,
+    abbreviation_mode: str = "both",
+    warning_callback: Callable[[str], None] | None = None,
+    cache: FormatCache | None = None,
+    enricher: MetadataEnricher | None = None,
+    key_generator: KeyGenerator | None = None,
+    deadline: Deadline | None = None,
+) -> Iterator[str]:
+    """BibTeXエントリを1件ずつ簡略化し、整形済みの文字列を順に返す。
+
+    エントリに付随するコメント（直前・直後にくっついているもの）は同じ文字列に含める。
+    返された文字列をすべて連結すると simplify_bibtex_entry の結果と一致する。
+    raw_bib には mmap したファイルも渡せる（整形し終えるまで閉じないこと）。
+    cache が与えられた場合、元の文字列が同じエントリは整形し直さずにキャッシュの結果を使う。
+    enricher が与えられた場合、整形の前に DOI・arXiv ID から足りないフィールドを補う。
+    key_generator が与えられた場合、各エントリのキーを生成したキーに置き換える。
+    deadline が与えられた場合、次のエントリを整形すると期限に間に合わなくなった時点で、
+    未処理のエントリのキーを持つ DeadlineExceeded を送出する（それまでに返した文字列は整形済み）。
+    """
+    if not raw_bib:
+        raise ValueError(f"有効なBibTeXエントリが見つかりませんでした😰\n使い方の詳細は {README_URL} をご覧下さい")
+
+    library = _parse_bibtex_entries(raw_bib, warning_callback=warning_callback)
+    if enricher is not None:
+        enricher.enrich(library, deadline=deadline)
+    if key_generator is not None:
+        for entry in library.entries:
+            entry.key = key_generator.generate(entry)
+        # 生成したキーは同じバッチの他のエントリによって変わるため、エントリ単位のキャッシュは使わない
+        cache = None
+    yield from _iter_formatted_blocks(
+        library,
+        abbreviation_mode=abbreviation_mode,
+        warning_callback=warning_callback,
+        cache=cache,
+        enriched=enricher is not None,
+        deadline=deadline,
+    )
+
+
+def iter_formatted_entries(
+    entries: Iterable[BibtexEntry],
+    abbreviation_mode: str = "both",
+    warning_callback: Callable[[str], None] | None = None,
+) -> Iterator[str]:
+    """parse_library でパースしたエントリを、付随するコメントを含めずに1件ずつ整形して返す。
+
+    ファイルの一部のエントリだけを整形し直す場合（tools/watch.py）に使う。
+    """
+    format = _build_bibtex_format()
+    unparse_stack = _build_unparse_stack(
+        abbreviation_mode=abbreviation_mode,
+        warning_callback=warning_callback,
+        published_index=load_published_index(),
+    )
+    for entry in entries:
+        yield bibtexparser.write_string(Library(blocks=[entry]), unparse_stack=unparse_stack, bibtex_format=format)
+
+
+def _iter_formatted_blocks(
+    library: Library,
+    abbreviation_mode: str = "both",
+    warning_callback: Callable[[str], None] | None = None,
+    cache: FormatCache | None = None,
+    enriched: bool = False,
+    deadline: Deadline | None = None,
+) -> Iterator[str]:
+    """パース済みの Library をエントリ単位で整形し、順に返す。"""
+    format = _build_bibtex_format()
+    # キャッシュする場合は、エントリごとに出た警告も一緒に保存する
+    group_warnings: list[str] = []
+
+    def collect_warning(message: str) -> None:
+        group_warnings.append(message)
+        if warning_callback:
+            warning_callback(message)
+
+    published_index = load_published_index()
+    unparse_stack = _build_unparse_stack(
+        abbreviation_mode=abbreviation_mode,
+        warning_callback=collect_warning if cache is not None else warning_callback,
+        published_index=published_index,
+    )
+    # 辞書・出版版の索引が更新されたら略称や会議名が変わりうるため、それぞれのバージョンをキャッシュのキーに含める
+    index_version = published_index.version if published_index is not None else ""
+
+    blocks = library.blocks
+    group = []
+    # これまでで最も時間のかかったエントリの整形時間（次のエントリもこれだけかかるとみなす）
+    slowest = 0.0
+    for i, block in enumerate(blocks):
+        group.append(block)
+        is_last = i == len(blocks) - 1
+        if not is_last:
+            next_block = blocks[i + 1]
+            if isinstance(next_block, ImplicitComment) and next_block.get_parser_metadata("attached_before"):
+                continue
+            if not any(isinstance(b, BibtexEntry) for b in group):
+                continue
+
+        # 補完したエントリは元の文字列が同じでも結果が変わるため、キャッシュのキーを分ける
+        cache_mode = f"{abbreviation_mode}+enrich" if enriched else abbreviation_mode
+        if deadline is not None:
+            if deadline.expired(slowest):
+                pending = [b.key for b in group[:-1] + blocks[i:] if isinstance(b, BibtexEntry)]
+                raise DeadlineExceeded(pending)
+            started = time.perf_counter()
+        result = _write_group(
+            group, unparse_stack, format, cache_mode, warning_callback, cache, group_warnings, index_version
+        )
+        if deadline is not None:
+            slowest = max(slowest, time.perf_counter() - started)
+        if not is_last:
+            result += _block_separator(format, block, blocks[i + 1])
+        group = []
+        yield result
+
+
+def _write_group(group, unparse_stack, format, cache_mode, warning_callback, cache, group_warnings, index_version="") -> str:
+    """エントリと付随するコメントのまとまりを整形する。キャッシュにあればそれを使う。"""
+    if cache is None or any(block.raw is None for block in group):
+        return bibtexparser.write_string(Library(blocks=group), unparse_stack=unparse_stack, bibtex_format=format)
+
+    key = cache.make_key("".join(block.raw for block in group), cache_mode, f"{venue_dict_version()}/{index_version}")
+    cached = cache.get(key)
+    if cached is not None:
+        result, warnings = cached
+        if warning_callback:
+            for message in warnings:
+                warning_callback(message)
+        return result
+
+    group_warnings.clear()
+    result = bibtexparser.write_string(Library(blocks=group), unparse_stack=unparse_stack, bibtex_format=format)
+    cache.put(key, result, group_warnings)
+    return result
+
+
 def simplify_bibtex_entry(
     raw_bib: str,
     new_key: str | None = None,
     abbreviation_mode: str = "both",
     warning_callback: Callable[[str], None] | None = None,
+    deadline: Deadline | None = None,
 ) -> str:
     """BibTeXエントリを簡略化して返す。
     Args:
         raw_bib: 元のBibTeXエントリ文字列
-        new_key: 新しいエントリキー。Noneの場合は元のキーを使用。
+        new_key: 新しいエントリキー、またはキーのパターン（例: "{authors}-{year}-{firstword}"）。
+            Noneの場合は元のキーを使用。キーが重なったエントリには "-2", "-3", ... を付ける。
         abbreviation_mode: "short"（短縮形）, "long"（正式名称）, "both"（両方）
         warning_callback: 警告メッセージを通知するコールバック関数
+        deadline: 処理を打ち切る期限。間に合わなくなったら、それまでに整形した分を返し、
+            未処理のエントリを warning_callback で通知する
     返り値:
         簡略化されたBibTeXエントリ文字列
     """
@@ -68,19 +309,15 @@ def simplify_bibtex_entry(
     if not raw_bib:
         raise ValueError(f"有効なBibTeXエントリが見つかりませんでした😰\n使い方の詳細は {README_URL} をご覧下さい")
 
-    library = _parse_bibtex_entries(raw_bib, warning_callback=warning_callback)
-    format = BibtexFormat()
-    format.trailing_comma = True
-    format.block_separator = "\n"
-    format.indent = "    "
-    result = bibtexparser.write_string(
-        library, 
-        unparse_stack=[
-            TitleFormatterMiddleware(warning_callback=warning_callback), 
-            BibTeXFormatterMiddleware(abbreviation_mode=abbreviation_mode, warning_callback=warning_callback), 
-            # LatexEncodingMiddleware(enclose_urls=False), 
-            QuoteStyleMiddleware()
-        ], 
-        bibtex_format=format
-    )
-    return result
\ No newline at end of file
+    key_generator = KeyGenerator(new_key) if new_key else None
+    results = []
+    try:
+        for result in iter_simplified_bibtex_entries(
+            raw_bib, abbreviation_mode=abbreviation_mode, warning_callback=warning_callback,
+            key_generator=key_generator, deadline=deadline,
+        ):
+            results.append(result)
+    except DeadlineExceeded as e:
+        if warning_callback:
+            warning_callback(str(e))
+    return "".join(results)
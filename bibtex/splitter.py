@@ -0,0 +1,291 @@
+# bibtex/splitter.py
+"""
+元のバッファの位置だけを記録する BibTeX の分割器。
+
+bibtexparser の Splitter は、入力の先頭に改行を足した文字列を作り（入力全体のコピー）、
+ブロックごとに raw の部分文字列を作る。そのため入力の文字列をメモリに2重・3重に持つことになる。
+SpanSplitter は入力をコピーせず、ブロックには元のバッファでの (開始, 終了) だけを持たせて、
+raw は参照されたときに切り出す。
+
+入力には文字列のほか、mmap したファイル（UTF-8）も使える。この場合メモリに載るのはパースした値と、
+参照された raw だけになる（ファイルを閉じた後に raw を参照してはいけない）。
+"""
+
+import mmap
+import re
+from typing import Iterable, Iterator
+
+from bibtexparser.exceptions import BlockAbortedException, ParserStateException
+from bibtexparser.library import Library
+from bibtexparser.middlewares.middleware import Middleware
+from bibtexparser.model import (
+    DuplicateFieldKeyBlock,
+    Entry,
+    ExplicitComment,
+    ParsingFailedBlock,
+    Preamble,
+    String,
+)
+from bibtexparser.splitter import Splitter
+
+# bibtexparser.splitter と同じ区切り記号（バッファが bytes の場合はこちらを使う）
+_MARK_PATTERN = r"(?<!\\)[\{\}\",=\n]|@[\w]*( |\t)*(?={)"
+_MARK_RE = re.compile(_MARK_PATTERN, re.MULTILINE)
+_MARK_RE_BYTES = re.compile(_MARK_PATTERN.encode("ascii"), re.MULTILINE)
+
+
+class MappedText:
+    """UTF-8 のバイト列（mmap など）を、切り出すときだけ文字列にするラッパー
+
+    位置はバイト単位。分割器が使う位置はすべて ASCII の記号の前後なので、文字の途中で切れることはない。
+    """
+
+    def __init__(self, buffer: bytes | mmap.mmap):
+        self.buffer = buffer
+
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+
+    def __getitem__(self, span: slice) -> str:
+        data = self.buffer[span]
+        # ファイル先頭の BOM は取り除く
+        encoding = "utf-8-sig" if (span.start or 0) == 0 else "utf-8"
+        return data.decode(encoding, errors="replace")
+
+
+    def __deepcopy__(self, memo) -> "MappedText":
+        # バッファは読み取り専用として共有する
+        return self
+
+
+class _Mark:
+    """bytes の正規表現のマッチを、bibtexparser の Splitter が期待する文字列のマッチに見せる"""
+
+    __slots__ = ("_match", "_text")
+
+    def __init__(self, match: re.Match):
+        self._match = match
+        self._text = match.group(0).decode("ascii")
+
+
+    def group(self, index: int = 0) -> str:
+        return self._text if index == 0 else self._match.group(index).decode("ascii")
+
+
+    def start(self) -> int:
+        return self._match.start()
+
+
+    def end(self) -> int:
+        return self._match.end()
+
+
+class _SpanRaw:
+    """raw を元のバッファの位置から必要になったときに切り出す"""
+
+    def _set_span(self, buffer: str | MappedText, start: int, end: int) -> None:
+        self._span = (buffer, start, end)
+
+
+    @property
+    def span(self) -> tuple[int, int] | None:
+        """元のバッファでの (開始, 終了) の位置"""
+        span = getattr(self, "_span", None)
+        return None if span is None else span[1:]
+
+
+    @property
+    def raw(self) -> str | None:
+        if self._raw is None and getattr(self, "_span", None) is not None:
+            buffer, start, end = self._span
+            return buffer[start:end]
+        return self._raw
+
+
+class SpanEntry(_SpanRaw, Entry):
+    pass
+
+
+class SpanString(_SpanRaw, String):
+    pass
+
+
+class SpanPreamble(_SpanRaw, Preamble):
+    pass
+
+
+class SpanExplicitComment(_SpanRaw, ExplicitComment):
+    pass
+
+
+class SpanSplitter(Splitter):
+    """ブロックの raw を位置だけで持つ Splitter
+
+    ブロックの区切り方と値は bibtexparser の Splitter と同じ。
+    （bibtexparser の Splitter と違い、入力の先頭に改行を足さないため、ファイル先頭のコメントの raw は改行を含まない。）
+    """
+
+    def __init__(self, bibstr: str | bytes | mmap.mmap, allow_duplicate_fields: bool = False):
+        """初期化
+
+        Args:
+            bibstr: BibTeX の文字列、または UTF-8 のバイト列・mmap したファイル
+            allow_duplicate_fields: 同じキーのフィールドを許す（後のものを使う）か
+        """
+        self.bibstr = bibstr if isinstance(bibstr, str) else MappedText(bibstr)
+
+        self._allow_duplicate_fields = allow_duplicate_fields
+        self._markiter = None
+        self._unaccepted_mark = None
+        self._current_line = 0
+
+        self._reset_block_status(current_char_index=0)
+
+
+    def _iter_marks(self) -> Iterator:
+        if isinstance(self.bibstr, str):
+            return _MARK_RE.finditer(self.bibstr)
+        return map(_Mark, _MARK_RE_BYTES.finditer(self.bibstr.buffer))
+
+
+    def split(self, library: Library | None = None) -> Library:
+        """入力をブロックに分割し、library に追加して返す（bibtexparser の Splitter.split と同じ）。"""
+        self._markiter = self._iter_marks()
+        if library is None:
+            library = Library()
+
+        while True:
+            m = self._next_mark(accept_eof=True)
+            if m is None:
+                break
+
+            m_val = m.group(0).lower()
+            if not m_val.startswith("@"):
+                # 暗黙のコメントの一部
+                continue
+
+            implicit_comment = self._end_implicit_comment(m.start())
+            if implicit_comment is not None:
+                library.add(implicit_comment)
+            self._implicit_comment_start = None
+
+            start_line = self._current_line
+            try:
+                if m_val.startswith("@comment"):
+                    library.add(self._handle_explicit_comment())
+                elif m_val.startswith("@preamble"):
+                    library.add(self._handle_preamble())
+                elif m_val.startswith("@string"):
+                    library.add(self._handle_string(m))
+                else:
+                    library.add(self._handle_entry(m, m_val))
+            except BlockAbortedException as e:
+                library.add(ParsingFailedBlock(start_line=start_line, raw=self.bibstr[m.start():e.end_index], error=e))
+
+            self._reset_block_status(current_char_index=self._current_char_index + 1)
+
+        if self._implicit_comment_start is not None:
+            comment = self._end_implicit_comment(len(self.bibstr))
+            if comment is not None:
+                library.add(comment)
+
+        return library
+
+
+    def _open_bracket(self):
+        # 区切り記号の正規表現は "{" の直前までにマッチするため、次は必ず "{" になる
+        start_bracket_mark = self._next_mark(accept_eof=False)
+        if start_bracket_mark.group(0) != "{":
+            self._unaccepted_mark = start_bracket_mark
+            raise ParserStateException(message="matched a block start that should end with `{`, but no opening bracket was found.")
+        return start_bracket_mark
+
+
+    def _handle_explicit_comment(self) -> ExplicitComment:
+        start_index = self._current_char_index
+        start_line = self._current_line
+        start_bracket_mark = self._open_bracket()
+        end_bracket_index = self._move_to_closed_bracket()
+        block = SpanExplicitComment(
+            start_line=start_line, comment=self.bibstr[start_bracket_mark.end():end_bracket_index].strip()
+        )
+        block._set_span(self.bibstr, start_index, end_bracket_index + 1)
+        return block
+
+
+    def _handle_entry(self, m, m_val) -> Entry | DuplicateFieldKeyBlock:
+        start_line = self._current_line
+        entry_type = m_val[1:].strip()
+        self._open_bracket()
+        comma_mark = self._next_mark(accept_eof=False)
+        if comma_mark.group(0) == "}":
+            # キーの後にカンマもフィールドもないエントリ（RefTeX など）
+            key = self.bibstr[m.end() + 1:comma_mark.start()].strip()
+            fields, end_index, duplicate_keys = [], comma_mark.end(), set()
+        elif comma_mark.group(0) != ",":
+            self._unaccepted_mark = comma_mark
+            raise BlockAbortedException(
+                abort_reason=f"Expected comma after entry key, but found {comma_mark.group(0)}",
+                end_index=comma_mark.end(),
+            )
+        else:
+            self._open_brackets += 1
+            key = self.bibstr[m.end() + 1:comma_mark.start()].strip()
+            fields, end_index, duplicate_keys = self._move_to_end_of_entry(comma_mark.end())
+
+        entry = SpanEntry(start_line=start_line, entry_type=entry_type, key=key, fields=fields)
+        entry._set_span(self.bibstr, m.start(), end_index)
+        if duplicate_keys and not self._allow_duplicate_fields:
+            return DuplicateFieldKeyBlock(duplicate_keys=duplicate_keys, entry=entry)
+        return entry
+
+
+    def _handle_string(self, m) -> String:
+        start_index = self._current_char_index
+        start_line = self._current_line
+        self._open_bracket()
+        equals_mark = self._next_mark(accept_eof=False)
+        if equals_mark.group(0) != "=":
+            self._unaccepted_mark = equals_mark
+            raise BlockAbortedException(
+                abort_reason=f"Expected equals sign after field key, but found {equals_mark.group(0)}",
+                end_index=equals_mark.end(),
+            )
+        key = self.bibstr[m.end() + 1:equals_mark.start()].strip()
+        end_index = self._move_to_closed_bracket()
+        block = SpanString(start_line=start_line, key=key, value=self.bibstr[equals_mark.end():end_index].strip())
+        block._set_span(self.bibstr, start_index, end_index + 1)
+        return block
+
+
+    def _handle_preamble(self) -> Preamble:
+        start_index = self._current_char_index
+        start_line = self._current_line
+        start_bracket_mark = self._open_bracket()
+        end_index = self._move_to_closed_bracket()
+        block = SpanPreamble(start_line=start_line, value=self.bibstr[start_bracket_mark.end():end_index])
+        block._set_span(self.bibstr, start_index, end_index + 1)
+        return block
+
+
+def parse_buffer(
+    bibstr: str | bytes | mmap.mmap,
+    parse_stack: Iterable[Middleware],
+    allow_duplicate_fields: bool = False,
+) -> Library:
+    """SpanSplitter で分割し、parse_stack を適用した Library を返す（bibtexparser.parse_string と同じ）。"""
+    library = SpanSplitter(bibstr, allow_duplicate_fields=allow_duplicate_fields).split()
+    for middleware in parse_stack:
+        library = middleware.transform(library=library)
+    return library
+
+
+def open_mapped(path: str) -> mmap.mmap | bytes:
+    """ファイルを読み取り専用で mmap する（空のファイルは mmap できないため b"" を返す）。"""
+    with open(path, "rb") as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return b""
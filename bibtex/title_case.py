@@ -0,0 +1,413 @@
+# bibtex/title_case.py
+"""
+タイトルを Title Case に整形する。
+
+titlecase ライブラリと同じ規則（小さい単語・全大文字・略語・ハイフンなど）を、
+中括弧による保護とコロンの前の1単語の保護と合わせて、タイトルを1回走査しながら適用する。
+保護した部分はプレースホルダに置き換えず、トークンとしてそのまま持ち回る。
+LaTeX コマンドは latex_lexer で切り出し、その部分だけを変えずに残して整形する。
+"""
+
+import re
+from functools import lru_cache
+
+from .aho_corasick import AhoCorasick
+from .latex_lexer import GROUP, TEXT, Token, lex
+
+# 文頭・文末以外では小文字にする単語
+SMALL_WORDS = ("a", "an", "and", "as", "at", "but", "by", "en", "for", "if", "in", "of", "on", "or", "the", "to", "v.", "v", "via", "vs.", "vs", "with")
+_SMALL_WORD_SET = frozenset(SMALL_WORDS)
+# サブフレーズ（コロンなどの後）の先頭で大文字にする単語（titlecase の正規表現の選択肢の順）
+_SUBPHRASE_WORDS = ("a", "an", "and", "as", "at", "but", "by", "en", "for", "if", "in", "of", "on", "or", "the", "to", "v.", "v", "via", "vs", "with")
+
+_PUNCT = """!"“#$%&'‘()*+,\\-–‒—―./:;?@[\\\\\\]_`{|}~"""
+_PUNCT_CHARS = frozenset("""!"“#$%&'‘()*+,-–‒—―./:;?@[\\]_`{|}~""")
+_SUBPHRASE_MARKS = frozenset(":.;?!")
+_COLONS = frozenset(":：")
+_CONSONANTS = frozenset("bcdfghjklmnpqrstvwxz")
+
+_SMALL = "|".join(re.escape(word) for word in SMALL_WORDS)
+_SMALL_FIRST = re.compile(rf"^([{_PUNCT}]*)({_SMALL})\b", re.I)
+_SMALL_LAST = re.compile(rf"\b({_SMALL})[{_PUNCT}]?$", re.I)
+_MAC_MC = re.compile(r"^([Mm]c|MC)(\w.+)")
+_MR_MRS_MS_DR = re.compile(r"^((m((rs?)|s))|Dr)$", re.I)
+_INLINE_PERIOD = re.compile(r"\w[.]\w")
+_UC_ELSEWHERE = re.compile(rf"[{_PUNCT}]*?[a-zA-Z]+[A-Z]+?")
+_APOS_SECOND = re.compile(r"^[dol]['‘]\w+(?:['s]{2})?$", re.I)
+_UC_INITIALS = re.compile(r"^(?:[A-Z]\.|[A-Z]\.[A-Z])+$")
+# 単語の区切り・改行・コロン・それ以外の文字列
+_TEXT_TOKEN = re.compile(r"[ \t]|[\r\n]+|[:：]|[^ \t\r\n:：]+")
+_SPACE = re.compile(r"\s")
+
+
+class Protected(str):
+    """大文字・小文字を変えずにそのまま出力する部分"""
+
+
+def format_title(title: str, matcher: AhoCorasick | None = None) -> str:
+    """タイトルを Title Case に整形する。
+
+    - 中括弧で囲まれた部分は中括弧を外し、そのまま出力する
+    - LaTeX コマンド（例: {\\a}）を含む場合は、中括弧も残したまま LaTeX 以外の部分を整形する
+    - 最初のコロン（: または ：）の前が1単語だけなら、その単語はそのまま出力する
+    - matcher を与えた場合は、既知の用語を正しい表記にして保護する
+    """
+    lexed = lex(title)
+    tokens = lexed.tokens
+    if matcher is not None:
+        tokens = _protect_tokens(tokens, matcher)
+    return "\n".join(_case_line(words) for words in _tokenize(tokens, lexed.has_latex))
+
+
+def build_term_matcher(terms: list[str], case_sensitive_terms: list[str] = ()) -> AhoCorasick:
+    """保護する用語の一覧から検索用のオートマトンを作る。
+
+    Args:
+        terms: 大文字・小文字を区別せずに探し、正しい表記に直す用語（BERT, ImageNet など）
+        case_sensitive_terms: 普通の単語と同じ綴りのため（BLOOM と bloom など）、表記どおりのときだけ保護する用語
+    返り値:
+        AhoCorasick
+    """
+    return AhoCorasick(
+        ((term, term) for term in terms), ignore_case=True, exact_patterns=((term, term) for term in case_sensitive_terms)
+    )
+
+
+def protect_terms(title: str, matcher: AhoCorasick) -> str:
+    """タイトル中の既知の用語を、正しい表記にして中括弧で保護する。
+
+    単語の途中には一致させない（末尾の複数形の s は許す）。重なる場合は左から順に最長のものを使い、
+    中括弧の中と LaTeX コマンドはそのままにする。
+    """
+    return "".join(token.text for token in _protect_tokens(lex(title).tokens, matcher))
+
+
+def _protect_tokens(tokens: tuple[Token, ...], matcher: AhoCorasick) -> list[Token]:
+    """通常の文字列のトークン中の既知の用語を、中括弧のグループに置き換える。"""
+    result: list[Token] = []
+    for token in tokens:
+        if token.kind != TEXT:
+            result.append(token)
+            continue
+        text = token.text
+        position = 0
+        for start, end, term in _find_terms(text, matcher):
+            if position < start:
+                result.append(Token(TEXT, text[position:start]))
+            result.append(Token(GROUP, "{" + term + "}"))
+            position = end
+        if position == 0:
+            result.append(token)
+        elif position < len(text):
+            result.append(Token(TEXT, text[position:]))
+    return result
+
+
+def _find_terms(text: str, matcher: AhoCorasick) -> list[tuple[int, int, str]]:
+    """単語の境界に一致する用語を、左から順に最長のものを重ならないように選ぶ。"""
+    candidates = []
+    for start, end, term in matcher.iter_matches(text):
+        if start > 0 and _is_word_char(text[start - 1]):
+            continue
+        if end < len(text) and _is_word_char(text[end]):
+            if text[end] != "s" or (end + 1 < len(text) and _is_word_char(text[end + 1])):
+                continue
+        candidates.append((start, -end, term))
+
+    selected = []
+    position = 0
+    for start, negative_end, term in sorted(candidates):
+        if start >= position:
+            selected.append((start, -negative_end, term))
+            position = -negative_end
+    return selected
+
+
+def _is_word_char(c: str) -> bool:
+    return c.isalnum() or c == "_"
+
+
+def _iter_pieces(tokens: tuple[Token, ...] | list[Token], keep_braces: bool):
+    """トークンを、区切り・コロン・文字列（str）と保護する部分（Protected）に分ける。"""
+    for token in tokens:
+        if token.kind == TEXT:
+            for match in _TEXT_TOKEN.finditer(token.text):
+                yield match.group()
+        elif token.kind == GROUP and not keep_braces:
+            yield Protected(token.text[1:-1])
+        else:
+            yield Protected(token.text)
+
+
+def _tokenize(tokens: tuple[Token, ...] | list[Token], keep_braces: bool) -> list[list[list[str]]]:
+    """トークンを行・単語・部分（str または Protected）に分割する。"""
+    lines: list[list[list[str]]] = []
+    words: list[list[str]] = []
+    pieces: list[str] = []
+    # コロンの前が（前後の空白を除いて）1単語かどうかの判定用
+    colon_seen = False
+    first_word: list[str] | None = None
+    gap = False
+    broken = False
+
+    def see_content():
+        nonlocal first_word, broken
+        if first_word is None:
+            first_word = pieces
+        elif gap:
+            broken = True
+
+    for token in _iter_pieces(tokens, keep_braces):
+        if isinstance(token, Protected):
+            if not colon_seen:
+                see_content()
+            pieces.append(token)
+            continue
+        c = token[0]
+        if c == " " or c == "\t" or c == "\r" or c == "\n":
+            words.append(pieces)
+            pieces = []
+            if c == "\r" or c == "\n":
+                lines.append(words)
+                words = []
+            gap = first_word is not None
+            continue
+
+        if not colon_seen:
+            if c in _COLONS:
+                colon_seen = True
+                # コロンの前の1単語を保護する
+                if first_word is not None and not broken and not (first_word and isinstance(first_word[0], Protected)):
+                    first_word[:] = [Protected("".join(first_word))]
+            elif _SPACE.search(token):
+                # 区切りにならない空白（ノーブレークスペースなど）を含む場合のみ1文字ずつ見る
+                for ch in token:
+                    if ch.isspace():
+                        gap = first_word is not None
+                    else:
+                        see_content()
+            else:
+                see_content()
+        if pieces and not isinstance(pieces[-1], Protected):
+            pieces[-1] += token
+        else:
+            pieces.append(token)
+
+    words.append(pieces)
+    lines.append(words)
+    return lines
+
+
+def _case_line(words: list[list[str]]) -> str:
+    """1行分の単語を整形して連結する。"""
+    all_caps = all(
+        not isinstance(piece, Protected) and piece.upper() == piece
+        for word in words for piece in word
+    )
+    results = [_case_word(word, all_caps) for word in words]
+
+    # 先頭・末尾の小さい単語は大文字にする
+    _apply_edge(results[0], 0, _SMALL_FIRST, lambda m: m.group(1) + m.group(2).capitalize())
+    _apply_edge(results[-1], -1, _SMALL_LAST, lambda m: m.group(0).capitalize())
+
+    # コロンなどの後の小さい単語は大文字にする
+    consumed = False
+    for prev, current in zip(results, results[1:]):
+        if consumed:
+            consumed = False
+            continue
+        if not prev or isinstance(prev[-1], Protected) or not prev[-1] or prev[-1][-1] not in _SUBPHRASE_MARKS:
+            continue
+        if not current or isinstance(current[0], Protected):
+            continue
+        head = current[0]
+        for small in _SUBPHRASE_WORDS:
+            if head.startswith(small):
+                current[0] = head[0].upper() + head[1:]
+                # "v." がピリオドまで含めて一致した場合、そのピリオドは次の判定に使わない
+                consumed = len(current) == 1 and head == small and small.endswith(".")
+                break
+
+    return " ".join("".join(word) for word in results)
+
+
+def _apply_edge(word: list[str], index: int, pattern: re.Pattern, repl) -> None:
+    """単語の先頭または末尾の保護されていない部分に pattern を適用する。"""
+    if word and not isinstance(word[index], Protected):
+        word[index] = pattern.sub(repl, word[index])
+
+
+def _case_word(word: list[str], all_caps: bool) -> list[str]:
+    """1単語を整形し、出力する部分のリストを返す。"""
+    if not word:
+        return []
+    if len(word) == 1 and not isinstance(word[0], Protected):
+        return [_case_plain(word[0], all_caps)]
+    return _merge_plain(_case_mixed(word))
+
+
+def _merge_plain(pieces: list[str]) -> list[str]:
+    """隣り合う保護されていない部分を1つにまとめる。"""
+    merged: list[str] = []
+    for piece in pieces:
+        if merged and not isinstance(piece, Protected) and not isinstance(merged[-1], Protected):
+            merged[-1] += piece
+        else:
+            merged.append(piece)
+    return merged
+
+
+def _title_case_subword(word: list[str], small_first_last: bool) -> list[str]:
+    """単語の一部（ハイフン区切りなど）を単独のタイトルとして整形する。"""
+    if not word:
+        return []
+    if not any(isinstance(piece, Protected) for piece in word):
+        text = "".join(word)
+        result = [_case_plain(text, text.upper() == text)]
+    else:
+        result = _merge_plain(_case_mixed(word))
+    if small_first_last and result:
+        _apply_edge(result, 0, _SMALL_FIRST, lambda m: m.group(1) + m.group(2).capitalize())
+        _apply_edge(result, -1, _SMALL_LAST, lambda m: m.group(0).capitalize())
+    return result
+
+
+def _capitalize_first(word: str) -> str:
+    """先頭の記号を読み飛ばし、最初の英数字を大文字にする。"""
+    for i, c in enumerate(word):
+        if c.isalnum() or c == "_":
+            return word[:i] + c.upper() + word[i + 1:]
+        if c not in _PUNCT_CHARS:
+            break
+    return word
+
+
+@lru_cache(maxsize=8192)
+def _case_plain(word: str, all_caps: bool) -> str:
+    """保護された部分を含まない1単語を整形する。同じ単語は何度も現れるため結果をキャッシュする。"""
+    if not word:
+        return word
+    if all_caps and "." in word and _UC_INITIALS.match(word):
+        return word
+
+    if ("'" in word or "‘" in word) and _APOS_SECOND.match(word):
+        if word[0] not in "aeiouAEIOU":
+            return word[0].lower() + word[1] + word[2].upper() + word[3:]
+        return word[0].upper() + word[1] + word[2].upper() + word[3:]
+
+    if word[:2].lower() == "mc":
+        match = _MAC_MC.match(word)
+        if match:
+            return match.group(1).capitalize() + "".join(_title_case_subword([match.group(2)], True))
+
+    if len(word) <= 3 and _MR_MRS_MS_DR.match(word):
+        return word[0].upper() + word[1:]
+
+    if ("." in word and _INLINE_PERIOD.search(word)) or (not all_caps and _UC_ELSEWHERE.match(word)):
+        return word
+
+    lowered = word.lower()
+    if lowered in _SMALL_WORD_SET:
+        return lowered
+
+    if "/" in word and "//" not in word:
+        return "/".join("".join(_title_case_subword([part], False)) for part in word.split("/"))
+
+    if "-" in word:
+        return "-".join("".join(_title_case_subword([part], False)) for part in word.split("-"))
+
+    if all_caps:
+        word = lowered
+
+    # 子音だけの語は略語とみなす（St のような短いものは除く）
+    if len(word) > 2 and word.isascii() and all(c in _CONSONANTS for c in lowered):
+        return word.upper()
+
+    return _capitalize_first(word)
+
+
+def _case_lead(text: str) -> str:
+    """保護された部分の直前にある文字列を整形する。"""
+    if not text:
+        return text
+    if text[:2] in ("Mc", "mc", "MC") and len(text) > 2 and (text[2].isalnum() or text[2] == "_"):
+        rest = _case_lead(text[2:])
+        return text[:2].capitalize() + _SMALL_FIRST.sub(lambda m: m.group(1) + m.group(2).capitalize(), rest)
+    if ("." in text and _INLINE_PERIOD.search(text)) or _UC_ELSEWHERE.match(text):
+        return text
+    return _capitalize_first(text)
+
+
+def _case_trail(text: str) -> str:
+    """保護された部分の直後にある文字列を整形する。"""
+    if "." in text and _INLINE_PERIOD.search(text):
+        return text
+    if text.upper() == text:
+        return text.lower()
+    return text
+
+
+def _case_mixed(word: list[str]) -> list[str]:
+    """保護された部分を含む1単語を整形する。
+
+    titlecase に保護部分をプレースホルダとして渡した場合と同じ結果になるようにする。
+    保護部分の直前の文字列は先頭を大文字にし、直後の文字列は基本的にそのまま残す。
+    """
+    first = word[0]
+    if not isinstance(first, Protected):
+        if first[:2].lower() == "mc" and len(first) > 2 and (first[2].isalnum() or first[2] == "_") and _MAC_MC.match(first + "<"):
+            return [first[:2].capitalize()] + _title_case_subword([first[2:]] + word[1:], True)
+
+    plains = [piece for piece in word if not isinstance(piece, Protected)]
+    if any("." in piece and _INLINE_PERIOD.search(piece) for piece in plains):
+        return list(word)
+    if not isinstance(first, Protected) and _UC_ELSEWHERE.match(first):
+        return list(word)
+
+    if any("/" in piece for piece in plains) and not any("//" in piece for piece in plains):
+        result: list[str] = []
+        for i, part in enumerate(_split_pieces(word, "/")):
+            if i:
+                result.append("/")
+            result.extend(_title_case_subword(part, False))
+        return result
+
+    result = []
+    for i, part in enumerate(_split_pieces(word, "-")):
+        if i:
+            result.append("-")
+        result.extend(_case_hyphen_part(part))
+    return result
+
+
+def _case_hyphen_part(part: list[str]) -> list[str]:
+    """ハイフンで区切った1部分を整形する。"""
+    if not any(isinstance(piece, Protected) for piece in part):
+        return _title_case_subword(part, False)
+
+    positions = [i for i, piece in enumerate(part) if isinstance(piece, Protected)]
+    first, last = positions[0], positions[-1]
+    result = []
+    for i, piece in enumerate(part):
+        if isinstance(piece, Protected) or first < i < last:
+            result.append(piece)
+        elif i < first:
+            result.append(_case_lead(piece))
+        else:
+            result.append(_case_trail(piece))
+    return result
+
+
+def _split_pieces(word: list[str], separator: str) -> list[list[str]]:
+    """保護されていない部分の separator で単語を分割する。"""
+    parts: list[list[str]] = [[]]
+    for piece in word:
+        if isinstance(piece, Protected):
+            parts[-1].append(piece)
+            continue
+        chunks = piece.split(separator)
+        if chunks[0]:
+            parts[-1].append(chunks[0])
+        for chunk in chunks[1:]:
+            parts.append([chunk] if chunk else [])
+    return parts
@@ -0,0 +1,75 @@
+# deadline.py
+"""
+処理を打ち切る期限。
+
+Lambda は制限時間を過ぎると関数ごと止まり、それまでに整形したエントリも返信できない。
+lambda_handler の context（get_remaining_time_in_millis）から期限を作って整形処理に渡し、
+残り時間が少なくなったらエントリの間で打ち切って、整形できた分と未処理のエントリを返信する。
+"""
+
+import os
+import time
+from typing import Callable
+
+
+class DeadlineExceeded(Exception):
+    """期限までに整形し終えられなかった"""
+
+    def __init__(self, pending: list[str]):
+        """初期化
+
+        Args:
+            pending: 整形できなかったエントリのキー
+        """
+        self.pending = pending
+        super().__init__(
+            f"時間内に整形し終えられなかったため、{len(pending)}件のエントリを処理していません⌛: "
+            + ", ".join(pending)
+            + "\nエントリを分けて再度お試しください。"
+        )
+
+
+class Deadline:
+    """残り時間を返す関数から作る期限
+
+    reserve 秒は、打ち切った後に返信を送るために残しておく。
+    """
+
+    def __init__(self, remaining: Callable[[], float], reserve: float = 0.0):
+        """初期化
+
+        Args:
+            remaining: 残り時間（秒）を返す関数
+            reserve: 返信のために残しておく時間（秒）
+        """
+        self._remaining = remaining
+        self.reserve = reserve
+
+
+    @classmethod
+    def after(cls, seconds: float, reserve: float = 0.0, clock: Callable[[], float] = time.monotonic) -> "Deadline":
+        """今から seconds 秒後を期限とする。"""
+        end = clock() + seconds
+        return cls(lambda: end - clock(), reserve)
+
+
+    def remaining(self) -> float:
+        """返信のための時間を除いた残り時間（秒）を返す。"""
+        return self._remaining() - self.reserve
+
+
+    def expired(self, estimate: float = 0.0) -> bool:
+        """estimate 秒かかる処理を始めると、期限に間に合わないかどうか。"""
+        return self.remaining() <= estimate
+
+
+def create_deadline(context) -> Deadline | None:
+    """Lambda の context から期限を作る（context が残り時間を返せない場合は None）。
+
+    - DEADLINE_RESERVE_MS: 返信のために残しておく時間（ミリ秒）
+    """
+    get_remaining = getattr(context, "get_remaining_time_in_millis", None)
+    if get_remaining is None:
+        return None
+    reserve = int(os.environ.get("DEADLINE_RESERVE_MS", 3000)) / 1000
+    return Deadline(lambda: get_remaining() / 1000, reserve)
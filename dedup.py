@@ -0,0 +1,254 @@
+# dedup.py
+"""
+Slack の event_id をキーにしたイベントの重複排除。
+
+Slack は応答が遅れたりエラーになったりしたイベントを再送（リトライ）する。
+最初の処理が完了していればリトライは捨て、途中で落ちていれば（リースが切れていれば）
+リトライを処理することで、返信漏れと二重返信の両方を防ぐ。
+
+Lambda ではリトライが別の実行環境に届くため、実行環境をまたいで共有するストア（DynamoDB など）が必要。
+共有しないストアの場合、lambda_function.parse_slack_request は応答の遅れによるリトライ（http_timeout）を捨てる。
+"""
+
+import abc
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+# 完了したイベントを覚えておく秒数（Slack のリトライは最大で約5分後まで届く）
+DEFAULT_TTL = 60 * 60
+# 処理中のイベントを他の処理に渡さない秒数（Lambda のタイムアウト以上にする）
+DEFAULT_LEASE = 120
+
+PROCESSING = "processing"
+DONE = "done"
+
+
+class DedupStore(abc.ABC):
+    """event_id の処理状態を保持するストアの基底クラス"""
+
+    # すべての実行環境（Lambda のコンテナなど）で同じ記録を参照するかどうか
+    shared = False
+
+    def __init__(self, ttl: float = DEFAULT_TTL, lease: float = DEFAULT_LEASE, clock: Callable[[], float] = time.time):
+        """初期化
+
+        Args:
+            ttl: 完了したイベントを保持する秒数
+            lease: 処理中のイベントを他の処理に渡さない秒数
+            clock: 現在時刻（UNIX時間）を返す関数
+        """
+        self.ttl = ttl
+        self.lease = lease
+        self.clock = clock
+
+
+    @abc.abstractmethod
+    def begin(self, event_id: str) -> bool:
+        """イベントの処理を開始してよければ True を返し、処理中として記録する。
+
+        未知のイベント、またはリースが切れた処理中のイベントの場合のみ True になる。
+        """
+
+
+    @abc.abstractmethod
+    def complete(self, event_id: str) -> None:
+        """イベントの処理が完了したことを記録する。"""
+
+
+    @abc.abstractmethod
+    def release(self, event_id: str) -> None:
+        """処理中の記録を取り消し、リトライで再処理できるようにする。"""
+
+
+class InMemoryDedupStore(DedupStore):
+    """プロセス内のメモリに保持するストア。件数の上限を超えたら古いものから捨てる。"""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, lease: float = DEFAULT_LEASE, max_entries: int = 10000, clock: Callable[[], float] = time.time):
+        super().__init__(ttl=ttl, lease=lease, clock=clock)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # event_id -> (状態, 有効期限)。更新時は末尾に移動し、おおよそ有効期限が早い順に並べる
+        self._records: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+
+    def _evict(self, now: float) -> None:
+        while self._records:
+            event_id, (_, expires_at) = next(iter(self._records.items()))
+            if expires_at > now and len(self._records) < self.max_entries:
+                break
+            self._records.popitem(last=False)
+
+
+    def begin(self, event_id: str) -> bool:
+        now = self.clock()
+        with self._lock:
+            self._evict(now)
+            record = self._records.get(event_id)
+            if record is not None and record[1] > now:
+                return False
+            self._records.pop(event_id, None)
+            self._records[event_id] = (PROCESSING, now + self.lease)
+            return True
+
+
+    def complete(self, event_id: str) -> None:
+        with self._lock:
+            self._records.pop(event_id, None)
+            self._records[event_id] = (DONE, self.clock() + self.ttl)
+
+
+    def release(self, event_id: str) -> None:
+        with self._lock:
+            self._records.pop(event_id, None)
+
+
+class SQLiteDedupStore(DedupStore):
+    """SQLite に保持するストア。
+
+    複数プロセスで同じファイルを共有すれば、共有ストア（DynamoDB など）の代わりとして使える。
+    """
+
+    def __init__(
+        self, path: str, ttl: float = DEFAULT_TTL, lease: float = DEFAULT_LEASE, clock: Callable[[], float] = time.time,
+        shared: bool = False,
+    ):
+        """初期化
+
+        Args:
+            path: SQLite のファイルパス
+            shared: ファイルが共有ストレージ（EFS など）上にあり、すべての実行環境から参照されるかどうか
+        """
+        super().__init__(ttl=ttl, lease=lease, clock=clock)
+        self.path = path
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS slack_events ("
+            "event_id TEXT PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS slack_events_expires_at ON slack_events (expires_at)")
+
+
+    def begin(self, event_id: str) -> bool:
+        now = self.clock()
+        with self._lock:
+            # 期限切れの削除と登録を1トランザクションで行い、他プロセスと競合しないようにする
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM slack_events WHERE expires_at <= ?", (now,))
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO slack_events (event_id, state, expires_at) VALUES (?, ?, ?)",
+                    (event_id, PROCESSING, now + self.lease),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return cursor.rowcount == 1
+
+
+    def complete(self, event_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO slack_events (event_id, state, expires_at) VALUES (?, ?, ?)",
+                (event_id, DONE, self.clock() + self.ttl),
+            )
+
+
+    def release(self, event_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM slack_events WHERE event_id = ? AND state = ?", (event_id, PROCESSING))
+
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class DynamoDBDedupStore(DedupStore):
+    """DynamoDB のテーブルに保持するストア。すべての Lambda の実行環境で共有される。
+
+    テーブルはパーティションキー event_id（文字列）で作成し、expires_at を TTL の属性に設定しておく
+    （TTL による削除は遅れることがあるため、期限の判定は expires_at を見て行う）。
+    """
+
+    shared = True
+
+    def __init__(self, table: str, client, ttl: float = DEFAULT_TTL, lease: float = DEFAULT_LEASE, clock: Callable[[], float] = time.time):
+        """初期化
+
+        Args:
+            table: テーブル名
+            client: boto3 の DynamoDB クライアント
+        """
+        super().__init__(ttl=ttl, lease=lease, clock=clock)
+        self.table = table
+        self.client = client
+
+
+    def _item(self, event_id: str, state: str, expires_at: float) -> dict:
+        return {"event_id": {"S": event_id}, "state": {"S": state}, "expires_at": {"N": str(int(expires_at))}}
+
+
+    def begin(self, event_id: str) -> bool:
+        now = self.clock()
+        try:
+            # 記録がないか期限が切れている場合だけ書き込めるため、同時に届いたリトライのどちらか一方だけが処理する
+            self.client.put_item(
+                TableName=self.table,
+                Item=self._item(event_id, PROCESSING, now + self.lease),
+                ConditionExpression="attribute_not_exists(event_id) OR expires_at <= :now",
+                ExpressionAttributeValues={":now": {"N": str(int(now))}},
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+
+    def complete(self, event_id: str) -> None:
+        self.client.put_item(TableName=self.table, Item=self._item(event_id, DONE, self.clock() + self.ttl))
+
+
+    def release(self, event_id: str) -> None:
+        try:
+            self.client.delete_item(
+                TableName=self.table,
+                Key={"event_id": {"S": event_id}},
+                ConditionExpression="#state = :processing",
+                ExpressionAttributeNames={"#state": "state"},
+                ExpressionAttributeValues={":processing": {"S": PROCESSING}},
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            pass
+
+
+def create_dedup_store() -> DedupStore:
+    """環境変数の設定に応じてストアを作成する。
+
+    - DEDUP_BACKEND: "memory"（デフォルト）、"sqlite" または "dynamodb"
+    - DEDUP_SQLITE_PATH: SQLite のファイルパス（指定した場合は共有ストレージ上のパスとみなす）
+    - DEDUP_DYNAMODB_TABLE: DynamoDB のテーブル名
+    - DEDUP_TTL / DEDUP_LEASE: 保持秒数 / リース秒数
+    """
+    backend = os.environ.get("DEDUP_BACKEND", "memory").lower()
+    ttl = float(os.environ.get("DEDUP_TTL", DEFAULT_TTL))
+    lease = float(os.environ.get("DEDUP_LEASE", DEFAULT_LEASE))
+    if backend == "dynamodb":
+        table = os.environ.get("DEDUP_DYNAMODB_TABLE")
+        if table:
+            # boto3 は Lambda のランタイムに含まれる
+            import boto3
+            return DynamoDBDedupStore(table, boto3.client("dynamodb"), ttl=ttl, lease=lease)
+        logging.warning("DEDUP_DYNAMODB_TABLE が設定されていません。メモリを使用します。")
+        return InMemoryDedupStore(ttl=ttl, lease=lease)
+    if backend == "sqlite":
+        path = os.environ.get("DEDUP_SQLITE_PATH")
+        return SQLiteDedupStore(path or "/tmp/bib_bot_dedup.sqlite3", ttl=ttl, lease=lease, shared=path is not None)
+    if backend != "memory":
+        logging.warning("不明な DEDUP_BACKEND です: %s。メモリを使用します。", backend)
+    return InMemoryDedupStore(ttl=ttl, lease=lease)
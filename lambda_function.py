@@ -4,7 +4,12 @@ import logging
 import base64
 from slack_sdk import WebClient
 from slack_sdk.signature import SignatureVerifier
-from slack_handler import handle_message
+from slack_handler import handle_message, extract_edited_message
+from slack_reply import AsyncReplier, ProgressiveReply
+from dedup import create_dedup_store
+from admission import AdmissionRejected, create_admission_controller, estimate_cost
+from deadline import create_deadline
+from venue_misses import venue_miss_recorder
 
 # ロガー設定
 logger = logging.getLogger()
@@ -23,6 +28,12 @@ else:
     signature_verifier = None
     logger.warning("SLACK_BOT_TOKEN または SLACK_SIGNING_SECRET が設定されていません。")
 
+# 処理済みイベントの記録（リトライの重複排除用）
+dedup_store = create_dedup_store()
+
+# ユーザー・チャンネルごとの受付制御
+admission = create_admission_controller()
+
 def lambda_handler(event, context):
     """
     Slack Events API用のAWS Lambdaハンドラー
@@ -45,33 +56,59 @@ def lambda_handler(event, context):
     if is_base64:
         body = base64.b64decode(body).decode("utf-8")
     
-    # リトライ制御
+    response, event_data = parse_slack_request(headers, body)
+    if response is not None:
+        return response
+    
+    # 制限時間に間に合わなくなったら、整形できた分だけ返信する
+    process_event(event_data, deadline=create_deadline(context))
+    return {"statusCode": 200, "body": "OK"}
+
+
+def parse_slack_request(headers, body):
+    """
+    Slackからのリクエストを検証してパースする。
+    Lambda以外のエントリポイント（server.py）からも共通で使う。
+
+    Args:
+        headers: 小文字化したHTTPヘッダー
+        body: デコード済みのリクエストボディ
+    返り値:
+        (即時に返すレスポンス, イベントデータ)
+        レスポンスがNoneでない場合はイベント処理を行わずにそのまま返す。
+    """
+    
+    # リトライ制御（重複排除は process_event で event_id を見て行う）
     if "x-slack-retry-num" in headers:
-        logger.info(f"リトライリクエストを受信: {headers['x-slack-retry-num']}")
-        return {"statusCode": 200, "body": "OK"}
+        reason = headers.get("x-slack-retry-reason", "unknown")
+        logger.info(f"リトライリクエストを受信: {headers['x-slack-retry-num']} ({reason})")
+        # 応答が遅れただけのリトライは、最初の処理と別の実行環境に届くことがある。
+        # 実行環境をまたいで共有するストアがなければ重複を見分けられないため、処理せずに捨てる
+        if reason == "http_timeout" and not dedup_store.shared:
+            return {"statusCode": 200, "body": "OK"}, None
     
     # 署名検証
     if not signature_verifier:
         logger.error("SignatureVerifierが初期化されていません。")
-        return {"statusCode": 500, "body": "Internal Server Error"}
+        return {"statusCode": 500, "body": "Internal Server Error"}, None
     
     timestamp = headers.get("x-slack-request-timestamp", "")
     signature = headers.get("x-slack-signature", "")
     
     if not timestamp or not signature:
         logger.warning(f"署名またはタイムスタンプがありません。ヘッダー: {list(headers.keys())}")
-        return {"statusCode": 401, "body": "Unauthorized"}
+        return {"statusCode": 401, "body": "Unauthorized"}, None
     
     if not signature_verifier.is_valid(body, timestamp, signature):
         logger.warning("署名検証に失敗しました。")
-        return {"statusCode": 401, "body": "Unauthorized"}
+        return {"statusCode": 401, "body": "Unauthorized"}, None
     
     # ボディのパース
     try:
         event_data = json.loads(body)
     except json.JSONDecodeError as e:
         logger.error(f"JSONボディのパースに失敗: {e}")
-        return {"statusCode": 400, "body": "Bad Request"}
+        return {"statusCode": 400, "body": "Bad Request"}, None
     
     # URL Verification Challenge
     if event_data.get("type") == "url_verification":
@@ -80,48 +117,135 @@ def lambda_handler(event, context):
             "statusCode": 200,
             "headers": {"Content-Type": "text/plain"},
             "body": event_data.get("challenge")
-        }
-    
-    # イベント処理
-    if event_data.get("type") == "event_callback":
-        inner_event = event_data.get("event", {})
-        event_type = inner_event.get("type")
-        channel = inner_event.get("channel", "unknown")
-        user = inner_event.get("user", "unknown")
-        
-        # Bot自身のメッセージは無視
-        if inner_event.get("bot_id"):
-            logger.info("ボットメッセージを無視")
-            return {"statusCode": 200, "body": "OK"}
-        
-        logger.info(f"イベント受信: {event_type}, ユーザー: {user}, チャンネル: {channel}")
-        
-        if event_type in ["app_mention", "message"]:
-            # メッセージ送信関数の定義
-            def say(text, **kwargs):
-                try: 
-                    if not channel or channel == "unknown":
-                        logger.warning("イベントにチャンネルIDが見つかりません。")
-                        return
-
-                    # チャンネルの場合はスレッド返信、DMの場合は通常送信
-                    is_dm = channel.startswith("D")
-                    thread_ts = inner_event.get("ts") if not is_dm else None
-                    
-                    # チャンネルの場合はスレッドに返信する
-                    if thread_ts and "thread_ts" not in kwargs:
-                        kwargs["thread_ts"] = thread_ts
-
-                    client.chat_postMessage(channel=channel, text=text, **kwargs)
-                except Exception as e:
-                    logger.error(f"メッセージ送信エラー: {e}", exc_info=True)
+        }, None
+    
+    if event_data.get("type") != "event_callback":
+        return {"statusCode": 200, "body": "OK"}, None
+    
+    return None, event_data
+
+
+def process_event(event_data, deadline=None):
+    """
+    event_callback のイベントを処理し、Slackに返信する。
+    同じ event_id のイベントは、前回の処理が完了していれば処理しない。
+    deadline（deadline.Deadline）が与えられた場合、間に合わなくなったら整形を打ち切る。
+    """
+    event_id = event_data.get("event_id")
+    if event_id and not dedup_store.begin(event_id):
+        logger.info(f"処理済みまたは処理中のイベントを無視: {event_id}")
+        return
+
+    try:
+        handed_over = _process_event(event_data, deadline)
+    except BaseException:
+        # 返信できずに終わった場合はリトライで再処理できるようにする
+        _release_event(event_id)
+        raise
+    # 受付制御に渡したイベントは、返信した（または拒否した）時点で記録する（順番待ちの場合は後で別のスレッドから）
+    if not handed_over:
+        _complete_event(event_id)
+    # 次の名前が記録されるのを待たずに、間隔が過ぎていれば書き出す
+    venue_miss_recorder.maybe_flush()
+
+
+def _complete_event(event_id):
+    if event_id:
+        dedup_store.complete(event_id)
 
+
+def _release_event(event_id):
+    if event_id:
+        dedup_store.release(event_id)
+
+
+def _process_event(event_data, deadline=None):
+    """
+    イベントを振り分けて返信する。
+    受付制御に渡した場合は True を返す（重複排除の記録は返信・拒否するときに行う）。
+    """
+    event_id = event_data.get("event_id")
+    inner_event = event_data.get("event", {})
+
+    # 編集されたメッセージは編集後の内容で処理し直す（返信は書き換える）
+    if inner_event.get("subtype") == "message_changed":
+        inner_event = extract_edited_message(inner_event)
+        if inner_event is None:
+            logger.info("処理対象外のメッセージ編集を無視")
+            return
+
+    event_type = inner_event.get("type")
+    channel = inner_event.get("channel", "unknown")
+    user = inner_event.get("user", "unknown")
+    
+    # Bot自身のメッセージは無視
+    if inner_event.get("bot_id"):
+        logger.info("ボットメッセージを無視")
+        return
+    
+    logger.info(f"イベント受信: {event_type}, ユーザー: {user}, チャンネル: {channel}")
+    
+    if event_type not in ["app_mention", "message"]:
+        return
+
+    if not channel or channel == "unknown":
+        logger.warning("イベントにチャンネルIDが見つかりません。")
+        return
+
+    # チャンネルの場合はスレッド返信、DMの場合は通常送信
+    is_dm = channel.startswith("D")
+    thread_ts = inner_event.get("ts") if not is_dm else None
+
+    # 警告はまとめて並行送信し、整形結果はエントリごとに逐次送信する
+    say = AsyncReplier(client, channel, thread_ts=thread_ts)
+    result_stream = ProgressiveReply(client, channel, thread_ts=thread_ts)
+
+    def notify_queued(position):
+        # 順番待ちの通知はすぐに送る
+        notice = AsyncReplier(client, channel, thread_ts=thread_ts)
+        notice(f"混雑しているため順番待ちです（{position}番目）。しばらくお待ちください⏳")
+        notice.flush()
+
+    def reply():
+        try:
+            handle_message(inner_event, say, client, result_stream=result_stream, deadline=deadline)
+        except Exception as e:
+            say(f"{e.__class__.__name__} エラーが発生しました😢")
+            logger.error(f"handle_messageでエラー: {e}", exc_info=True)
+        except BaseException:
+            _release_event(event_id)
+            raise
+        finally:
             try:
-                # メッセージ処理の呼び出し
-                handle_message(inner_event, say, client)
+                say.flush()
             except Exception as e:
-                say(f"{e.__class__.__name__} エラーが発生しました😢")
-                logger.error(f"handle_messageでエラー: {e}", exc_info=True)
-                return {"statusCode": 200, "body": "OK"}
-    
-    return {"statusCode": 200, "body": "OK"}
\ No newline at end of file
+                logger.error(f"メッセージ送信エラー: {e}", exc_info=True)
+        _complete_event(event_id)
+
+    def reject(e, queued=False):
+        say(f"{e}😢 時間をおいて再度お試しください。")
+        logger.warning(f"受付制御により処理しませんでした: {e}")
+        try:
+            say.flush()
+        except Exception as e:
+            logger.error(f"メッセージ送信エラー: {e}", exc_info=True)
+        # 順番待ちの末に実行できなかった場合は、Slack のリトライで処理し直せるようにする
+        if queued:
+            _release_event(event_id)
+        else:
+            _complete_event(event_id)
+
+    # 受付制御を通してメッセージ処理を呼び出す。予算を超えた場合は待たずに、
+    # 順番待ちのキューに積む（server.py）か、拒否する（Lambda）
+    try:
+        admission.run(
+            user,
+            channel,
+            reply,
+            cost=estimate_cost(inner_event.get("text") or ""),
+            on_queued=notify_queued,
+            on_rejected=lambda e: reject(e, queued=True),
+        )
+    except AdmissionRejected as e:
+        reject(e)
+    return True
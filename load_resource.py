@@ -1,18 +1,180 @@
+import hashlib
 import json
 import logging
+import os
+import threading
+import time
 
+from bibtex.published_index import PublishedIndex
 
-_venue_dict: dict[str, str] = None
+DEFAULT_VENUE_DICT_PATH = "resources/venue_abbreviations.json"
+
+
+class VenueDictProvider:
+    """Venue名辞書を提供し、ファイルが更新されたら読み込み直す。
+
+    参照のたびに、前回の確認から poll_interval 秒以上経っていればバックグラウンドのスレッドで
+    ファイルの更新を確認する。新しい辞書は読み込みが終わってから1回の代入で差し替えるため、
+    参照側は待たされず、ロックも取らない。
+    """
+
+    def __init__(self, path: str, poll_interval: float = 60.0):
+        """初期化
+
+        Args:
+            path: 辞書ファイル（JSON）のパス。共有ストレージや、オブジェクトストレージから同期したファイルでもよい
+            poll_interval: 更新を確認する間隔（秒）。0 以下なら最初に読み込んだ辞書を使い続ける
+        """
+        self.path = path
+        self.poll_interval = poll_interval
+        # (辞書, バージョン) の組。まとめて差し替える
+        self._snapshot: tuple[dict[str, str], str] | None = None
+        self._stat: tuple[int, int] | None = None
+        self._checked = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+
+    def get(self) -> dict[str, str]:
+        """現在の辞書を返す。"""
+        return self._current()[0]
+
+
+    @property
+    def version(self) -> str:
+        """辞書の内容のハッシュ。辞書が変わるとこの値も変わる。"""
+        return self._current()[1]
+
+
+    def _current(self) -> tuple[dict[str, str], str]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.refresh()
+            return self._snapshot
+        if self.poll_interval > 0 and time.monotonic() - self._checked >= self.poll_interval:
+            self._refresh_in_background()
+        return snapshot
+
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                logging.exception("Venue名辞書の再読み込みに失敗しました。")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="venue-dict-refresh", daemon=True).start()
+
+
+    def refresh(self) -> bool:
+        """ファイルが更新されていれば読み込み直す。
+
+        返り値:
+            辞書を差し替えた場合は True
+        """
+        self._checked = time.monotonic()
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            if self._snapshot is None:
+                logging.error("%s が見つかりません。", self.path)
+                raise
+            logging.warning("%s が見つからないため、読み込み済みの辞書を使い続けます。", self.path)
+            return False
+
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if self._snapshot is not None and stat_key == self._stat:
+            return False
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+        version = hashlib.sha256(data).hexdigest()[:16]
+        if self._snapshot is not None and version == self._snapshot[1]:
+            self._stat = stat_key
+            return False
+        try:
+            venues = json.loads(data)
+        except ValueError:
+            if self._snapshot is None:
+                raise
+            logging.exception("%s を読み込めないため、読み込み済みの辞書を使い続けます。", self.path)
+            return False
+
+        self._snapshot = (venues, version)
+        self._stat = stat_key
+        logging.info("Venue名辞書を読み込みました: %s (version %s, %d 件)", self.path, version, len(venues))
+        return True
+
+
+venue_provider = VenueDictProvider(
+    os.environ.get("VENUE_DICT_PATH", DEFAULT_VENUE_DICT_PATH),
+    poll_interval=float(os.environ.get("VENUE_DICT_POLL_INTERVAL", 60)),
+)
+_protected_terms: dict[str, list[str]] = None
+_published_index: PublishedIndex | None = None
 
 def load_venue_dict() -> dict[str, str] | None:
     """Venue名辞書をロードする。"""
-    global _venue_dict
-    if _venue_dict is None:
-        filename: str = "resources/venue_abbreviations.json"
+    return venue_provider.get()
+
+
+def venue_dict_version() -> str:
+    """Venue名辞書のバージョン（内容のハッシュ）を返す。辞書を使う結果のキャッシュのキーに含める。"""
+    return venue_provider.version
+
+
+def load_protected_terms() -> dict[str, list[str]]:
+    """タイトルで大文字・小文字を保護する用語の一覧をロードする。
+
+    返り値:
+        {"ignore_case": 大文字・小文字を区別せずに探す用語（BERT, ImageNet など）,
+         "case_sensitive": 普通の単語と同じ綴りのため、表記どおりのときだけ保護する用語（BLOOM, ROUGE など）}
+    """
+    global _protected_terms
+    if _protected_terms is None:
+        filename: str = "resources/protected_terms.json"
         try:
             with open(filename, "r") as f:
-                _venue_dict = json.load(f)
+                _protected_terms = json.load(f)
         except FileNotFoundError:
             logging.error("%s が見つかりません。", filename)
             raise
-    return _venue_dict
\ No newline at end of file
+    return _protected_terms
+
+
+def _file_version(path: str) -> str | None:
+    """PublishedIndex.version と同じ形式の、ファイルの現在の状態を返す。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{st.st_ino}:{st.st_mtime_ns}:{st.st_size}"
+
+
+def load_published_index() -> PublishedIndex | None:
+    """arXiv論文の出版版の索引を開く。環境変数 PUBLISHED_INDEX_PATH が設定されていなければ None を返す。"""
+    global _published_index
+    path = os.environ.get("PUBLISHED_INDEX_PATH")
+    if not path:
+        return None
+    if _published_index is None or _published_index.path != path or _published_index.version != _file_version(path):
+        # 索引が作り直されていたら開き直す
+        try:
+            _published_index = PublishedIndex(path)
+        except (OSError, ValueError):
+            logging.exception("出版版の索引 %s を開けません。", path)
+            return None
+    return _published_index
+
+
+def published_index_version() -> str:
+    """出版版の索引のバージョンを返す（索引を使わない場合は空文字列）。索引を使う結果のキャッシュのキーに含める。"""
+    published_index = load_published_index()
+    return published_index.version if published_index is not None else ""
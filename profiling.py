@@ -0,0 +1,92 @@
+# profiling.py
+"""
+リクエスト単位のオンデマンドなプロファイリング。
+
+次のいずれかで有効になる。無効な場合は何もしない（オーバーヘッドなし）。
+- 環境変数 BIB_BOT_PROFILE=1: すべてのリクエストを計測
+- 環境変数 BIB_BOT_PROFILE_RATE=0.01: リクエストの一部（この割合）を計測
+- メッセージの隠しオプション --profile
+
+結果は上位の関数をログに出力し、BIB_BOT_PROFILE_DIR が設定されていれば
+pstats 形式のファイルも書き出す。
+"""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+# ログに出力する関数の数
+TOP_N = 20
+
+# cProfile はプロセスで同時に1つしか有効にできない（Python 3.12 以降は sys.monitoring を使うため）。
+# 計測中に別のリクエストが来たら、そのリクエストは計測せずに処理する
+_profiler_lock = threading.Lock()
+
+
+def should_profile(requested: bool = False) -> bool:
+    """このリクエストをプロファイルするかどうかを判定する。"""
+    if requested or os.environ.get("BIB_BOT_PROFILE") == "1":
+        return True
+    rate = os.environ.get("BIB_BOT_PROFILE_RATE")
+    if not rate:
+        return False
+    try:
+        return random.random() < float(rate)
+    except ValueError:
+        logging.warning("BIB_BOT_PROFILE_RATE の値が不正です: %s", rate)
+        return False
+
+
+@contextmanager
+def profile(label: str, enabled: bool) -> Iterator[None]:
+    """enabled の場合のみ、with ブロック内を cProfile で計測する。"""
+    if not enabled:
+        yield
+        return
+
+    if not _profiler_lock.acquire(blocking=False):
+        logging.info("別のリクエストを計測中のため、計測しません (%s)", label)
+        yield
+        return
+
+    try:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # デバッガなど、他のツールが sys.monitoring を使っている
+            logging.warning("プロファイラを有効にできないため、計測しません (%s): %s", label, e)
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            _report(profiler, label, time.perf_counter() - started)
+    finally:
+        _profiler_lock.release()
+
+
+def _report(profiler: cProfile.Profile, label: str, elapsed: float) -> None:
+    """計測結果の上位関数をログに出力し、必要ならファイルに保存する。"""
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_N)
+    logging.info("プロファイル結果 (%s, %.3f秒):\n%s", label, elapsed, stream.getvalue())
+
+    profile_dir = os.environ.get("BIB_BOT_PROFILE_DIR")
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+        safe_label = re.sub(r"[^\w.-]", "_", label)
+        path = os.path.join(profile_dir, f"{safe_label}-{int(time.time() * 1000)}.prof")
+        stats.dump_stats(path)
+        logging.info("プロファイル結果を保存しました: %s", path)
@@ -0,0 +1,247 @@
+# server.py
+"""
+Lambda の代わりに常駐プロセスとして動かすための HTTP サーバー。
+
+署名検証・イベント振り分け・handle_message は lambda_function と共通。
+リクエストはすぐに 200 を返し、イベント処理は上限付きのキューとワーカースレッドで行う。
+
+    PORT=3000 WORKERS=4 QUEUE_SIZE=100 python server.py
+"""
+
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import lambda_function
+from venue_misses import venue_miss_recorder
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class Metrics:
+    """/metrics で公開するカウンタ"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests_total = 0
+        self.events_enqueued_total = 0
+        self.events_rejected_total = 0
+        self.events_processed_total = 0
+        self.events_failed_total = 0
+        self.event_seconds_sum = 0.0
+        self.busy_workers = 0
+
+    def increment(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def render(self, queue_depth: int, workers: int) -> str:
+        """Prometheus のテキスト形式で出力する。"""
+        with self._lock:
+            lines = [
+                f"bib_bot_requests_total {self.requests_total}",
+                f"bib_bot_events_enqueued_total {self.events_enqueued_total}",
+                f"bib_bot_events_rejected_total {self.events_rejected_total}",
+                f"bib_bot_events_processed_total {self.events_processed_total}",
+                f"bib_bot_events_failed_total {self.events_failed_total}",
+                f"bib_bot_event_seconds_sum {self.event_seconds_sum:.6f}",
+                f"bib_bot_event_seconds_count {self.events_processed_total + self.events_failed_total}",
+                f"bib_bot_queue_depth {queue_depth}",
+                f"bib_bot_workers_busy {self.busy_workers}",
+                f"bib_bot_workers {workers}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+class WorkerPool:
+    """上限付きキューと固定数のワーカースレッドでイベントを処理する。"""
+
+    def __init__(self, handler, workers: int = 4, queue_size: int = 100, metrics: Metrics | None = None):
+        """初期化
+
+        Args:
+            handler: イベントデータを受け取って処理する関数
+            workers: ワーカースレッド数
+            queue_size: キューに積めるイベント数の上限
+            metrics: 処理状況を記録する Metrics
+        """
+        self.handler = handler
+        self.workers = workers
+        self.metrics = metrics or Metrics()
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._threads: list[threading.Thread] = []
+        self._stopping = threading.Event()
+
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"bib-bot-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+
+    def defer(self, job) -> bool:
+        """受付制御で順番待ちになっていた処理（引数なしの関数）をキューに積む。満杯または停止中の場合は False を返す。"""
+        if self._stopping.is_set():
+            return False
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            return False
+        return True
+
+
+    def submit(self, event_data: dict) -> bool:
+        """イベントをキューに積む。満杯または停止中の場合は False を返す。"""
+        if self._stopping.is_set():
+            return False
+        try:
+            self._queue.put_nowait(event_data)
+        except queue.Full:
+            self.metrics.increment("events_rejected_total")
+            return False
+        self.metrics.increment("events_enqueued_total")
+        return True
+
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+
+    def shutdown(self, timeout: float | None = 30) -> None:
+        """新規受付を止め、キューに残ったイベントを処理し終えてからワーカーを停止する。"""
+        self._stopping.set()
+        for _ in self._threads:
+            self._queue.put(None)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            thread.join(remaining)
+
+
+    def _run(self) -> None:
+        while True:
+            event_data = self._queue.get()
+            if event_data is None:
+                return
+            self.metrics.increment("busy_workers")
+            started = time.monotonic()
+            try:
+                # 受付制御から積み直された処理はそのまま実行する
+                if callable(event_data):
+                    event_data()
+                else:
+                    self.handler(event_data)
+                self.metrics.increment("events_processed_total")
+            except Exception as e:
+                self.metrics.increment("events_failed_total")
+                logger.error(f"イベント処理でエラー: {e}", exc_info=True)
+            finally:
+                self.metrics.increment("event_seconds_sum", time.monotonic() - started)
+                self.metrics.increment("busy_workers", -1)
+
+
+def make_request_handler(pool: WorkerPool, events_path: str = "/slack/events"):
+    """WorkerPool にイベントを流す HTTP リクエストハンドラを作る。"""
+
+    class SlackRequestHandler(BaseHTTPRequestHandler):
+
+        def _send(self, status: int, body: str = "", content_type: str = "text/plain", headers: dict | None = None):
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/healthz":
+                if pool.stopping:
+                    self._send(503, "Shutting down")
+                else:
+                    self._send(200, "OK")
+            elif self.path == "/metrics":
+                self._send(200, pool.metrics.render(pool.queue_depth, pool.workers), content_type="text/plain; version=0.0.4")
+            else:
+                self._send(404, "Not Found")
+
+        def do_POST(self):
+            if self.path != events_path:
+                self._send(404, "Not Found")
+                return
+            pool.metrics.increment("requests_total")
+
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_SIZE:
+                self._send(413, "Payload Too Large")
+                return
+            body = self.rfile.read(length).decode("utf-8")
+            headers = {k.lower(): v for k, v in self.headers.items()}
+
+            response, event_data = lambda_function.parse_slack_request(headers, body)
+            if response is None:
+                # Slack には3秒以内に応答する必要があるため、処理はワーカーに任せる
+                if pool.submit(event_data):
+                    response = {"statusCode": 200, "body": "OK"}
+                else:
+                    response = {"statusCode": 503, "headers": {"Retry-After": "1"}, "body": "Service Unavailable"}
+
+            response_headers = dict(response.get("headers") or {})
+            content_type = response_headers.pop("Content-Type", "text/plain")
+            self._send(response["statusCode"], response.get("body") or "", content_type=content_type, headers=response_headers)
+
+        def log_message(self, format, *args):
+            logger.debug("%s - %s", self.address_string(), format % args)
+
+    return SlackRequestHandler
+
+
+def serve(host: str = "0.0.0.0", port: int = 3000, workers: int = 4, queue_size: int = 100) -> None:
+    """サーバーを起動し、SIGTERM / SIGINT でグレースフルに停止する。"""
+    pool = WorkerPool(lambda_function.process_event, workers=workers, queue_size=queue_size)
+    pool.start()
+    # 予算を超えたメッセージはワーカーを塞がずに順番待ちさせ、順番が来たらキューに積み直す
+    lambda_function.admission.dispatch = pool.defer
+    httpd = ThreadingHTTPServer((host, port), make_request_handler(pool))
+
+    def stop(signum, frame):
+        logger.info("シグナル %s を受信。停止処理を開始します。", signum)
+        # serve_forever と同じスレッドから shutdown を呼ぶとデッドロックするため別スレッドで呼ぶ
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info("bib_bot サーバーを起動しました: %s:%d (workers=%d, queue=%d)", host, port, workers, queue_size)
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+        pool.shutdown()
+        # 最後の間隔で数えた、辞書に見つからなかった名前を書き出す
+        venue_miss_recorder.flush()
+        logger.info("bib_bot サーバーを停止しました。")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    serve(
+        host=os.environ.get("HOST", "0.0.0.0"),
+        port=int(os.environ.get("PORT", "3000")),
+        workers=int(os.environ.get("WORKERS", "4")),
+        queue_size=int(os.environ.get("QUEUE_SIZE", "100")),
+    )
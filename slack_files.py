@@ -0,0 +1,93 @@
+# slack_files.py
+
+import logging
+import os
+import urllib.parse
+import urllib.request
+from typing import BinaryIO
+
+# ダウンロードを許可する .bib ファイルの最大サイズ（バイト）
+MAX_FILE_SIZE = 20 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+# Bot トークンを送ってよいファイル配信元
+SLACK_FILE_HOSTS = ("files.slack.com",)
+
+
+def find_bib_files(event: dict) -> list[dict]:
+    """イベントに添付された .bib ファイルのメタデータを返す。"""
+    files = event.get("files") or []
+    return [
+        file_info for file_info in files
+        if (file_info.get("name") or "").lower().endswith(".bib") or file_info.get("filetype") == "bib"
+    ]
+
+
+def download_file(
+    file_info: dict,
+    token: str,
+    dest: BinaryIO,
+    max_size: int = MAX_FILE_SIZE,
+    allowed_hosts: tuple[str, ...] | None = None,
+    timeout: float = 30,
+) -> int:
+    """Slack のファイルをチャンク単位でストリーミングして dest に書き込む。
+
+    Args:
+        file_info: イベントの files に含まれるファイルのメタデータ
+        token: ダウンロードに使う Bot トークン
+        dest: 書き込み先のバイナリファイル
+        max_size: 許可する最大サイズ（バイト）
+        allowed_hosts: ダウンロードを許可するホスト名（None の場合は SLACK_FILE_HOSTS）
+        timeout: 接続のタイムアウト秒数
+    返り値:
+        書き込んだバイト数
+    """
+    name = file_info.get("name", "")
+    url = file_info.get("url_private_download") or file_info.get("url_private")
+    if not url:
+        raise ValueError(f"ファイル {name} のダウンロードURLが見つかりませんでした🤔")
+
+    host = urllib.parse.urlsplit(url).hostname
+    if host not in (allowed_hosts or SLACK_FILE_HOSTS):
+        raise ValueError(f"ファイル {name} の配信元 {host} は許可されていません🙅")
+
+    if (file_info.get("size") or 0) > max_size:
+        raise ValueError(f"ファイル {name} が大きすぎます（上限 {max_size // (1024 * 1024)}MB）😵")
+
+    request = urllib.request.Request(url, headers={"Authorization": f"Bearer {token}"})
+    total = 0
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        # トークンが無効な場合はログインページ（HTML）にリダイレクトされる
+        if response.headers.get_content_type() == "text/html":
+            raise ValueError(f"ファイル {name} をダウンロードできませんでした（files:read 権限を確認してください）😢")
+
+        while chunk := response.read(CHUNK_SIZE):
+            total += len(chunk)
+            if total > max_size:
+                raise ValueError(f"ファイル {name} が大きすぎます（上限 {max_size // (1024 * 1024)}MB）😵")
+            dest.write(chunk)
+
+    logging.info("ファイルをダウンロードしました: %s (%d bytes)", name, total)
+    return total
+
+
+def formatted_filename(name: str) -> str:
+    """整形結果のファイル名を返す（例: refs.bib -> refs_formatted.bib）。
+
+    name は Slack のメタデータの値なので、ディレクトリの部分は取り除く（アップロードするときの名前にだけ使う）。
+    """
+    name = os.path.basename(name.replace("\\", "/"))
+    stem = name[:-len(".bib")] if name.lower().endswith(".bib") else name
+    return f"{stem or 'result'}_formatted.bib"
+
+
+def upload_result_file(client, channel: str, path: str, filename: str, thread_ts: str | None = None) -> None:
+    """整形結果のファイルを files_upload_v2 でアップロードする。"""
+    kwargs = {"thread_ts": thread_ts} if thread_ts else {}
+    client.files_upload_v2(
+        channel=channel,
+        file=path,
+        filename=filename,
+        title=filename,
+        **kwargs,
+    )
@@ -1,13 +1,123 @@
 # slack_handler.py
 
 import logging
-from bibtex.simplify import simplify_bibtex_entry
+import os
+import tempfile
+import threading
+from slack_files import find_bib_files, download_file, formatted_filename, upload_result_file
+from slack_reply import ReplyHistory
+from profiling import profile, should_profile
+from deadline import DeadlineExceeded
 import re
 
+README_URL = "https://github.com/Naiseki/gw_2025_b3_2_1/blob/main/README.md"
+
+# BibTeX のブロックも .bib ファイルもないメッセージへの返信
+USAGE_HINT = f"有効なBibTeXエントリが見つかりませんでした🤔\n使い方の詳細は {README_URL} をご覧下さい"
+
+# "@article{" や "@misc (" のような、BibTeX のブロックの始まり
+_BIBTEX_BLOCK = re.compile(r"@\s*[A-Za-z]+\s*[{(]")
+
+# 使い方に載せている、略称の長さ以外のオプション
+OPTION_PATTERNS = {
+    "key": r"(^|\s)(-k|--key)(\s|$)",
+}
+
+# 使い方には載せない（開発者向けの）オプション
+HIDDEN_OPTION_PATTERNS = {
+    "profile": r"(^|\s)(--profile)(\s|$)",
+}
+
+# エントリ単位の整形結果（メッセージが編集されたとき、変わっていないエントリは整形し直さない）
+# 整形に使うモジュールは重いため、BibTeX を含むメッセージを初めて受け取ったときに _load_formatter で読み込む
+format_cache = None
+
+# 元のメッセージごとの整形結果の返信（メッセージが編集されたとき、返信をその場で書き換える）
+reply_history = ReplyHistory()
+
+# DOI・arXiv ID からの書誌情報の補完（BIB_BOT_ENRICH=1 の場合のみ）
+enricher = None
+
+_formatter_lock = threading.Lock()
+
+# トークンごとのボットのユーザーID（auth_test はトークンごとに1回だけ呼ぶ）
+_bot_user_ids = {}
+
+
+def looks_like_bibtex(text):
+    """BibTeX のブロックの始まり（@type{）を含むかどうかを、パースせずに判定する。"""
+    return _BIBTEX_BLOCK.search(text) is not None
+
+
+def _load_formatter():
+    """整形に使うモジュールを読み込み、キャッシュと補完の設定を初回だけ作る。"""
+    global format_cache, enricher
+    if format_cache is not None:
+        return
+    with _formatter_lock:
+        if format_cache is None:
+            from bibtex.enrich import create_enricher
+            from bibtex.simplify import FormatCache
+            enricher = create_enricher()
+            format_cache = FormatCache()
+
+
+def _bot_user_id(client):
+    token = getattr(client, "token", None)
+    user_id = _bot_user_ids.get(token)
+    if user_id is None:
+        user_id = _bot_user_ids[token] = client.auth_test()["user_id"]
+    return user_id
+
+
+def extract_edited_message(event):
+    """message_changed イベントから編集後のメッセージを取り出す。
+
+    ボット自身のメッセージ、本文が変わっていない編集（URL の展開など）、
+    ファイル付きのメッセージの編集の場合は None を返す。
+    """
+    message = event.get("message") or {}
+    previous = event.get("previous_message") or {}
+    if message.get("bot_id") or message.get("subtype") == "bot_message":
+        return None
+    if message.get("files"):
+        return None
+    if message.get("text") == previous.get("text"):
+        return None
+
+    edited = dict(message)
+    edited["channel"] = event.get("channel")
+    edited.setdefault("channel_type", event.get("channel_type"))
+    return edited
+
+
 def parse_options_and_extract_bib(text):
     """オプションを解析し、raw_bibを構築する。"""
+    abbreviation_mode, _, raw_bib = parse_options(text)
+    return abbreviation_mode, raw_bib
+
+
+def _strip_code_fences(text: str) -> str:
+    """```...``` のバッククォートを削除する（閉じていない ``` が多くても入力を1回読むだけで済むよう、正規表現を使わない）。"""
+    parts = []
+    position = 0
+    while True:
+        start = text.find("```", position)
+        # 中身は1文字以上
+        end = text.find("```", start + 4) if start != -1 else -1
+        if end == -1:
+            break
+        parts.append(text[position:start])
+        parts.append(text[start + 3:end])
+        position = end + 3
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+def parse_options(text):
+    """オプションを解析し、(abbreviation_mode, その他のオプション（隠しオプションを含む）の集合, raw_bib) を返す。"""
     # コードブロックのバッククォートを削除
-    text = re.sub(r"```(.+?)```", r"\1", text, flags=re.DOTALL)
+    text = _strip_code_fences(text)
 
     before_at, at_and_after = "", ""
     if "@" in text:
@@ -35,18 +145,31 @@ def parse_options_and_extract_bib(text):
     else:
         abbreviation_mode = "both"
     
+    # その他のオプション（-k や、隠しオプションの --profile など）
+    other_patterns = {**OPTION_PATTERNS, **HIDDEN_OPTION_PATTERNS}
+    flags = {name for name, pattern in other_patterns.items() if re.search(pattern, before_at)}
+
     # オプションを filtered_before_at から削除
     cleaned_before_at = re.sub(short_pattern, r"\1\3", before_at)
     cleaned_before_at = re.sub(long_pattern, r"\1\3", cleaned_before_at)
+    for pattern in other_patterns.values():
+        cleaned_before_at = re.sub(pattern, r"\1\3", cleaned_before_at)
 
     # raw_bibを構築 (掃除した before_at を結合)
     raw_bib = (cleaned_before_at + at_and_after).strip()
     
-    return abbreviation_mode, raw_bib
+    return abbreviation_mode, flags, raw_bib
 
 
-def handle_message(event, say, client):
-    """DM またはメンションされたメッセージを BibTeX 変換。"""
+def handle_message(event, say, client, result_stream=None, deadline=None):
+    """DM またはメンションされたメッセージを BibTeX 変換。
+
+    result_stream が与えられた場合は、整形できたエントリから順に
+    result_stream.append() で送り、最後に result_stream.close() を呼ぶ。
+    同じメッセージ（編集後のメッセージ）に以前返信していれば、その返信を書き換える。
+    .bib ファイルが添付されている場合は、ファイルを整形してファイルで返す。
+    deadline（deadline.Deadline）が与えられた場合、間に合わなくなったら整形できた分だけ返し、未処理のエントリを知らせる。
+    """
 
     # ボットのメッセージは無視
     if event.get("subtype") == "bot_message":
@@ -59,8 +182,12 @@ def handle_message(event, say, client):
     if not user or not channel:
         return
 
-    bot_user_id = client.auth_test()["user_id"]
     is_dm = channel.startswith("D")
+    # チャンネルではメンションを含まないメッセージを auth_test も呼ばずに無視する
+    if not is_dm and "<@" not in text:
+        return
+
+    bot_user_id = _bot_user_id(client)
     is_mentioned = f"<@{bot_user_id}>" in text
 
     if not (is_dm or is_mentioned):
@@ -70,12 +197,131 @@ def handle_message(event, say, client):
     if is_mentioned:
         text = re.sub(rf"<@{bot_user_id}>", "", text).strip()
 
+    # BibTeX のブロックも .bib ファイルもないメッセージ（「ありがとう」など）は、パースせずに使い方を返す
+    bib_files = find_bib_files(event)
+    if not bib_files and not looks_like_bibtex(text):
+        say(USAGE_HINT)
+        return
+
+    _load_formatter()
+
     # オプション解析とbib抽出
-    abbreviation_mode, bib = parse_options_and_extract_bib(text)
+    abbreviation_mode, flags, bib = parse_options(text)
+    profiling_enabled = should_profile("profile" in flags)
+
+    # 添付された .bib ファイルはファイルで返す
+    if bib_files:
+        thread_ts = None if is_dm else event.get("ts")
+        for file_info in bib_files:
+            try:
+                with profile(f"file-{user}", profiling_enabled):
+                    handle_bib_file(
+                        file_info, abbreviation_mode, say, client, channel, thread_ts,
+                        regenerate_keys="key" in flags, deadline=deadline,
+                    )
+            except ValueError as e:
+                say(f"{e.__class__.__name__} {str(e)}")
+                logging.warning("BibTeX ファイルの整形に失敗しました: %s", str(e))
+        return
 
     try:
-        simplified = simplify_bibtex_entry(bib, abbreviation_mode=abbreviation_mode, warning_callback=say)
-        say(f"```{simplified}```")
+        with profile(f"message-{user}", profiling_enabled):
+            _format_message(
+                bib, abbreviation_mode, say, result_stream, source=(channel, event.get("ts")),
+                regenerate_keys="key" in flags, deadline=deadline,
+            )
     except ValueError as e:
         say(f"{e.__class__.__name__} {str(e)}")
-        logging.warning("BibTeX 整形に失敗しました: %s", str(e))
\ No newline at end of file
+        logging.warning("BibTeX 整形に失敗しました: %s", str(e))
+
+
+def _format_message(bib, abbreviation_mode, say, result_stream=None, source=None, regenerate_keys=False, deadline=None):
+    """メッセージ本文の BibTeX を整形して返信する。
+
+    source は元のメッセージの (チャンネルID, ts)。以前の返信の書き換えに使う。
+    regenerate_keys が True の場合、エントリのキーを作り直す。
+    deadline に間に合わなくなったら、整形できた分を返信してから未処理のエントリを知らせる。
+    """
+    from bibtex.keygen import KeyGenerator
+    from bibtex.simplify import iter_simplified_bibtex_entries
+
+    entries = iter_simplified_bibtex_entries(
+        bib, abbreviation_mode=abbreviation_mode, warning_callback=say, cache=format_cache, enricher=enricher,
+        key_generator=KeyGenerator() if regenerate_keys else None, deadline=deadline,
+    )
+    if result_stream is None:
+        results = []
+        try:
+            for simplified in entries:
+                results.append(simplified)
+        except DeadlineExceeded as e:
+            if results:
+                say(f"```{''.join(results)}```")
+            say(str(e))
+            logging.warning("期限までに整形し終えられませんでした（未処理 %d 件）", len(e.pending))
+            return
+        say(f"```{''.join(results)}```")
+        return
+
+    channel, ts = source if source and source[1] else (None, None)
+    if ts:
+        previous_ts = reply_history.get(channel, ts)
+        if previous_ts:
+            result_stream.replace(previous_ts)
+    try:
+        for simplified in entries:
+            result_stream.append(simplified)
+    except DeadlineExceeded as e:
+        say(str(e))
+        logging.warning("期限までに整形し終えられませんでした（未処理 %d 件）", len(e.pending))
+    finally:
+        result_stream.close()
+        if ts:
+            reply_history.record(channel, ts, result_stream.posted_ts)
+
+
+def handle_bib_file(
+    file_info, abbreviation_mode, say, client, channel, thread_ts=None, regenerate_keys=False, deadline=None
+):
+    """添付された .bib ファイルを整形し、整形結果をファイルとしてアップロードする。
+
+    ダウンロードと書き出しは一時ファイル経由で行い、入力は mmap したまま分割するため、
+    巨大なファイルでも入力と出力の文字列をメモリに持たないようにする。
+    deadline に間に合わなくなったら、整形できたエントリまでのファイルをアップロードし、未処理のエントリを知らせる。
+    """
+    from bibtex.keygen import KeyGenerator
+    from bibtex.simplify import iter_simplified_bibtex_entries
+    from bibtex.splitter import open_mapped
+
+    name = file_info.get("name") or "result.bib"
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source_path = os.path.join(tmpdir, "source.bib")
+        with open(source_path, "wb") as f:
+            download_file(file_info, client.token, f)
+
+        # 読み込まずに mmap したまま分割する（整形し終えるまで閉じない）
+        raw_bib = open_mapped(source_path)
+        # ファイル名は Slack から来た値なので、ローカルのパスには使わない
+        output_name = formatted_filename(name)
+        output_path = os.path.join(tmpdir, "result.bib")
+        try:
+            with open(output_path, "w", encoding="utf-8") as f:
+                entries = iter_simplified_bibtex_entries(
+                    raw_bib, abbreviation_mode=abbreviation_mode, warning_callback=say, enricher=enricher,
+                    key_generator=KeyGenerator() if regenerate_keys else None, deadline=deadline,
+                )
+                try:
+                    for simplified in entries:
+                        f.write(simplified)
+                except DeadlineExceeded as e:
+                    pending = e
+                else:
+                    pending = None
+        finally:
+            if hasattr(raw_bib, "close"):
+                raw_bib.close()
+
+        upload_result_file(client, channel, output_path, output_name, thread_ts=thread_ts)
+        if pending is not None:
+            say(str(pending))
+            logging.warning("期限までにファイルを整形し終えられませんでした（未処理 %d 件）", len(pending.pending))
@@ -0,0 +1,364 @@
+# slack_reply.py
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from slack_sdk.errors import SlackApiError
+
+# Slack の1メッセージに載せる整形結果の最大文字数（本文上限 40,000 文字に対し余裕を持たせる）
+MAX_MESSAGE_LENGTH = 3500
+CODE_FENCE = "```"
+
+
+def _ts_key(ts: str) -> tuple[int, ...]:
+    """Slack の ts ("1700000000.000100") を比較可能なタプルに変換する。"""
+    return tuple(int(part) for part in ts.split("."))
+
+
+def _retry_delay(error: Exception, attempt: int, retry_interval: float) -> float:
+    """リトライまでの待ち時間を返す。レート制限時は Retry-After を尊重する。"""
+    delay = retry_interval * (2 ** attempt)
+    if isinstance(error, SlackApiError) and error.response is not None:
+        retry_after = error.response.headers.get("Retry-After")
+        if retry_after:
+            delay = max(delay, float(retry_after))
+    return delay
+
+
+def _split_segments(text: str) -> list[str]:
+    """整形結果をエントリ単位のセグメントに分割する。
+
+    `@` で始まる行をエントリの開始とみなし、直前に連続する `%` コメント行は
+    そのエントリに含める。
+    """
+    lines = text.split("\n")
+    boundaries = [0]
+    for i, line in enumerate(lines):
+        if i == 0 or not line.startswith("@"):
+            continue
+        start = i
+        while start > boundaries[-1] and lines[start - 1].startswith("%"):
+            start -= 1
+        if start > boundaries[-1]:
+            boundaries.append(start)
+    boundaries.append(len(lines))
+    return ["\n".join(lines[s:e]) for s, e in zip(boundaries, boundaries[1:])]
+
+
+def _hard_split(segment: str, max_length: int) -> list[str]:
+    """上限を超える1セグメントを行単位（必要なら文字単位）で分割する。"""
+    pieces = []
+    current = ""
+    for line in segment.split("\n"):
+        while len(line) > max_length:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:max_length])
+            line = line[max_length:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > max_length:
+            pieces.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_result_chunks(text: str, max_length: int = MAX_MESSAGE_LENGTH) -> list[str]:
+    """整形結果をエントリの境界で max_length 以下のチャンクに分割する。"""
+    if len(text) <= max_length:
+        return [text]
+
+    chunks = []
+    current = ""
+    for segment in _split_segments(text):
+        if len(segment) > max_length:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.extend(_hard_split(segment, max_length))
+            continue
+        candidate = f"{current}\n{segment}" if current else segment
+        if len(candidate) > max_length:
+            chunks.append(current)
+            current = segment
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class AsyncReplier:
+    """Slack への返信を受け付け、asyncio で並行に送信する。
+
+    `say` 互換の呼び出し (`replier(text)`) でメッセージを溜めておき、
+    `flush()` で整形結果と警告をまとめて送信する。
+    - 警告・エラーは1つのメッセージに集約する
+    - 長い整形結果はエントリ境界で分割し、並行に送信した上でスレッド内の順序を保つ
+    - 送信失敗はメッセージごとに個別にリトライする
+    """
+
+    def __init__(
+        self,
+        client,
+        channel: str,
+        thread_ts: str | None = None,
+        max_retries: int = 3,
+        retry_interval: float = 1.0,
+        max_length: int = MAX_MESSAGE_LENGTH,
+    ):
+        """初期化
+
+        Args:
+            client: chat_postMessage / chat_update を持つ Slack クライアント
+            channel: 送信先チャンネルID
+            thread_ts: スレッド返信する場合の親メッセージの ts
+            max_retries: 1メッセージあたりの最大リトライ回数
+            retry_interval: リトライ間隔の基準秒数（指数バックオフ）
+            max_length: 1メッセージに載せる整形結果の最大文字数
+        """
+        self.client = client
+        self.channel = channel
+        self.thread_ts = thread_ts
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.max_length = max_length
+        self._warnings: list[str] = []
+        self._results: list[str] = []
+        self._extra: list[tuple[str, dict[str, Any]]] = []
+
+
+    def __call__(self, text: str, **kwargs) -> None:
+        """say 互換のインターフェース。送信はせずに溜めておく。"""
+        if kwargs:
+            # 個別の指定があるメッセージは集約せずにそのまま送る
+            self._extra.append((text, kwargs))
+        elif len(text) >= 2 * len(CODE_FENCE) and text.startswith(CODE_FENCE) and text.endswith(CODE_FENCE):
+            self._results.append(text[len(CODE_FENCE):-len(CODE_FENCE)])
+        else:
+            self._warnings.append(text)
+
+
+    def flush(self) -> None:
+        """溜めたメッセージを並行に送信する。"""
+        if not (self._warnings or self._results or self._extra):
+            return
+        asyncio.run(self._flush())
+
+
+    async def _flush(self) -> None:
+        warnings, results, extra = self._warnings, self._results, self._extra
+        self._warnings, self._results, self._extra = [], [], []
+
+        tasks = []
+        if warnings:
+            tasks.append(self._post_ordered(split_result_chunks("\n\n".join(warnings), self.max_length)))
+        for result in results:
+            chunks = split_result_chunks(result, self.max_length)
+            tasks.append(self._post_ordered([f"{CODE_FENCE}{chunk}{CODE_FENCE}" for chunk in chunks]))
+        for text, kwargs in extra:
+            tasks.append(self._post(text, **kwargs))
+        await asyncio.gather(*tasks)
+
+
+    async def _call(self, method: str, **kwargs) -> dict | None:
+        """Slack API をスレッドで呼び出し、失敗したら個別にリトライする。"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await asyncio.to_thread(getattr(self.client, method), **kwargs)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logging.error("%s の送信に失敗しました: %s", method, e, exc_info=True)
+                    return None
+                delay = _retry_delay(e, attempt, self.retry_interval)
+                logging.warning("%s の送信に失敗したためリトライします (%d回目): %s", method, attempt + 1, e)
+                await asyncio.sleep(delay)
+        return None
+
+
+    async def _post(self, text: str, **kwargs) -> str | None:
+        """1メッセージを送信し、ts を返す。"""
+        if self.thread_ts and "thread_ts" not in kwargs:
+            kwargs["thread_ts"] = self.thread_ts
+        response = await self._call("chat_postMessage", channel=self.channel, text=text, **kwargs)
+        if response is None:
+            return None
+        return response.get("ts")
+
+
+    async def _post_ordered(self, texts: list[str]) -> None:
+        """複数メッセージを並行に送信し、到着順が入れ替わった場合は本文を差し替えて順序を揃える。"""
+        if len(texts) == 1:
+            await self._post(texts[0])
+            return
+
+        ts_list = await asyncio.gather(*(self._post(text) for text in texts))
+        posted = [(ts, text) for ts, text in zip(ts_list, texts) if ts]
+        ordered_ts = sorted((ts for ts, _ in posted), key=_ts_key)
+
+        updates = []
+        for ts, (original_ts, text) in zip(ordered_ts, posted):
+            if ts != original_ts:
+                updates.append(self._call("chat_update", channel=self.channel, ts=ts, text=text))
+        if updates:
+            await asyncio.gather(*updates)
+
+
+class ProgressiveReply:
+    """整形結果をエントリ単位で逐次 Slack に送信する。
+
+    最初のエントリが整形できた時点でメッセージを投稿し、以降は chat_update で
+    同じメッセージに追記していく。上限を超える場合はエントリ境界で新しいメッセージに切り替える。
+    replace() で既存のメッセージを指定すると、新しく投稿する代わりにそれらを書き換える。
+    """
+
+    def __init__(
+        self,
+        client,
+        channel: str,
+        thread_ts: str | None = None,
+        max_length: int = MAX_MESSAGE_LENGTH,
+        update_interval: float = 1.0,
+        max_retries: int = 3,
+        retry_interval: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """初期化
+
+        Args:
+            client: chat_postMessage / chat_update を持つ Slack クライアント
+            channel: 送信先チャンネルID
+            thread_ts: スレッド返信する場合の親メッセージの ts
+            max_length: 1メッセージに載せる整形結果の最大文字数
+            update_interval: chat_update を呼ぶ最短間隔（秒）
+            max_retries: 1回の送信あたりの最大リトライ回数
+            retry_interval: リトライ間隔の基準秒数（指数バックオフ）
+            clock: 経過時間の計測に使う関数
+        """
+        self.client = client
+        self.channel = channel
+        self.thread_ts = thread_ts
+        self.max_length = max_length
+        self.update_interval = update_interval
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.clock = clock
+        self.posted_ts: list[str] = []
+        self._reusable_ts: list[str] = []
+        self._text = ""
+        self._ts: str | None = None
+        self._dirty = False
+        self._last_update = 0.0
+
+
+    def replace(self, ts_list: list[str]) -> None:
+        """以前に送信したメッセージを先頭から順に書き換えて使う。余ったものは close() で削除する。"""
+        self._reusable_ts = list(ts_list)
+
+
+    def append(self, text: str) -> None:
+        """整形済みのエントリを追加する。"""
+        if not text:
+            return
+        for piece in split_result_chunks(text, self.max_length):
+            if self._text and len(self._text) + len(piece) > self.max_length:
+                # 現在のメッセージを確定し、新しいメッセージに切り替える
+                self._update()
+                self._text, self._ts = "", None
+            if not self._text:
+                piece = piece.lstrip("\n")
+            self._text += piece
+            self._dirty = True
+
+            if self._ts is None:
+                self._post()
+            elif self.clock() - self._last_update >= self.update_interval:
+                self._update()
+
+
+    def close(self) -> None:
+        """未反映の追記を送信し、書き換えに使わなかった以前のメッセージを削除する。"""
+        self._update()
+        for ts in self._reusable_ts:
+            self._call("chat_delete", channel=self.channel, ts=ts)
+        self._reusable_ts = []
+
+
+    def _call(self, method: str, **kwargs) -> dict | None:
+        """Slack API を呼び出し、失敗したらリトライする。"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return getattr(self.client, method)(**kwargs)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logging.error("%s の送信に失敗しました: %s", method, e, exc_info=True)
+                    return None
+                logging.warning("%s の送信に失敗したためリトライします (%d回目): %s", method, attempt + 1, e)
+                time.sleep(_retry_delay(e, attempt, self.retry_interval))
+        return None
+
+
+    def _post(self) -> None:
+        if self._reusable_ts:
+            # 以前のメッセージが残っていれば、新しく投稿せずに書き換える
+            self._ts = self._reusable_ts.pop(0)
+            self.posted_ts.append(self._ts)
+            self._dirty = True
+            self._update()
+            return
+        kwargs = {"thread_ts": self.thread_ts} if self.thread_ts else {}
+        response = self._call("chat_postMessage", channel=self.channel, text=f"{CODE_FENCE}{self._text}{CODE_FENCE}", **kwargs)
+        self._last_update = self.clock()
+        if response is None:
+            return
+        self._ts = response.get("ts")
+        self._dirty = False
+        if self._ts:
+            self.posted_ts.append(self._ts)
+
+
+    def _update(self) -> None:
+        if not self._dirty:
+            return
+        if self._ts is None:
+            self._post()
+            return
+        self._call("chat_update", channel=self.channel, ts=self._ts, text=f"{CODE_FENCE}{self._text}{CODE_FENCE}")
+        self._last_update = self.clock()
+        self._dirty = False
+
+
+class ReplyHistory:
+    """元のメッセージ（チャンネルと ts）ごとに、整形結果を送信したメッセージの ts を覚えておく。
+
+    メッセージが編集されたときに、返信を新しく投稿せずに書き換えるために使う。
+    件数の上限を超えたら古いものから捨てる。
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._records: OrderedDict[tuple[str, str], list[str]] = OrderedDict()
+
+
+    def get(self, channel: str, ts: str) -> list[str]:
+        with self._lock:
+            return list(self._records.get((channel, ts), []))
+
+
+    def record(self, channel: str, ts: str, reply_ts: list[str]) -> None:
+        with self._lock:
+            self._records.pop((channel, ts), None)
+            if not reply_ts:
+                return
+            self._records[(channel, ts)] = list(reply_ts)
+            while len(self._records) > self.max_entries:
+                self._records.popitem(last=False)
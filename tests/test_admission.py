@@ -0,0 +1,143 @@
+import threading
+import time
+
+import pytest
+
+from admission import PRUNE_INTERVAL, AdmissionController, AdmissionRejected, TokenBucket, estimate_cost
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=1, capacity=2, now=0)
+    assert bucket.wait_time(0, 1) == 0
+    bucket.consume(0, 2)
+    assert bucket.wait_time(0, 1) == pytest.approx(1)
+    assert bucket.wait_time(0.5, 1) == pytest.approx(0.5)
+    # 上限を超えるコストは上限として扱う
+    assert bucket.wait_time(10, 100) == 0
+
+
+def test_estimate_cost():
+    assert estimate_cost("") == 1
+    assert estimate_cost("x" * 25000) == 3
+
+
+def test_runs_immediately_within_budget():
+    controller = AdmissionController(user_burst=3, channel_burst=3)
+    executed = []
+    queued = []
+    for i in range(3):
+        controller.run("U1", "C1", lambda i=i: executed.append(i), on_queued=queued.append)
+    assert executed == [0, 1, 2]
+    assert queued == []
+
+
+def test_over_budget_is_rejected_without_dispatch():
+    # Lambda では待たずにすぐ拒否する
+    controller = AdmissionController(user_rate=0.001, user_burst=1)
+    controller.run("U1", "C1", lambda: None)
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected):
+        controller.run("U1", "C1", lambda: None)
+    assert time.monotonic() - started < 0.5
+    assert controller._queued == 0
+
+
+class Dispatcher:
+    """順番が来た処理をその場で実行し、実行した数を数える"""
+
+    def __init__(self, accept=True):
+        self.accept = accept
+        self.count = 0
+        self.done = threading.Condition()
+
+    def __call__(self, job):
+        if not self.accept:
+            return False
+        job()
+        with self.done:
+            self.count += 1
+            self.done.notify_all()
+        return True
+
+    def wait_for(self, count, timeout=5):
+        with self.done:
+            return self.done.wait_for(lambda: self.count >= count, timeout)
+
+
+def test_over_budget_is_queued_in_fair_order():
+    # チャンネルの予算を全員で共有し、1件ずつしか通らないようにする
+    dispatcher = Dispatcher()
+    controller = AdmissionController(user_rate=100, user_burst=100, channel_rate=5, channel_burst=1, dispatch=dispatcher)
+    executed = []
+    positions = {}
+    assert controller.run("A", "C1", lambda: executed.append("A1"))
+
+    # 呼び出し元は待たずに戻る
+    for user, name in [("A", "A2"), ("A", "A3"), ("B", "B1")]:
+        queued = controller.run(
+            user, "C1", lambda name=name: executed.append(name), on_queued=lambda position, name=name: positions.__setitem__(name, position)
+        )
+        assert not queued
+    assert executed == ["A1"]
+
+    assert dispatcher.wait_for(3)
+    # B は A の後ろに並んだが、ユーザー間のラウンドロビンで A3 より先に実行される
+    assert positions == {"A2": 1, "A3": 2, "B1": 2}
+    assert executed == ["A1", "A2", "B1", "A3"]
+    assert controller._queued == 0
+
+
+def test_queue_full_is_rejected():
+    controller = AdmissionController(user_rate=0.001, user_burst=1, max_queue=0, dispatch=Dispatcher())
+    controller.run("U1", "C1", lambda: None)
+    with pytest.raises(AdmissionRejected):
+        controller.run("U1", "C1", lambda: None)
+
+
+def test_wait_timeout_is_rejected():
+    rejected = threading.Event()
+    controller = AdmissionController(user_rate=0.001, user_burst=1, max_wait=0.05, dispatch=Dispatcher())
+    executed = []
+    controller.run("U1", "C1", lambda: executed.append(1))
+    assert not controller.run("U1", "C1", lambda: executed.append(2), on_rejected=lambda e: rejected.set())
+    assert rejected.wait(5)
+    assert executed == [1]
+    # タイムアウトした処理はキューから取り除かれる
+    assert controller._queued == 0
+
+
+def test_dispatch_failure_is_rejected():
+    errors = []
+    rejected = threading.Event()
+    controller = AdmissionController(user_rate=20, user_burst=1, dispatch=Dispatcher(accept=False))
+    controller.run("U1", "C1", lambda: None)
+    controller.run("U1", "C1", lambda: None, on_rejected=lambda e: (errors.append(e), rejected.set()))
+    assert rejected.wait(5)
+    assert isinstance(errors[0], AdmissionRejected)
+
+
+def test_idle_buckets_are_pruned():
+    now = [0.0]
+    controller = AdmissionController(user_rate=1, user_burst=2, channel_rate=1, channel_burst=2, clock=lambda: now[0])
+    for i in range(100):
+        controller.run(f"U{i}", f"C{i}", lambda: None)
+    controller.run("U0", "C0", lambda: None)
+    assert len(controller._user_buckets) == 100
+
+    # トークンが上限まで戻ったバケットは、次の受付のときに捨てる
+    now[0] = PRUNE_INTERVAL + 1
+    controller.run("U0", "C0", lambda: None)
+    assert list(controller._user_buckets) == ["U0"]
+    assert list(controller._channel_buckets) == ["C0"]
+
+
+def test_buckets_with_queued_tickets_are_kept():
+    now = [0.0]
+    controller = AdmissionController(user_rate=0.001, user_burst=1, channel_rate=100, channel_burst=100, clock=lambda: now[0], dispatch=lambda job: True)
+    controller.run("U1", "C1", lambda: None)
+    assert not controller.run("U1", "C1", lambda: None)
+    now[0] = PRUNE_INTERVAL + 1
+    controller.run("U2", "C1", lambda: None)
+    assert "U1" in controller._user_buckets
+    assert "C1" in controller._channel_buckets
+    controller._timer.cancel()
@@ -0,0 +1,18 @@
+from bibtex.aho_corasick import AhoCorasick
+
+
+def test_iter_matches_finds_overlapping_patterns():
+    matcher = AhoCorasick([("he", "he"), ("she", "she"), ("his", "his"), ("hers", "hers")])
+    matches = sorted(matcher.iter_matches("ushers"))
+    assert matches == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+
+
+def test_iter_matches_ignore_case_returns_value():
+    matcher = AhoCorasick([("ImageNet", "ImageNet"), ("GPT", "GPT")], ignore_case=True)
+    assert list(matcher.iter_matches("imagenet and gpt")) == [(0, 8, "ImageNet"), (13, 16, "GPT")]
+    assert list(AhoCorasick([("GPT", "GPT")]).iter_matches("gpt")) == []
+
+
+def test_iter_matches_exact_patterns_with_ignore_case():
+    matcher = AhoCorasick([("GPT", "GPT")], ignore_case=True, exact_patterns=[("RAG", "RAG")])
+    assert list(matcher.iter_matches("gpt rag RAG")) == [(0, 3, "GPT"), (8, 11, "RAG")]
@@ -0,0 +1,90 @@
+import gzip
+
+from tools.compile_venue_dict import check_misses, compile_venue_dict
+
+DBLP_XML = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<!DOCTYPE dblp SYSTEM "dblp.dtd">
+<dblp>
+<proceedings key="conf/acl/2019-1">
+<title>Proceedings of the 57th Conference of the Association for Computational Linguistics, ACL 2019, Florence, Italy, July 28- August 2, 2019, Volume 1: Long Papers</title>
+<booktitle>ACL (1)</booktitle><year>2019</year>
+</proceedings>
+<proceedings key="conf/sigdial/2020">
+<title>Proceedings of the 21th Annual Meeting of the Special Interest Group on Discourse and Dialogue, 1st virtual meeting, July 1-3, 2020</title>
+<booktitle>SIGdial</booktitle><year>2020</year>
+</proceedings>
+<proceedings key="conf/x/2020">
+<title>Proceedings of the Workshop on Things in M&uuml;nchen, WoT 2020</title>
+<booktitle>WoT</booktitle>
+</proceedings>
+<proceedings key="conf/x/2021">
+<title>Proceedings of the Workshop on Things in M&uuml;nchen, WT 2021</title>
+<booktitle>WT</booktitle>
+</proceedings>
+<proceedings key="conf/x/2022">
+<title>Proceedings of the Workshop on Things in M&uuml;nchen, WoT 2022</title>
+<booktitle>WoT</booktitle>
+</proceedings>
+<inproceedings key="conf/acl/X19"><title>Paper.</title><booktitle>ACL (1)</booktitle></inproceedings>
+</dblp>
+"""
+
+ANTHOLOGY_XML = """<?xml version='1.0' encoding='UTF-8'?>
+<collection id="2020.emnlp">
+  <volume id="main">
+    <meta>
+      <booktitle>Proceedings of the 2020 Conference on Empirical Methods in Natural Language Processing (<fixed-case>EMNLP</fixed-case>)</booktitle>
+      <year>2020</year>
+    </meta>
+    <paper id="1"><title>A paper</title></paper>
+  </volume>
+  <volume id="demos">
+    <meta>
+      <booktitle>Proceedings of the 2020 Conference on Empirical Methods in Natural Language Processing: System Demonstrations</booktitle>
+    </meta>
+  </volume>
+</collection>
+"""
+
+
+def test_compile_venue_dict_from_dblp_and_anthology(tmp_path):
+    dblp = tmp_path / "dblp.xml.gz"
+    with gzip.open(dblp, "wb") as f:
+        f.write(DBLP_XML.encode("latin-1"))
+    anthology = tmp_path / "xml"
+    anthology.mkdir()
+    (anthology / "2020.emnlp.xml").write_text(ANTHOLOGY_XML, encoding="utf-8")
+
+    venues, conflicts = compile_venue_dict([str(dblp), str(anthology)])
+    assert venues == {
+        "Conference of the Association for Computational Linguistics": "ACL",
+        "Annual Meeting of the Special Interest Group on Discourse and Dialogue": "SIGdial",
+        "Workshop on Things in München": "WoT",
+        "Conference on Empirical Methods in Natural Language Processing": "EMNLP",
+    }
+    # 同じ名前に複数の略称があれば多い方を採用して報告する
+    assert conflicts == ["Workshop on Things in München: WoT×2, WT×1 → WoT"]
+
+
+def test_compile_venue_dict_keeps_base_entries(tmp_path):
+    dblp = tmp_path / "dblp.xml"
+    dblp.write_bytes(DBLP_XML.encode("latin-1"))
+    base = {"Annual Meeting of the Special Interest Group on Discourse and Dialogue": "SIGDIAL"}
+
+    venues, conflicts = compile_venue_dict([str(dblp)], base=base, min_count=2)
+    assert list(venues.items()) == [
+        ("Annual Meeting of the Special Interest Group on Discourse and Dialogue", "SIGDIAL"),
+        ("Workshop on Things in München", "WoT"),
+    ]
+    assert any("SIGDIAL を残します" in conflict for conflict in conflicts)
+
+
+def test_check_misses():
+    venues = {"Workshop on Obscure Things": "WOT", "Journal of Things": "JoT"}
+    misses = [
+        {"name": "First Workshop on Obscure Things", "kind": "booktitle", "count": 3},
+        {"name": "Journal of Things Letters", "kind": "journal", "count": 2},
+    ]
+    covered, uncovered = check_misses(venues, misses)
+    assert [miss["name"] for miss in covered] == ["First Workshop on Obscure Things"]
+    assert [miss["name"] for miss in uncovered] == ["Journal of Things Letters"]
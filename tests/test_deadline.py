@@ -0,0 +1,94 @@
+import pytest
+
+from bibtex.simplify import iter_simplified_bibtex_entries, simplify_bibtex_entry
+from deadline import Deadline, DeadlineExceeded, create_deadline
+from slack_handler import handle_message
+
+RAW_BIB = """@article{a,
+    title = {first paper},
+    year = {2020}
+}
+
+@article{b,
+    title = {second paper},
+    year = {2021}
+}
+
+@article{c,
+    title = {third paper},
+    year = {2022}
+}"""
+
+
+class CountdownDeadline(Deadline):
+    """entries 件のエントリを整形したら期限切れになる"""
+
+    def __init__(self, entries: int):
+        super().__init__(lambda: 0.0)
+        self.left = entries
+
+    def expired(self, estimate: float = 0.0) -> bool:
+        self.left -= 1
+        return self.left < 0
+
+
+class FakeClient:
+    token = "xoxb-test"
+
+    def auth_test(self):
+        return {"user_id": "UBOT"}
+
+
+class FakeContext:
+    def __init__(self, remaining_ms: int):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+def test_deadline_after():
+    now = [100.0]
+    deadline = Deadline.after(10, reserve=2, clock=lambda: now[0])
+    assert deadline.remaining() == 8
+    assert not deadline.expired(estimate=7)
+    now[0] = 105.0
+    assert deadline.expired(estimate=3)
+
+
+def test_create_deadline(monkeypatch):
+    monkeypatch.setenv("DEADLINE_RESERVE_MS", "1000")
+    context = FakeContext(5000)
+    deadline = create_deadline(context)
+    assert deadline.remaining() == 4
+    context.remaining_ms = 1000
+    assert deadline.expired()
+    assert create_deadline(None) is None
+
+
+def test_iter_stops_between_entries():
+    results = []
+    with pytest.raises(DeadlineExceeded) as excinfo:
+        for result in iter_simplified_bibtex_entries(RAW_BIB, deadline=CountdownDeadline(1)):
+            results.append(result)
+    assert len(results) == 1
+    assert "@article{a," in results[0]
+    assert excinfo.value.pending == ["b", "c"]
+
+
+def test_simplify_returns_formatted_part():
+    warnings = []
+    result = simplify_bibtex_entry(RAW_BIB, warning_callback=warnings.append, deadline=CountdownDeadline(2))
+    assert "@article{b," in result
+    assert "@article{c," not in result
+    assert "1件のエントリを処理していません" in warnings[-1]
+    assert warnings[-1].endswith("\nエントリを分けて再度お試しください。")
+    assert ": c\n" in warnings[-1]
+
+
+def test_handle_message_reports_pending_entries():
+    messages = []
+    event = {"type": "message", "channel": "D1", "user": "U1", "text": RAW_BIB, "ts": "1700000000.000001"}
+    handle_message(event, messages.append, client=FakeClient(), deadline=CountdownDeadline(0))
+    assert len(messages) == 1
+    assert "a, b, c" in messages[0]
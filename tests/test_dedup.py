@@ -0,0 +1,246 @@
+import time
+from unittest.mock import patch
+
+import pytest
+
+import lambda_function
+from admission import AdmissionController
+from dedup import DONE, PROCESSING, DynamoDBDedupStore, InMemoryDedupStore, SQLiteDedupStore, create_dedup_store
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store_and_clock(request, tmp_path):
+    clock = FakeClock()
+    if request.param == "memory":
+        store = InMemoryDedupStore(ttl=100, lease=10, clock=clock)
+    else:
+        store = SQLiteDedupStore(str(tmp_path / "dedup.sqlite3"), ttl=100, lease=10, clock=clock)
+    return store, clock
+
+
+def test_first_event_is_processed(store_and_clock):
+    store, _ = store_and_clock
+    assert store.begin("Ev1")
+    assert store.begin("Ev2")
+
+
+def test_retry_while_processing_is_skipped(store_and_clock):
+    store, clock = store_and_clock
+    assert store.begin("Ev1")
+    clock.now += 5
+    assert not store.begin("Ev1")
+
+
+def test_retry_after_lease_expired_is_processed(store_and_clock):
+    store, clock = store_and_clock
+    assert store.begin("Ev1")
+    # 最初の処理が完了しないままリースが切れた（タイムアウトなど）
+    clock.now += 11
+    assert store.begin("Ev1")
+
+
+def test_retry_after_completion_is_skipped(store_and_clock):
+    store, clock = store_and_clock
+    assert store.begin("Ev1")
+    store.complete("Ev1")
+    clock.now += 50
+    assert not store.begin("Ev1")
+    # TTL を過ぎたら忘れる
+    clock.now += 51
+    assert store.begin("Ev1")
+
+
+def test_release_allows_retry(store_and_clock):
+    store, _ = store_and_clock
+    assert store.begin("Ev1")
+    store.release("Ev1")
+    assert store.begin("Ev1")
+
+
+def test_sqlite_store_is_shared_between_connections(tmp_path):
+    path = str(tmp_path / "dedup.sqlite3")
+    first = SQLiteDedupStore(path)
+    second = SQLiteDedupStore(path)
+    assert first.begin("Ev1")
+    assert not second.begin("Ev1")
+
+
+def test_memory_store_is_bounded():
+    store = InMemoryDedupStore(max_entries=3)
+    for i in range(10):
+        assert store.begin(f"Ev{i}")
+        store.complete(f"Ev{i}")
+    assert len(store._records) <= 3
+
+
+def test_process_event_skips_duplicates():
+    calls = []
+    event_data = {"type": "event_callback", "event_id": "Ev1", "event": {"type": "message"}}
+    with patch.object(lambda_function, "dedup_store", InMemoryDedupStore()), \
+            patch.object(lambda_function, "_process_event", side_effect=lambda event, deadline: calls.append(event)):
+        lambda_function.process_event(event_data)
+        lambda_function.process_event(event_data)
+    assert calls == [event_data]
+
+
+def test_process_event_failure_allows_retry():
+    event_data = {"type": "event_callback", "event_id": "Ev1", "event": {"type": "message"}}
+    with patch.object(lambda_function, "dedup_store", InMemoryDedupStore()):
+        with patch.object(lambda_function, "_process_event", side_effect=RuntimeError("crash")):
+            with pytest.raises(RuntimeError):
+                lambda_function.process_event(event_data)
+        with patch.object(lambda_function, "_process_event") as mocked:
+            lambda_function.process_event(event_data)
+        mocked.assert_called_once_with(event_data, None)
+
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+
+class FakeDynamoDBClient:
+    """DynamoDBDedupStore が使う条件付きの put_item / delete_item だけを再現する"""
+
+    class exceptions:
+        ConditionalCheckFailedException = ConditionalCheckFailedException
+
+    def __init__(self):
+        self.items = {}
+
+    def put_item(self, TableName, Item, ConditionExpression=None, ExpressionAttributeValues=None):
+        event_id = Item["event_id"]["S"]
+        current = self.items.get(event_id)
+        if ConditionExpression and current is not None:
+            if int(current["expires_at"]["N"]) > int(ExpressionAttributeValues[":now"]["N"]):
+                raise ConditionalCheckFailedException()
+        self.items[event_id] = Item
+
+    def delete_item(self, TableName, Key, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        current = self.items.get(Key["event_id"]["S"])
+        if current is None or current["state"] != ExpressionAttributeValues[":processing"]:
+            raise ConditionalCheckFailedException()
+        del self.items[Key["event_id"]["S"]]
+
+
+def test_dynamodb_store():
+    clock = FakeClock()
+    client = FakeDynamoDBClient()
+    first = DynamoDBDedupStore("events", client, ttl=100, lease=10, clock=clock)
+    second = DynamoDBDedupStore("events", client, ttl=100, lease=10, clock=clock)
+    assert first.shared
+    assert first.begin("Ev1")
+    # 別の実行環境に届いたリトライは処理しない
+    assert not second.begin("Ev1")
+    first.release("Ev1")
+    assert second.begin("Ev1")
+    second.complete("Ev1")
+    # 完了した記録は取り消さない
+    first.release("Ev1")
+    clock.now += 50
+    assert not first.begin("Ev1")
+    clock.now += 51
+    assert first.begin("Ev1")
+
+
+def test_create_dedup_store_is_shared_only_when_configured(monkeypatch, tmp_path):
+    monkeypatch.delenv("DEDUP_BACKEND", raising=False)
+    assert not create_dedup_store().shared
+    monkeypatch.setenv("DEDUP_BACKEND", "sqlite")
+    monkeypatch.delenv("DEDUP_SQLITE_PATH", raising=False)
+    assert not create_dedup_store().shared
+    monkeypatch.setenv("DEDUP_SQLITE_PATH", str(tmp_path / "dedup.sqlite3"))
+    assert create_dedup_store().shared
+    monkeypatch.setenv("DEDUP_BACKEND", "dynamodb")
+    monkeypatch.delenv("DEDUP_DYNAMODB_TABLE", raising=False)
+    assert not create_dedup_store().shared
+
+
+def _retry_headers(reason):
+    return {"x-slack-retry-num": "1", "x-slack-retry-reason": reason}
+
+
+def test_timeout_retry_is_dropped_without_shared_store():
+    with patch.object(lambda_function, "dedup_store", InMemoryDedupStore()), \
+            patch.object(lambda_function, "signature_verifier", None):
+        response, event_data = lambda_function.parse_slack_request(_retry_headers("http_timeout"), "{}")
+    assert response == {"statusCode": 200, "body": "OK"}
+    assert event_data is None
+
+
+def test_timeout_retry_is_processed_with_shared_store():
+    store = DynamoDBDedupStore("events", FakeDynamoDBClient())
+    # 共有するストアがあれば署名検証に進む（ここでは検証器がないため 500 になる）
+    with patch.object(lambda_function, "dedup_store", store), \
+            patch.object(lambda_function, "signature_verifier", None):
+        response, _ = lambda_function.parse_slack_request(_retry_headers("http_timeout"), "{}")
+        assert response["statusCode"] == 500
+    # エラーによるリトライは共有しないストアでも処理する
+    with patch.object(lambda_function, "dedup_store", InMemoryDedupStore()), \
+            patch.object(lambda_function, "signature_verifier", None):
+        response, _ = lambda_function.parse_slack_request(_retry_headers("http_error"), "{}")
+        assert response["statusCode"] == 500
+
+
+class FakeSlackClient:
+    def chat_postMessage(self, **kwargs):
+        return {"ok": True, "ts": "1700000001.000001"}
+
+    def chat_update(self, **kwargs):
+        return {"ok": True}
+
+
+def _message_event(event_id):
+    return {
+        "type": "event_callback",
+        "event_id": event_id,
+        "event": {"type": "message", "channel": "D1", "user": "U1", "text": "hi", "ts": "1700000000.000001"},
+    }
+
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_queued_event_is_completed_when_its_reply_is_sent():
+    store = InMemoryDedupStore()
+    jobs = []
+    controller = AdmissionController(user_rate=50, user_burst=1, dispatch=lambda job: jobs.append(job) or True)
+    with patch.object(lambda_function, "dedup_store", store), \
+            patch.object(lambda_function, "admission", controller), \
+            patch.object(lambda_function, "client", FakeSlackClient()), \
+            patch.object(lambda_function, "handle_message"):
+        lambda_function.process_event(_message_event("Ev1"))
+        lambda_function.process_event(_message_event("Ev2"))
+        assert store._records["Ev1"][0] == DONE
+        # 順番待ちのイベントは、返信するまで完了として記録しない
+        assert store._records["Ev2"][0] == PROCESSING
+        assert _wait_until(lambda: jobs)
+        jobs[0]()
+    assert store._records["Ev2"][0] == DONE
+
+
+def test_queued_event_rejected_later_allows_retry():
+    store = InMemoryDedupStore()
+    controller = AdmissionController(user_rate=50, user_burst=1, dispatch=lambda job: False)
+    with patch.object(lambda_function, "dedup_store", store), \
+            patch.object(lambda_function, "admission", controller), \
+            patch.object(lambda_function, "client", FakeSlackClient()), \
+            patch.object(lambda_function, "handle_message"):
+        lambda_function.process_event(_message_event("Ev1"))
+        lambda_function.process_event(_message_event("Ev2"))
+        # 積み直せずに拒否されたら、Slack のリトライで処理し直せる
+        assert _wait_until(lambda: "Ev2" not in store._records)
+    assert store.begin("Ev2")
@@ -0,0 +1,198 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import pytest
+
+from bibtex.enrich import MetadataEnricher, MetadataFetcher, MetadataStore
+from bibtex.simplify import _parse_bibtex_entries, simplify_bibtex_entry, iter_simplified_bibtex_entries
+
+WORKS = {
+    "10.18653/v1/d14-1162": {
+        "type": "proceedings-article",
+        "container-title": ["Proceedings of the 2014 Conference on Empirical Methods in Natural Language Processing (EMNLP)"],
+        "page": "1532-1543",
+        "issued": {"date-parts": [[2014, 10]]},
+    },
+    "10.1162/coli_a_00370": {
+        "type": "journal-article",
+        "container-title": ["Computational Linguistics"],
+        "volume": "46",
+        "issue": "1",
+        "page": "135-187",
+        "published-print": {"date-parts": [[2020, 4]]},
+    },
+}
+
+ATOM = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">{entries}</feed>"""
+ATOM_ENTRY = "<entry><id>http://arxiv.org/abs/{id}v2</id><published>{year}-06-12T17:57:34Z</published></entry>"
+ARXIV = {"1706.03762": "2017"}
+
+
+class StandInServer:
+    """Crossref・arXiv API の代わりに応答するローカルサーバー"""
+
+    def __init__(self, delay=0.0, slow_once=0.0):
+        self.requests = []
+        # 最初の1回だけ遅れて応答する秒数
+        self.slow_once = slow_once
+        self.connections = set()
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests.append(self.path)
+                    server.connections.add(self.client_address)
+                    server.active += 1
+                    server.max_active = max(server.max_active, server.active)
+                    slow, server.slow_once = server.slow_once, 0.0
+                time.sleep(delay + slow)
+                try:
+                    status, body = server.respond(self.path)
+                finally:
+                    with server._lock:
+                        server.active -= 1
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def respond(self, path):
+        parts = urlsplit(path)
+        if parts.path.startswith("/works/"):
+            work = WORKS.get(unquote(parts.path.removeprefix("/works/")).lower())
+            if work is None:
+                return 404, b"Resource not found."
+            return 200, json.dumps({"status": "ok", "message": work}).encode()
+        ids = parse_qs(parts.query)["id_list"][0].split(",")
+        entries = "".join(ATOM_ENTRY.format(id=i, year=ARXIV[i]) for i in ids if i in ARXIV)
+        return 200, ATOM.format(entries=entries).encode()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = StandInServer(delay=0.05)
+    yield server
+    server.close()
+
+
+RAW_BIB = """@inproceedings{pennington-2014-glove,
+    title = "GloVe: Global Vectors for Word Representation",
+    author = "Pennington, Jeffrey",
+    doi = "10.18653/v1/D14-1162",
+}
+@article{alva-manchego-etal-2020-data,
+    title = "Data-Driven Sentence Simplification: Survey and Benchmark",
+    author = "Alva-Manchego, Fernando",
+    url = "https://doi.org/10.1162/coli_a_00370",
+}
+@misc{vaswani2017attention,
+    title = {Attention Is All You Need},
+    author = {Ashish Vaswani},
+    eprint = {1706.03762v5},
+    archivePrefix = {arXiv},
+    primaryClass = {cs.CL},
+}
+@misc{unknown,
+    title = {Unknown},
+    doi = {10.0000/missing},
+}"""
+
+
+def test_enrich_fills_missing_fields_from_stand_in_server(server, tmp_path):
+    fetcher = MetadataFetcher(crossref_url=server.url, arxiv_url=server.url, max_workers=2)
+    enricher = MetadataEnricher(fetcher, MetadataStore(str(tmp_path / "metadata.sqlite3")))
+
+    result = "".join(iter_simplified_bibtex_entries(RAW_BIB, abbreviation_mode="long", enricher=enricher))
+
+    assert 'booktitle = "Proceedings of the 2014 Conference on Empirical Methods in Natural Language Processing"' in result
+    assert 'pages = "1532--1543"' in result
+    assert 'year = "2014"' in result
+    assert 'journal = "Computational Linguistics"' in result
+    assert 'volume = "46"' in result
+    assert 'year = "2017"' in result
+    # DOI 3件は1件ずつ、arXiv はまとめて1回で取得する
+    assert len(server.requests) == 4
+    # 並行数は max_workers までで、接続はスレッドごとに使い回す
+    assert server.max_active <= 2
+    assert len(server.connections) <= 2
+    fetcher.close()
+
+
+def test_enrich_uses_persistent_cache(server, tmp_path):
+    path = str(tmp_path / "metadata.sqlite3")
+    first = MetadataEnricher(MetadataFetcher(crossref_url=server.url, arxiv_url=server.url), MetadataStore(path))
+    first.enrich(_parse_bibtex_entries(RAW_BIB))
+    assert len(server.requests) == 4
+
+    # 見つからなかった DOI も含めて、キャッシュにあるものは再び取得しない
+    second = MetadataEnricher(MetadataFetcher(crossref_url=server.url, arxiv_url=server.url), MetadataStore(path))
+    library = _parse_bibtex_entries(RAW_BIB)
+    second.enrich(library)
+    assert len(server.requests) == 4
+    assert library.entries[0].fields_dict["pages"].value == "1532--1543"
+
+
+def test_metadata_store_expires_entries(tmp_path):
+    now = [1000.0]
+    store = MetadataStore(str(tmp_path / "metadata.sqlite3"), ttl=10, clock=lambda: now[0])
+    store.put_many({"doi:10.1/a": {"year": "2020"}, "doi:10.1/b": {}})
+    assert store.get_many(["doi:10.1/a", "doi:10.1/b", "doi:10.1/c"]) == {"doi:10.1/a": {"year": "2020"}, "doi:10.1/b": {}}
+    now[0] += 11
+    assert store.get_many(["doi:10.1/a"]) == {}
+
+
+def test_enrich_survives_server_errors(tmp_path):
+    fetcher = MetadataFetcher(crossref_url="http://127.0.0.1:9", arxiv_url="http://127.0.0.1:9", timeout=1)
+    enricher = MetadataEnricher(fetcher, MetadataStore(str(tmp_path / "metadata.sqlite3")))
+    # 取得に失敗しても整形は続ける
+    assert "".join(iter_simplified_bibtex_entries(RAW_BIB, enricher=enricher)) == simplify_bibtex_entry(RAW_BIB)
+    fetcher.close()
+
+
+def test_enrich_stops_waiting_at_deadline(tmp_path):
+    from deadline import Deadline
+
+    slow = StandInServer(delay=2.0)
+    fetcher = MetadataFetcher(crossref_url=slow.url, arxiv_url=slow.url, max_workers=1)
+    enricher = MetadataEnricher(fetcher, MetadataStore(str(tmp_path / "metadata.sqlite3")))
+    started = time.perf_counter()
+    # 取得を待つのは残り時間（0.4 秒）の半分まで
+    result = "".join(iter_simplified_bibtex_entries(RAW_BIB, enricher=enricher, deadline=Deadline.after(0.4)))
+    assert time.perf_counter() - started < 1.5
+    assert "@misc{unknown," in result
+    assert 'pages = "1532--1543"' not in result
+    fetcher.close()
+    slow.close()
+
+
+def test_connection_is_replaced_after_timeout():
+    slow = StandInServer(slow_once=1.0)
+    fetcher = MetadataFetcher(crossref_url=slow.url, arxiv_url=slow.url, max_workers=1, timeout=0.3)
+    # 1回目はタイムアウトして取得できない
+    assert fetcher.fetch_many(["10.18653/v1/D14-1162"], []) == {}
+    # 途中で止まった接続を使い回さず、繋ぎ直して取得できる
+    results = fetcher.fetch_many(["10.1162/coli_a_00370"], [])
+    assert results["doi:10.1162/coli_a_00370"]["volume"] == "46"
+    fetcher.close()
+    slow.close()
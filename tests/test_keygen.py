@@ -0,0 +1,57 @@
+import bibtexparser
+
+from bibtex.keygen import KeyGenerator, KeyIndex
+from bibtex.simplify import simplify_bibtex_entry
+
+
+def _entry(raw: str):
+    return bibtexparser.parse_string(raw).entries[0]
+
+
+def test_acl_style_keys():
+    generator = KeyGenerator()
+    glove = _entry('@inproceedings{x, title = "GloVe: Global Vectors for Word Representation", '
+                   'author = "Pennington, Jeffrey and Socher, Richard and Manning, Christopher", year = "2014"}')
+    survey = _entry('@article{y, title = "Data-Driven Sentence Simplification", '
+                    'author = "Alva-Manchego, Fernando and Scarton, Carolina", year = "2020"}')
+    single = _entry('@misc{z, title = "The {\\"U}ber Model", author = "J{\\"o}rg M{\\"u}ller", year = "2021"}')
+    assert generator.generate(glove) == "pennington-etal-2014-glove"
+    assert generator.generate(survey) == "alva-manchego-scarton-2020-data"
+    assert generator.generate(single) == "muller-2021-uber"
+
+
+def test_custom_pattern_and_missing_fields():
+    generator = KeyGenerator("{firstauthor}{year}{firstword}")
+    assert generator.generate(_entry('@misc{z, title = "On the Attention", author = "Ann Lee", year = "2019"}')) == "lee2019attention"
+    # 空の項目の区切り文字は残さない
+    assert KeyGenerator().generate(_entry('@misc{z, title = "Attention"}')) == "attention"
+
+
+def test_collisions_get_suffixes():
+    index = KeyIndex(["lee-2019-attention", "lee-2019-attention-2"])
+    generator = KeyGenerator(index=index)
+    entry = _entry('@misc{z, title = "Attention", author = "Ann Lee", year = "2019"}')
+    assert [generator.generate(entry) for _ in range(3)] == [
+        "lee-2019-attention-3", "lee-2019-attention-4", "lee-2019-attention-5",
+    ]
+    assert len(index) == 5
+
+
+def test_index_from_bib_and_save(tmp_path):
+    bib = tmp_path / "refs.bib"
+    bib.write_text("@article{lee-2019-attention,\n title={A}}\n@misc( other ,\n title={B})\n", encoding="utf-8")
+    index = KeyIndex.load(str(bib))
+    assert "lee-2019-attention" in index and "other" in index
+
+    saved = tmp_path / "keys.txt"
+    index.save(str(saved))
+    assert "other" in KeyIndex.load(str(saved))
+
+
+def test_simplify_with_new_key():
+    raw_bib = """@misc{a, title = "Attention", author = "Ann Lee", year = "2019"}
+@misc{b, title = "Attention Again", author = "Ann Lee", year = "2019"}
+"""
+    result = simplify_bibtex_entry(raw_bib, new_key="{firstauthor}{year}")
+    assert "@misc{lee2019," in result
+    assert "@misc{lee2019-2," in result
@@ -0,0 +1,22 @@
+from bibtex.latex_lexer import COMMAND, GROUP, TEXT, lex
+
+
+def test_lex_splits_text_groups_and_commands():
+    lexed = lex(r"A {Title} with {\"{a}} and \textbf{Bold}{} text")
+    assert [(token.kind, token.text) for token in lexed.tokens] == [
+        (TEXT, "A "),
+        (GROUP, "{Title}"),
+        (TEXT, " with "),
+        (GROUP, r'{\"{a}}'),
+        (TEXT, " and "),
+        (COMMAND, r"\textbf{Bold}{}"),
+        (TEXT, " text"),
+    ]
+    assert lexed.has_latex
+
+
+def test_lex_treats_unbalanced_braces_as_text():
+    lexed = lex("a {b {c} d")
+    assert [(token.kind, token.text) for token in lexed.tokens] == [(TEXT, "a {b "), (GROUP, "{c}"), (TEXT, " d")]
+    assert "".join(token.text for token in lex("}{}{ \\").tokens) == "}{}{ \\"
+    assert not lex(r"Q\&A {GPU}s").has_latex
@@ -0,0 +1,63 @@
+import json
+import os
+import time
+
+import pytest
+
+from load_resource import VenueDictProvider
+
+
+def write_dict(path, venues, mtime=None):
+    path.write_text(json.dumps(venues), encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_refresh_swaps_dictionary_and_version(tmp_path):
+    path = tmp_path / "venues.json"
+    write_dict(path, {"Something Conference": "SC"}, mtime=1_000_000)
+    provider = VenueDictProvider(str(path), poll_interval=0)
+    assert provider.get() == {"Something Conference": "SC"}
+    old_version = provider.version
+
+    # ファイルが変わっていなければ読み込み直さない
+    assert provider.refresh() is False
+
+    write_dict(path, {"Something Conference": "SC", "Other Workshop": "OW"}, mtime=1_000_010)
+    assert provider.refresh() is True
+    assert provider.get()["Other Workshop"] == "OW"
+    assert provider.version != old_version
+
+
+def test_refresh_keeps_old_dictionary_on_broken_file(tmp_path):
+    path = tmp_path / "venues.json"
+    write_dict(path, {"Journal": "J"}, mtime=1_000_000)
+    provider = VenueDictProvider(str(path), poll_interval=0)
+    version = provider.version
+
+    path.write_text("{broken", encoding="utf-8")
+    os.utime(path, (1_000_010, 1_000_010))
+    assert provider.refresh() is False
+    path.unlink()
+    assert provider.refresh() is False
+    assert provider.get() == {"Journal": "J"}
+    assert provider.version == version
+
+
+def test_missing_file_on_first_load_raises(tmp_path):
+    provider = VenueDictProvider(str(tmp_path / "missing.json"))
+    with pytest.raises(FileNotFoundError):
+        provider.get()
+
+
+def test_get_checks_for_updates_in_background(tmp_path):
+    path = tmp_path / "venues.json"
+    write_dict(path, {"Journal": "J"}, mtime=1_000_000)
+    provider = VenueDictProvider(str(path), poll_interval=0.01)
+    assert provider.get() == {"Journal": "J"}
+
+    write_dict(path, {"Journal": "JNL"}, mtime=1_000_010)
+    deadline = time.monotonic() + 5
+    while provider.get() != {"Journal": "JNL"} and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert provider.get() == {"Journal": "JNL"}
@@ -0,0 +1,32 @@
+import json
+
+from slack_sdk.signature import SignatureVerifier
+
+from tools.loadtest import SIGNING_SECRET, make_event_callback, make_lambda_event, run_load_test, sign_request
+
+
+def test_sign_request_matches_slack_sdk():
+    body = json.dumps(make_event_callback(0))
+    headers = sign_request(body)
+    verifier = SignatureVerifier(SIGNING_SECRET)
+
+    assert verifier.is_valid(body, headers["X-Slack-Request-Timestamp"], headers["X-Slack-Signature"])
+
+
+def test_make_lambda_event_shapes():
+    payload = make_event_callback(1)
+
+    v1 = make_lambda_event(payload, version="1.0")
+    v2 = make_lambda_event(payload, version="2.0", base64_encoded=True)
+
+    assert v1["httpMethod"] == "POST" and json.loads(v1["body"]) == payload
+    assert v2["version"] == "2.0" and v2["isBase64Encoded"] is True
+    assert "x-slack-signature" in v2["headers"]
+
+
+def test_run_load_test_replies_to_every_event():
+    report = run_load_test(requests=10, concurrency=4, version="2.0", base64_encoded=True)
+
+    assert report["status"] == {200: 10}
+    assert report["slack_calls"]["chat_postMessage"] == 10
+    assert 0 < report["p50"] <= report["p95"] <= report["p99"]
@@ -0,0 +1,21 @@
+from tools.memory_benchmark import measure_memory
+
+# エントリあたりのピーク割り当て量の上限（バイト）。現状の約2倍の余裕を持たせている
+PEAK_PER_ENTRY_BUDGET = {
+    "parse": 16 * 1024,
+    "format": 4 * 1024,
+    "total": 16 * 1024,
+}
+
+
+def test_peak_memory_per_entry_within_budget():
+    report = measure_memory(200)
+    for stage, budget in PEAK_PER_ENTRY_BUDGET.items():
+        assert report[stage]["peak_per_entry"] < budget, (stage, report[stage])
+
+
+def test_peak_memory_scales_linearly():
+    small = measure_memory(50)
+    large = measure_memory(400)
+    # エントリ数に対して線形以上に増えていないこと
+    assert large["total"]["peak"] < small["total"]["peak"] * 8 * 1.5
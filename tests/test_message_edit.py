@@ -0,0 +1,101 @@
+from slack_handler import extract_edited_message, handle_message
+from slack_reply import ProgressiveReply
+
+
+class FakeClient:
+    """投稿・更新・削除を記録する Slack クライアントのスタブ"""
+
+    def __init__(self):
+        self.messages = {}
+        self.posts = []
+        self.updates = []
+        self.deletes = []
+        self._counter = 0
+
+    def auth_test(self):
+        return {"user_id": "UBOT"}
+
+    def chat_postMessage(self, channel, text, **kwargs):
+        self._counter += 1
+        ts = f"1700000001.{self._counter:06d}"
+        self.messages[ts] = text
+        self.posts.append(ts)
+        return {"ok": True, "ts": ts}
+
+    def chat_update(self, channel, ts, text, **kwargs):
+        self.messages[ts] = text
+        self.updates.append(ts)
+        return {"ok": True, "ts": ts}
+
+    def chat_delete(self, channel, ts, **kwargs):
+        del self.messages[ts]
+        self.deletes.append(ts)
+        return {"ok": True}
+
+
+RAW_BIB = """@article{a,
+    title = {first paper},
+    year = {2020}
+}
+
+@article{b,
+    title = {second paper},
+    year = {2021}
+}"""
+
+
+def make_edit_event(old_text, new_text, **message):
+    return {
+        "type": "message",
+        "subtype": "message_changed",
+        "channel": "D123",
+        "channel_type": "im",
+        "message": {"type": "message", "user": "U1", "text": new_text, "ts": "1700000000.000001", **message},
+        "previous_message": {"type": "message", "user": "U1", "text": old_text, "ts": "1700000000.000001"},
+    }
+
+
+def test_extract_edited_message():
+    edited = extract_edited_message(make_edit_event("old", "new"))
+    assert edited["text"] == "new"
+    assert edited["channel"] == "D123"
+    assert edited["ts"] == "1700000000.000001"
+
+    # 本文が変わっていない編集やボットのメッセージは無視する
+    assert extract_edited_message(make_edit_event("same", "same")) is None
+    assert extract_edited_message(make_edit_event("old", "new", bot_id="B1")) is None
+
+
+def test_edit_updates_previous_reply_in_place():
+    client = FakeClient()
+    original = {"type": "message", "channel": "D123", "user": "U1", "text": RAW_BIB, "ts": "1700000000.000001"}
+    handle_message(original, lambda text: None, client, result_stream=ProgressiveReply(client, "D123", update_interval=0))
+    assert len(client.posts) == 1
+    reply_ts = client.posts[0]
+
+    edited_text = RAW_BIB.replace("second paper", "second edited paper")
+    edited = extract_edited_message(make_edit_event(RAW_BIB, edited_text))
+    handle_message(edited, lambda text: None, client, result_stream=ProgressiveReply(client, "D123", update_interval=0))
+
+    # 新しく投稿せずに、以前の返信を書き換える
+    assert client.posts == [reply_ts]
+    assert reply_ts in client.updates
+    assert "Second Edited Paper" in client.messages[reply_ts]
+    assert "First Paper" in client.messages[reply_ts]
+
+
+def test_chatter_gets_usage_hint_without_parsing():
+    client = FakeClient()
+    calls = []
+    client.auth_test = lambda: calls.append(1) or {"user_id": "UBOT"}
+    client.token = "xoxb-chatter"
+    replies = []
+
+    handle_message({"channel": "D123", "user": "U1", "text": "thanks!"}, replies.append, client)
+    handle_message({"channel": "D123", "user": "U1", "text": "ok"}, replies.append, client)
+    # メンションのないチャンネルのメッセージは auth_test も呼ばない
+    handle_message({"channel": "C123", "user": "U1", "text": "hello"}, replies.append, client)
+
+    assert len(replies) == 2
+    assert replies[0].startswith("有効なBibTeXエントリが見つかりませんでした")
+    assert calls == [1]
@@ -1,4 +1,4 @@
-from slack_handler import parse_options_and_extract_bib
+from slack_handler import looks_like_bibtex, parse_options_and_extract_bib, parse_options
 import pytest
 
 def test_no_options():
@@ -120,4 +120,27 @@ def test_codeblock():
 }"""
     abbreviation_mode, raw_bib3 = parse_options_and_extract_bib(input_raw_bib3)
     assert abbreviation_mode == "short"
-    assert raw_bib3 == expected_raw_bib3
\ No newline at end of file
+    assert raw_bib3 == expected_raw_bib3
+
+def test_profile_option():
+    input = "--profile -s\n@article{}"
+    mode, flags, raw_bib = parse_options(input)
+    assert mode == "short"
+    assert flags == {"profile"}
+    assert raw_bib == "@article{}"
+    # 通常の関数では隠しオプションは取り除かれるだけ
+    assert parse_options_and_extract_bib(input) == ("short", "@article{}")
+
+
+def test_key_option():
+    mode, flags, raw_bib = parse_options("-s -k\n@inproceedings{}")
+    assert mode == "short"
+    assert flags == {"key"}
+    assert raw_bib == "@inproceedings{}"
+
+
+def test_looks_like_bibtex():
+    assert looks_like_bibtex("-s\n@inproceedings{key,\n title={A}}")
+    assert looks_like_bibtex("```@Article (key, title = \"A\")```")
+    assert not looks_like_bibtex("thanks!")
+    assert not looks_like_bibtex("<@UBOT> ありがとう、me@example.com に送りました")
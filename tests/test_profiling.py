@@ -0,0 +1,107 @@
+import cProfile
+import logging
+import threading
+
+import pytest
+
+import profiling
+from profiling import profile, should_profile
+
+
+@pytest.fixture(autouse=True)
+def clear_env(monkeypatch):
+    for name in ["BIB_BOT_PROFILE", "BIB_BOT_PROFILE_RATE", "BIB_BOT_PROFILE_DIR"]:
+        monkeypatch.delenv(name, raising=False)
+
+
+def busy():
+    return sum(i * i for i in range(1000))
+
+
+def test_should_profile_disabled_by_default():
+    assert not should_profile()
+
+
+def test_should_profile_requested():
+    assert should_profile(requested=True)
+
+
+def test_should_profile_env(monkeypatch):
+    monkeypatch.setenv("BIB_BOT_PROFILE", "1")
+    assert should_profile()
+
+
+def test_should_profile_rate(monkeypatch):
+    monkeypatch.setenv("BIB_BOT_PROFILE_RATE", "1.0")
+    assert should_profile()
+    monkeypatch.setenv("BIB_BOT_PROFILE_RATE", "0")
+    assert not should_profile()
+    monkeypatch.setenv("BIB_BOT_PROFILE_RATE", "invalid")
+    assert not should_profile()
+
+
+def test_profile_disabled_does_not_report(monkeypatch):
+    reports = []
+    monkeypatch.setattr(profiling, "_report", lambda *args: reports.append(args))
+    with profile("test", enabled=False):
+        busy()
+    assert reports == []
+
+
+def test_profile_logs_hot_functions(caplog):
+    with caplog.at_level(logging.INFO):
+        with profile("test", enabled=True):
+            busy()
+    assert "プロファイル結果 (test" in caplog.text
+    assert "busy" in caplog.text
+
+
+def test_profile_writes_file(monkeypatch, tmp_path):
+    monkeypatch.setenv("BIB_BOT_PROFILE_DIR", str(tmp_path))
+    with profile("message/U123", enabled=True):
+        busy()
+    files = list(tmp_path.glob("message_U123-*.prof"))
+    assert len(files) == 1
+
+
+def test_concurrent_profile_runs_unprofiled(monkeypatch):
+    reports = []
+    monkeypatch.setattr(profiling, "_report", lambda profiler, label, elapsed: reports.append(label))
+    entered = threading.Event()
+    release = threading.Event()
+    errors = []
+    results = []
+
+    def first():
+        try:
+            with profile("first", enabled=True):
+                entered.set()
+                release.wait(5)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    assert entered.wait(5)
+    # 計測中に来たリクエストも失敗せずに処理される
+    with profile("second", enabled=True):
+        results.append(busy())
+    release.set()
+    thread.join(5)
+
+    assert errors == []
+    assert results == [busy()]
+    assert reports == ["first"]
+
+
+def test_profile_runs_unprofiled_when_another_tool_is_active(caplog):
+    other = cProfile.Profile()
+    other.enable()
+    try:
+        with caplog.at_level(logging.WARNING):
+            with profile("test", enabled=True):
+                result = busy()
+    finally:
+        other.disable()
+    assert result == busy()
+    assert "プロファイラを有効にできない" in caplog.text
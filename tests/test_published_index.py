@@ -0,0 +1,123 @@
+import gzip
+import os
+
+from bibtex.published_index import PublishedIndex, normalize_title, write_index
+from bibtex.simplify import simplify_bibtex_entry
+from tools.build_published_index import build_index
+from tools.dblp import iter_dblp_records
+
+DBLP_XML = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<!DOCTYPE dblp SYSTEM "dblp.dtd">
+<dblp>
+<article key="journals/corr/abs-1810-04805">
+<author>Jacob Devlin</author><author>Kenton Lee</author>
+<title>BERT: Pre-training of Deep Bidirectional Transformers for Language Understanding.</title>
+<journal>CoRR</journal><year>2018</year>
+<ee type="oa">http://arxiv.org/abs/1810.04805</ee>
+</article>
+<inproceedings key="conf/naacl/DevlinCLT19">
+<author>Jacob Devlin</author>
+<title>BERT: Pre-training of Deep Bidirectional Transformers for Language Understanding.</title>
+<pages>4171-4186</pages><year>2019</year><booktitle>NAACL-HLT (1)</booktitle>
+<ee>https://doi.org/10.18653/v1/n19-1423</ee>
+</inproceedings>
+<inproceedings key="conf/x/M&uuml;ller20">
+<author>Hans M&uuml;ller</author>
+<title>&Uuml;ber Parsing.</title><year>2020</year><booktitle>X</booktitle>
+</inproceedings>
+</dblp>
+"""
+
+ANTHOLOGY_BIB = """@inproceedings{devlin-etal-2019-bert,
+    title = "{BERT}: Pre-training of Deep Bidirectional Transformers for Language Understanding",
+    booktitle = "Proceedings of the 2019 Conference of the North {A}merican Chapter of the Association for Computational Linguistics",
+    year = "2019",
+    url = "https://aclanthology.org/N19-1423",
+    pages = "4171--4186",
+}
+"""
+
+ARXIV_BIB = """@misc{devlin2019bert,
+      title={BERT: Pre-training of Deep Bidirectional Transformers for Language Understanding},
+      author={Jacob Devlin and Ming-Wei Chang and Kenton Lee and Kristina Toutanova},
+      year={2019},
+      eprint={1810.04805},
+      archivePrefix={arXiv},
+      primaryClass={cs.CL},
+}"""
+
+
+def test_index_lookup_round_trip(tmp_path):
+    path = str(tmp_path / "index.bin")
+    records = [(f"title:paper {i}", {"entry_type": "article", "journal": f"J{i}", "year": "2020"}) for i in range(1000)]
+    assert write_index(path, records) == 1000
+
+    index = PublishedIndex(path)
+    assert len(index) == 1000
+    assert index.get("title:paper 123") == {"entry_type": "article", "journal": "J123", "year": "2020"}
+    assert index.get("title:paper 1000") is None
+    assert index.lookup(title="{Paper} 7!")["journal"] == "J7"
+    index.close()
+
+
+def test_iter_dblp_records_streams_and_resolves_entities(tmp_path):
+    path = tmp_path / "dblp.xml.gz"
+    with gzip.open(path, "wb") as f:
+        f.write(DBLP_XML.encode("latin-1"))
+    records = list(iter_dblp_records(str(path), chunk_size=64))
+    assert [record["type"] for record in records] == ["article", "inproceedings", "inproceedings"]
+    assert records[0]["author"] == ["Jacob Devlin", "Kenton Lee"]
+    assert records[2]["title"] == "Über Parsing."
+    assert records[2]["author"] == ["Hans Müller"]
+
+
+def test_arxiv_entry_uses_published_version(tmp_path, monkeypatch):
+    dblp = tmp_path / "dblp.xml"
+    dblp.write_bytes(DBLP_XML.encode("latin-1"))
+    anthology = tmp_path / "anthology.bib"
+    anthology.write_text(ANTHOLOGY_BIB, encoding="utf-8")
+    output = str(tmp_path / "index.bin")
+
+    # Anthology を後に指定し、会議名は正式名称を使う
+    counts = build_index([str(dblp), str(anthology)], output)
+    assert counts["linked"] == 1
+
+    monkeypatch.setenv("PUBLISHED_INDEX_PATH", output)
+    warnings = []
+    result = simplify_bibtex_entry(ARXIV_BIB, abbreviation_mode="long", warning_callback=warnings.append)
+    assert result.startswith("@inproceedings{devlin2019bert,")
+    assert 'booktitle = "Proceedings of the 2019 Conference of the North {A}merican Chapter' in result
+    assert 'pages = "4171--4186"' in result
+    assert 'url = "https://aclanthology.org/N19-1423"' in result
+    assert "arXiv" not in result
+    assert any("出版版" in message for message in warnings)
+
+    monkeypatch.delenv("PUBLISHED_INDEX_PATH")
+    assert 'journal = "arXiv:1810.04805"' in simplify_bibtex_entry(ARXIV_BIB)
+
+
+def test_normalize_title():
+    assert normalize_title("{BERT}: Pre-training of \\emph{Deep} Transformers.") == "bert pre training of deep transformers"
+    assert normalize_title("Über Parsing") == "uber parsing"
+
+
+def test_cache_is_invalidated_when_index_is_rebuilt(tmp_path, monkeypatch):
+    from bibtex.simplify import FormatCache, iter_simplified_bibtex_entries
+
+    output = str(tmp_path / "index.bin")
+    write_index(output, [])
+    monkeypatch.setenv("PUBLISHED_INDEX_PATH", output)
+    cache = FormatCache()
+    assert 'journal = "arXiv:1810.04805"' in "".join(iter_simplified_bibtex_entries(ARXIV_BIB, cache=cache))
+
+    # 同じパスに作り直した索引は開き直し、キャッシュの結果も使わない
+    dblp = tmp_path / "dblp.xml"
+    dblp.write_bytes(DBLP_XML.encode("latin-1"))
+    anthology = tmp_path / "anthology.bib"
+    anthology.write_text(ANTHOLOGY_BIB, encoding="utf-8")
+    rebuilt = str(tmp_path / "rebuilt.bin")
+    build_index([str(dblp), str(anthology)], rebuilt)
+    os.replace(rebuilt, output)
+    result = "".join(iter_simplified_bibtex_entries(ARXIV_BIB, cache=cache))
+    assert 'pages = "4171--4186"' in result
+    assert "arXiv" not in result
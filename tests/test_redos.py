@@ -0,0 +1,54 @@
+import time
+
+import pytest
+from bibtexparser.model import Entry, Field
+
+from bibtex.latex_lexer import lex
+from bibtex.middleware.formatter import BibTeXFormatterMiddleware
+from bibtex.middleware.title_formatter import TitleFormatterMiddleware
+from slack_handler import _strip_code_fences
+from tools.redos_benchmark import ADVERSARIAL_INPUTS, TARGETS
+
+
+@pytest.mark.parametrize("input_name, make", ADVERSARIAL_INPUTS)
+def test_adversarial_inputs_finish_quickly(input_name, make):
+    text = make(50000)
+    for target_name, func in TARGETS:
+        started = time.perf_counter()
+        func(text)
+        assert time.perf_counter() - started < 1.0, (target_name, input_name)
+
+
+def test_unclosed_braces_are_text():
+    lexed = lex.__wrapped__("{{a} {b")
+    assert "".join(token.text for token in lexed.tokens) == "{{a} {b"
+    assert [token.kind for token in lexed.tokens] == ["text", "group", "text"]
+
+
+def test_strip_code_fences():
+    assert _strip_code_fences("-s ```@a{b}``` x") == "-s @a{b} x"
+    assert _strip_code_fences("``````a```") == "```a"
+    assert _strip_code_fences("```a``` ```b") == "a ```b"
+
+
+def test_process_venue_text_with_nested_parens():
+    formatter = BibTeXFormatterMiddleware()
+    # 閉じていない括弧は略称に含めない
+    assert formatter.process_venue_text("Findings of ACL (Findings (EMNLP 2020)") == ("Findings of ACL (Findings", "EMNLP")
+    assert formatter.process_venue_text("Proc. of ACL, Vol. 1: Long Papers\n(x)") == ("Proc. of ACL", None)
+
+
+def test_overlong_fields_are_left_as_is():
+    warnings = []
+    long_venue = "Conference " * 200
+    entry = Entry("inproceedings", "key", [Field("booktitle", long_venue)])
+    BibTeXFormatterMiddleware(warning_callback=warnings.append)._add_abbreviated_fields(entry)
+    assert entry.fields_dict["booktitle"].value == long_venue
+    assert "booktitle が長すぎる" in warnings[0]
+
+    warnings = []
+    long_title = "a study of " * 300
+    entry = Entry("article", "key", [Field("title", long_title)])
+    TitleFormatterMiddleware(warning_callback=warnings.append).transform_entry(entry)
+    assert entry.fields_dict["title"].value == long_title
+    assert "タイトルが長すぎる" in warnings[0]
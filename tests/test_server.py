@@ -0,0 +1,142 @@
+import hashlib
+import hmac
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+from slack_sdk.signature import SignatureVerifier
+
+import lambda_function
+from server import WorkerPool, make_request_handler
+
+SECRET = "test-secret"
+
+
+def sign(body, timestamp):
+    basestring = f"v0:{timestamp}:{body}".encode("utf-8")
+    return "v0=" + hmac.new(SECRET.encode("utf-8"), basestring, hashlib.sha256).hexdigest()
+
+
+@pytest.fixture
+def running_server():
+    """ワーカーの処理を差し替えたサーバーを起動する"""
+    processed = []
+    release = threading.Event()
+    release.set()
+
+    def handler(event_data):
+        release.wait(5)
+        processed.append(event_data)
+
+    pool = WorkerPool(handler, workers=1, queue_size=1)
+    pool.start()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), make_request_handler(pool))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    with patch.object(lambda_function, "signature_verifier", SignatureVerifier(SECRET)):
+        yield f"http://127.0.0.1:{httpd.server_address[1]}", pool, processed, release
+    httpd.shutdown()
+    httpd.server_close()
+    release.set()
+    pool.shutdown(timeout=5)
+
+
+def request(url, body=None, headers=None):
+    data = body.encode("utf-8") if body is not None else None
+    req = urllib.request.Request(url, data=data, headers=headers or {})
+    try:
+        with urllib.request.urlopen(req, timeout=5) as response:
+            return response.status, response.read().decode("utf-8")
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode("utf-8")
+
+
+def post_event(base_url, payload):
+    body = json.dumps(payload)
+    timestamp = str(int(time.time()))
+    headers = {
+        "Content-Type": "application/json",
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": sign(body, timestamp),
+    }
+    return request(f"{base_url}/slack/events", body, headers)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_healthz_and_metrics(running_server):
+    base_url, _, _, _ = running_server
+    assert request(f"{base_url}/healthz") == (200, "OK")
+    status, body = request(f"{base_url}/metrics")
+    assert status == 200
+    assert "bib_bot_queue_depth 0" in body
+
+
+def test_url_verification(running_server):
+    base_url, _, _, _ = running_server
+    assert post_event(base_url, {"type": "url_verification", "challenge": "abc"}) == (200, "abc")
+
+
+def test_invalid_signature(running_server):
+    base_url, _, _, _ = running_server
+    headers = {"X-Slack-Request-Timestamp": str(int(time.time())), "X-Slack-Signature": "v0=invalid"}
+    status, _ = request(f"{base_url}/slack/events", "{}", headers)
+    assert status == 401
+
+
+def test_event_is_processed_by_worker(running_server):
+    base_url, pool, processed, _ = running_server
+    payload = {"type": "event_callback", "event": {"type": "message", "text": "hi"}}
+    assert post_event(base_url, payload) == (200, "OK")
+    assert wait_until(lambda: processed == [payload])
+    assert wait_until(lambda: pool.metrics.events_processed_total == 1)
+
+
+def test_queue_full_returns_503(running_server):
+    base_url, pool, processed, release = running_server
+    release.clear()
+    payload = {"type": "event_callback", "event": {"type": "message"}}
+    # 1件目はワーカーが処理中、2件目はキューで待機、3件目はあふれる
+    assert post_event(base_url, payload)[0] == 200
+    assert wait_until(lambda: pool.metrics.busy_workers == 1)
+    assert post_event(base_url, payload)[0] == 200
+    assert post_event(base_url, payload)[0] == 503
+    release.set()
+    assert wait_until(lambda: len(processed) == 2)
+
+
+def test_shutdown_drains_queue():
+    processed = []
+    pool = WorkerPool(processed.append, workers=2, queue_size=10)
+    pool.start()
+    for i in range(5):
+        assert pool.submit({"id": i})
+    pool.shutdown(timeout=5)
+
+    assert sorted(e["id"] for e in processed) == [0, 1, 2, 3, 4]
+    # 停止後は受け付けない
+    assert not pool.submit({"id": 5})
+
+
+def test_deferred_job_runs_on_worker():
+    processed = []
+    pool = WorkerPool(processed.append, workers=1, queue_size=10)
+    pool.start()
+    assert pool.defer(lambda: processed.append("deferred"))
+    assert pool.submit({"id": 1})
+    pool.shutdown(timeout=5)
+
+    assert processed == ["deferred", {"id": 1}]
+    # 積み直した処理は新しいイベントとして数えない
+    assert pool.metrics.events_enqueued_total == 1
+    assert not pool.defer(lambda: None)
@@ -1,4 +1,7 @@
-from bibtex.simplify import simplify_bibtex_entry
+import bibtexparser
+import bibtex.simplify
+
+from bibtex.simplify import FormatCache, simplify_bibtex_entry, iter_simplified_bibtex_entries
 
 def test_simplify_bibtex_entry():
     raw_bib = """% word2vec
@@ -367,4 +370,76 @@ def test_brace_colon():
 }
 """
     simplified_bib = simplify_bibtex_entry(raw_bib, abbreviation_mode="both")
-    assert simplified_bib == expected_simplified_bib
\ No newline at end of file
+    assert simplified_bib == expected_simplified_bib
+
+def test_iter_simplified_bibtex_entries_matches_simplify():
+    raw_bib = """% first
+@article{a,
+    title = {first paper},
+    journal = {Computational Linguistics},
+    year = {2020}
+}
+attached comment
+
+@misc{b,
+    title = {second paper},
+    year = {2021},
+    eprint = {2101.00001},
+    archivePrefix = {arXiv},
+}"""
+    pieces = list(iter_simplified_bibtex_entries(raw_bib))
+
+    # エントリごとに分割され、連結すると一括整形の結果と一致する
+    assert len(pieces) == 2
+    assert "attached comment" in pieces[0]
+    assert "".join(pieces) == simplify_bibtex_entry(raw_bib)
+
+
+def test_iter_simplified_bibtex_entries_reuses_cache(monkeypatch):
+    raw_bib = """@article{a,
+    title = {first paper},
+    journal = {Unknown Journal of Things},
+    year = {2020}
+}
+
+@misc{b,
+    title = {second paper},
+    year = {2021},
+}"""
+    cache = FormatCache()
+    warnings = []
+    expected = "".join(iter_simplified_bibtex_entries(raw_bib, warning_callback=warnings.append, cache=cache))
+    assert len(cache) == 2
+    assert warnings
+
+    edited = raw_bib.replace("second paper", "second edited paper")
+    edited_expected = simplify_bibtex_entry(edited)
+
+    calls = []
+    original_write_string = bibtexparser.write_string
+
+    def counting_write_string(library, *args, **kwargs):
+        calls.append([entry.key for entry in library.entries])
+        return original_write_string(library, *args, **kwargs)
+
+    monkeypatch.setattr(bibtexparser, "write_string", counting_write_string)
+
+    # 同じ入力はキャッシュから返し、警告も同じものを通知する
+    replayed = []
+    assert "".join(iter_simplified_bibtex_entries(raw_bib, warning_callback=replayed.append, cache=cache)) == expected
+    assert calls == []
+    assert replayed == warnings
+
+    # 変更したエントリだけ整形し直す
+    result = "".join(iter_simplified_bibtex_entries(edited, cache=cache))
+    assert calls == [["b"]]
+    assert result == edited_expected
+
+    # abbreviation_mode が違えば別の結果として扱う
+    "".join(iter_simplified_bibtex_entries(raw_bib, abbreviation_mode="short", cache=cache))
+    assert calls[1:] == [["a"], ["b"]]
+
+    # Venue名辞書が更新されたら整形し直す
+    monkeypatch.setattr(bibtex.simplify, "venue_dict_version", lambda: "new-version")
+    "".join(iter_simplified_bibtex_entries(raw_bib, cache=cache))
+    assert calls[3:] == [["a"], ["b"]]
@@ -0,0 +1,141 @@
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import slack_files
+from slack_files import download_file, find_bib_files, formatted_filename
+from slack_handler import handle_message
+
+BIB = b"""@article{key,
+    title = {an interesting paper},
+    author = {Author Name},
+    journal = {Computational Linguistics},
+    year = {2024}
+}
+"""
+
+
+class FakeFileHandler(BaseHTTPRequestHandler):
+    """Slack のファイル配信を模したハンドラ"""
+
+    def do_GET(self):
+        if self.headers.get("Authorization") != "Bearer xoxb-test":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.end_headers()
+            self.wfile.write(b"<html>login</html>")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.end_headers()
+        self.wfile.write(BIB)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def file_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeFileHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def make_file_info(base_url, name="refs.bib", size=len(BIB)):
+    return {"name": name, "size": size, "url_private_download": f"{base_url}/files/{name}"}
+
+
+def test_find_bib_files():
+    event = {"files": [{"name": "refs.bib"}, {"name": "image.png"}, {"name": "x", "filetype": "bib"}]}
+    assert [f["name"] for f in find_bib_files(event)] == ["refs.bib", "x"]
+    assert find_bib_files({}) == []
+
+
+def test_formatted_filename():
+    assert formatted_filename("refs.bib") == "refs_formatted.bib"
+    assert formatted_filename(".bib") == "result_formatted.bib"
+    assert formatted_filename("../../etc/evil.bib") == "evil_formatted.bib"
+    assert formatted_filename("/tmp/abs.bib") == "abs_formatted.bib"
+    assert formatted_filename("a\\b.bib") == "b_formatted.bib"
+
+
+def test_download_file(file_server):
+    dest = io.BytesIO()
+    size = download_file(make_file_info(file_server), "xoxb-test", dest, allowed_hosts=("127.0.0.1",))
+    assert size == len(BIB)
+    assert dest.getvalue() == BIB
+
+
+def test_download_file_rejects_unknown_host(file_server):
+    with pytest.raises(ValueError, match="許可されていません"):
+        download_file(make_file_info(file_server), "xoxb-test", io.BytesIO())
+
+
+def test_download_file_rejects_large_file(file_server):
+    with pytest.raises(ValueError, match="大きすぎます"):
+        download_file(make_file_info(file_server), "xoxb-test", io.BytesIO(), max_size=10, allowed_hosts=("127.0.0.1",))
+
+
+def test_download_file_invalid_token(file_server):
+    with pytest.raises(ValueError, match="ダウンロードできませんでした"):
+        download_file(make_file_info(file_server), "xoxb-wrong", io.BytesIO(), allowed_hosts=("127.0.0.1",))
+
+
+def test_handle_message_with_bib_file(file_server):
+    client = MagicMock()
+    client.token = "xoxb-test"
+    client.auth_test.return_value = {"user_id": "UBOT"}
+    uploaded = {}
+
+    def files_upload_v2(channel, file, filename, **kwargs):
+        with open(file, encoding="utf-8") as f:
+            uploaded["content"] = f.read()
+        uploaded["filename"] = filename
+
+    client.files_upload_v2.side_effect = files_upload_v2
+    event = {
+        "channel": "D123",
+        "user": "U123",
+        "text": "-l",
+        "files": [make_file_info(file_server)],
+    }
+    messages = []
+
+    with patch.object(slack_files, "SLACK_FILE_HOSTS", ("127.0.0.1",)):
+        handle_message(event, messages.append, client)
+
+    assert uploaded["filename"] == "refs_formatted.bib"
+    assert "title = {{An Interesting Paper}}" in uploaded["content"]
+    assert 'journal = "Computational Linguistics"' in uploaded["content"]
+    assert messages == []
+
+
+def test_handle_bib_file_writes_inside_tmpdir(file_server, tmp_path):
+    client = MagicMock()
+    client.token = "xoxb-test"
+    client.auth_test.return_value = {"user_id": "UBOT"}
+    uploaded = {}
+
+    def files_upload_v2(channel, file, filename, **kwargs):
+        uploaded["file"] = file
+        uploaded["filename"] = filename
+
+    client.files_upload_v2.side_effect = files_upload_v2
+    file_info = make_file_info(file_server)
+    file_info["name"] = str(tmp_path / "a" / "b.bib")
+    event = {"channel": "D123", "user": "U123", "text": "", "files": [file_info]}
+    messages = []
+
+    with patch.object(slack_files, "SLACK_FILE_HOSTS", ("127.0.0.1",)):
+        handle_message(event, messages.append, client)
+
+    assert uploaded["filename"] == "b_formatted.bib"
+    assert not uploaded["file"].startswith(str(tmp_path))
+    assert list(tmp_path.iterdir()) == []
+    assert messages == []
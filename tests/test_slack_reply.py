@@ -0,0 +1,198 @@
+import random
+import threading
+import time
+
+from slack_reply import AsyncReplier, ProgressiveReply, ReplyHistory, split_result_chunks
+
+
+class FakeClient:
+    """到着順に ts を採番する Slack クライアントのスタブ"""
+
+    def __init__(self, latency=0.0, fail_times=0):
+        self.latency = latency
+        self.fail_times = fail_times
+        self.messages = {}
+        self.posts = []
+        self.updates = []
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def chat_postMessage(self, channel, text, **kwargs):
+        if self.latency:
+            time.sleep(random.uniform(0, self.latency))
+        with self._lock:
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise ConnectionError("temporary failure")
+            self._counter += 1
+            ts = f"1700000000.{self._counter:06d}"
+            self.messages[ts] = text
+            self.posts.append({"channel": channel, "text": text, **kwargs})
+        return {"ok": True, "ts": ts}
+
+    def chat_update(self, channel, ts, text, **kwargs):
+        with self._lock:
+            self.messages[ts] = text
+            self.updates.append(ts)
+        return {"ok": True, "ts": ts}
+
+    def chat_delete(self, channel, ts, **kwargs):
+        with self._lock:
+            del self.messages[ts]
+        return {"ok": True, "ts": ts}
+
+    def thread_texts(self):
+        return [self.messages[ts] for ts in sorted(self.messages)]
+
+
+def make_entries(n):
+    return "\n".join(
+        f"% entry {i}\n@article{{key{i},\n    title = {{{{Title {i}}}}},\n    year = \"2024\",\n}}\n" for i in range(n)
+    )
+
+
+def test_split_result_chunks_short_text():
+    assert split_result_chunks("@article{a,\n}", max_length=100) == ["@article{a,\n}"]
+
+
+def test_split_result_chunks_at_entry_boundaries():
+    text = make_entries(20)
+    chunks = split_result_chunks(text, max_length=200)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    # 分割しても元の文字列に戻せる
+    assert "\n".join(chunks) == text
+    # コメントはエントリと同じチャンクに残る
+    for chunk in chunks:
+        assert chunk.lstrip("\n").startswith("% entry")
+
+
+def test_split_result_chunks_oversized_entry():
+    text = "@article{key,\n" + "    abstract = \"" + "x" * 500 + "\",\n}"
+    chunks = split_result_chunks(text, max_length=100)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+
+
+def test_flush_posts_result_and_warnings():
+    client = FakeClient()
+    say = AsyncReplier(client, "C123", thread_ts="1.0")
+    say("警告1")
+    say("警告2")
+    say("```@article{a,\n}```")
+    say.flush()
+
+    texts = sorted(post["text"] for post in client.posts)
+    assert texts == ["```@article{a,\n}```", "警告1\n\n警告2"]
+    assert all(post["thread_ts"] == "1.0" for post in client.posts)
+
+
+def test_flush_keeps_chunk_order():
+    random.seed(0)
+    client = FakeClient(latency=0.02)
+    say = AsyncReplier(client, "D123", max_length=200)
+    text = make_entries(30)
+    say(f"```{text}```")
+    say.flush()
+
+    texts = client.thread_texts()
+    assert len(texts) > 1
+    assert "\n".join(t.strip("`") for t in texts) == text
+
+
+def test_flush_retries_failed_post():
+    client = FakeClient(fail_times=1)
+    say = AsyncReplier(client, "D123", retry_interval=0)
+    say("```@article{a,\n}```")
+    say.flush()
+
+    assert client.thread_texts() == ["```@article{a,\n}```"]
+
+
+def test_flush_without_messages_does_nothing():
+    client = FakeClient()
+    AsyncReplier(client, "D123").flush()
+    assert client.posts == []
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_progressive_reply_posts_first_entry_immediately():
+    client = FakeClient()
+    clock = FakeClock()
+    stream = ProgressiveReply(client, "C123", thread_ts="1.0", update_interval=1.0, clock=clock)
+
+    stream.append("@article{a,\n}\n")
+    # 最初のエントリはすぐに投稿される
+    assert client.thread_texts() == ["```@article{a,\n}\n```"]
+    assert client.posts[0]["thread_ts"] == "1.0"
+
+    # 更新間隔内の追記はまとめられる
+    stream.append("\n@article{b,\n}\n")
+    assert client.updates == []
+
+    clock.now = 2.0
+    stream.append("\n@article{c,\n}\n")
+    assert len(client.updates) == 1
+    assert client.thread_texts() == ["```@article{a,\n}\n\n@article{b,\n}\n\n@article{c,\n}\n```"]
+
+
+def test_progressive_reply_close_flushes_pending_update():
+    client = FakeClient()
+    stream = ProgressiveReply(client, "D123", update_interval=60, clock=FakeClock())
+    stream.append("@article{a,\n}\n")
+    stream.append("\n@article{b,\n}\n")
+    stream.close()
+
+    assert client.thread_texts() == ["```@article{a,\n}\n\n@article{b,\n}\n```"]
+
+
+def test_progressive_reply_splits_at_entry_boundaries():
+    client = FakeClient()
+    stream = ProgressiveReply(client, "D123", max_length=200, update_interval=0, clock=FakeClock())
+    text = make_entries(20)
+    for piece in text.split("\n% "):
+        stream.append(piece if piece.startswith("%") else "\n% " + piece)
+    stream.close()
+
+    texts = client.thread_texts()
+    assert len(texts) > 1
+    assert all(len(t) <= 200 + 6 for t in texts)
+    assert all(t.strip("`").startswith("% entry") for t in texts)
+    assert stream.posted_ts == sorted(client.messages)
+
+
+def test_progressive_reply_replace_rewrites_previous_messages():
+    client = FakeClient()
+    first = ProgressiveReply(client, "D123", max_length=200, update_interval=0, clock=FakeClock())
+    first.append(make_entries(10))
+    first.close()
+    assert len(first.posted_ts) > 1
+
+    # 編集後は以前のメッセージを書き換え、余ったものは削除する
+    second = ProgressiveReply(client, "D123", max_length=200, update_interval=0, clock=FakeClock())
+    second.replace(first.posted_ts)
+    second.append("@article{edited,\n}\n")
+    second.close()
+
+    assert len(client.posts) == len(first.posted_ts)
+    assert second.posted_ts == first.posted_ts[:1]
+    assert client.thread_texts() == ["```@article{edited,\n}\n```"]
+
+
+def test_reply_history_evicts_oldest():
+    history = ReplyHistory(max_entries=2)
+    history.record("C1", "1.0", ["1.1"])
+    history.record("C1", "2.0", ["2.1", "2.2"])
+    history.record("C1", "3.0", ["3.1"])
+
+    assert history.get("C1", "1.0") == []
+    assert history.get("C1", "2.0") == ["2.1", "2.2"]
+    history.record("C1", "2.0", [])
+    assert history.get("C1", "2.0") == []
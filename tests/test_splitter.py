@@ -0,0 +1,68 @@
+from bibtexparser.splitter import Splitter
+from bibtexparser.model import Entry, ExplicitComment, ImplicitComment, ParsingFailedBlock, String
+
+from bibtex.splitter import SpanSplitter, open_mapped, parse_buffer
+
+
+RAW = """% 日本語のコメント
+@string{acl = "Association for Computational Linguistics"}
+@inproceedings{müller-2020,
+    title = {Über {BERT}},
+    author = "Müller, Jörg",
+    year = 2020,
+}
+
+@comment{ignored}
+@article{broken,
+    title = {Unclosed
+@misc{last, title = "Last"}
+"""
+
+
+def _summary(library):
+    result = []
+    for block in library.blocks:
+        if isinstance(block, Entry):
+            result.append((block.entry_type, block.key, [(f.key, f.value) for f in block.fields], block.start_line))
+        elif isinstance(block, ImplicitComment):
+            result.append(("implicit", block.comment, block.start_line))
+        elif isinstance(block, ParsingFailedBlock):
+            result.append(("failed", block.start_line))
+        elif isinstance(block, String):
+            result.append(("string", block.key, block.value))
+        elif isinstance(block, ExplicitComment):
+            result.append(("comment", block.comment, block.start_line))
+    return result
+
+
+def test_same_blocks_as_bibtexparser():
+    expected = Splitter(RAW).split()
+    assert _summary(SpanSplitter(RAW).split()) == _summary(expected)
+
+
+def test_raw_is_sliced_on_demand():
+    library = SpanSplitter(RAW).split()
+    entry = library.entries[0]
+    assert entry._raw is None
+    assert entry.raw == RAW[RAW.index("@inproceedings"):RAW.index("}\n\n@comment") + 1]
+    assert library.failed_blocks[0].raw.startswith("@article{broken")
+
+
+def test_mmap_with_bom(tmp_path):
+    path = tmp_path / "refs.bib"
+    path.write_bytes(b"\xef\xbb\xbf" + RAW.encode("utf-8"))
+    buffer = open_mapped(str(path))
+    try:
+        library = parse_buffer(buffer, parse_stack=[])
+        assert _summary(library) == _summary(Splitter(RAW).split())
+        assert library.entries[0].raw.startswith("@inproceedings{müller-2020,")
+        assert library.blocks[0].comment == "% 日本語のコメント"
+    finally:
+        del library
+        buffer.close()
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty.bib"
+    path.write_bytes(b"")
+    assert open_mapped(str(path)) == b""
@@ -18,7 +18,8 @@ def test_latex_title_preserves_braces_and_uses_quotes():
     assert "{Title}" in result
     
     # 2. 期待される挙動: ダブルクォートで囲まれている ({{...}} ではなく "...")
-    assert 'title = "A {Title} with {\\a} LaTeX command"' in result
+    # LaTeX コマンド以外の部分は Title Case に整形される
+    assert 'title = "A {Title} with {\\a} {LaTeX} Command"' in result
     assert 'title = {{' not in result
 
 def test_normal_title_removes_braces_and_uses_double_braces():
@@ -127,4 +128,16 @@ def test_title_single_word_with_numbers():
     result = simplify_bibtex_entry(raw_bib)
     
     # 期待される挙動: "COVID-19" が保護されている
-    assert "title = {{COVID-19: A Global Challenge}}" in result
\ No newline at end of file
+    assert "title = {{COVID-19: A Global Challenge}}" in result
+
+def test_non_english_title_is_not_title_cased():
+    raw_bib = """@inproceedings{test,
+    title = {une {\\'e}tude des mod{\\`e}les de langue},
+    booktitle = {Conference},
+    year = {2024},
+    language = {fra}
+}"""
+
+    result = simplify_bibtex_entry(raw_bib)
+
+    assert 'title = "une {\\\'e}tude des mod{\\`e}les de langue"' in result
@@ -0,0 +1,63 @@
+import json
+
+from venue_misses import SpaceSaving, VenueMissRecorder
+
+
+def test_space_saving_keeps_heavy_hitters():
+    sketch = SpaceSaving(10)
+    for item in ["a"] * 50 + ["b"] * 30 + [f"rare{i}" for i in range(100)] + ["c"] * 20:
+        sketch.add(item)
+    # 全体の 1/10 より多く現れた項目は必ず残る
+    assert len(sketch) == 10
+    counts = {item: (count, error) for item, count, error in sketch.top()}
+    assert "a" in counts and "b" in counts
+    # 回数は過大に見積もることはあっても、誤差の上限を引けば真の回数以下になる
+    for item, true_count in {"a": 50, "b": 30}.items():
+        count, error = counts[item]
+        assert count - error <= true_count <= count
+
+
+def test_flush_merges_into_file(tmp_path):
+    now = [0.0]
+    path = tmp_path / "misses.json"
+    recorder = VenueMissRecorder(capacity=10, min_count=2, flush_interval=60, path=str(path), clock=lambda: now[0])
+    for _ in range(3):
+        recorder.record("Workshop  on Obscure Things", is_booktitle=True)
+    recorder.record("Journal of One-Off Results", is_booktitle=False)
+    assert not path.exists()
+
+    now[0] = 61
+    recorder.record("Workshop on Obscure Things", is_booktitle=True)
+    assert json.loads(path.read_text(encoding="utf-8")) == [
+        {"name": "Workshop on Obscure Things", "kind": "booktitle", "count": 4},
+    ]
+
+    for _ in range(2):
+        recorder.record("Workshop on Obscure Things", is_booktitle=True)
+    recorder.flush()
+    assert json.loads(path.read_text(encoding="utf-8"))[0]["count"] == 6
+
+
+def test_maybe_flush_after_interval(tmp_path):
+    now = [0.0]
+    path = tmp_path / "misses.json"
+    recorder = VenueMissRecorder(capacity=10, min_count=2, flush_interval=60, path=str(path), clock=lambda: now[0])
+    for _ in range(2):
+        recorder.record("Workshop on Obscure Things", is_booktitle=True)
+    recorder.maybe_flush()
+    assert not path.exists()
+
+    # 新しい名前が記録されなくても、間隔が過ぎていれば書き出す
+    now[0] = 61
+    recorder.maybe_flush()
+    assert json.loads(path.read_text(encoding="utf-8"))[0]["count"] == 2
+
+
+def test_build_short_venue_records_misses(monkeypatch):
+    from bibtex.middleware import formatter
+    recorder = VenueMissRecorder(min_count=1, flush_interval=1e9)
+    monkeypatch.setattr(formatter, "venue_miss_recorder", recorder)
+    middleware = formatter.BibTeXFormatterMiddleware()
+    assert middleware.build_short_venue("Proceedings of the Workshop on Obscure Things") == "WOT"
+    middleware.build_short_venue("Proceedings of the 2014 Conference on Empirical Methods in Natural Language Processing")
+    assert recorder.snapshot() == [{"name": "Workshop on Obscure Things", "kind": "booktitle", "count": 1}]
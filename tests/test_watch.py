@@ -0,0 +1,114 @@
+import os
+import stat
+
+from bibtex.simplify import parse_library
+from tools.watch import Manifest, format_file, manifest_path, split_blocks
+
+
+ENTRY = """@inproceedings{pennington-2014-glove,
+    title = "GloVe: global vectors for word representation",
+    author = "Pennington, Jeffrey",
+    booktitle = "Proceedings of the 2014 Conference on Empirical Methods in Natural Language Processing (EMNLP)",
+    year = "2014",
+}
+"""
+
+
+def test_split_blocks_round_trip():
+    text = "% header\n@misc{a, title={A}}\n% note\n\n@misc{b, title={B}}"
+    segments = split_blocks(text, parse_library(text))
+    assert "".join(segment for segment, _ in segments) == text
+    assert [segment.split("\n")[0] for segment, _ in segments] == ["% header", "@misc{a, title={A}}", "@misc{b, title={B}}"]
+    assert [block.key if block else None for _, block in segments] == [None, "a", "b"]
+
+
+def test_only_changed_entries_are_reformatted(tmp_path):
+    path = tmp_path / "refs.bib"
+    path.write_text("% my thesis\n" + ENTRY + "\n" + ENTRY.replace("pennington-2014-glove", "other"), encoding="utf-8")
+
+    counts = format_file(str(path), log=lambda message: None)
+    assert counts == {"segments": 3, "formatted": 2, "reused": 0}
+    formatted = path.read_text(encoding="utf-8")
+    assert formatted.startswith("% my thesis\n@inproceedings{pennington-2014-glove,\n")
+    assert "Proc. of EMNLP" in formatted
+    assert os.path.exists(manifest_path(str(path)))
+
+    # 書き戻したファイルは整形し直さず、書き込みもしない
+    mtime = path.stat().st_mtime_ns
+    assert format_file(str(path), log=lambda message: None)["formatted"] == 0
+    assert path.stat().st_mtime_ns == mtime
+
+    path.write_text(formatted.replace("{other,", "{other2,"), encoding="utf-8")
+    manifest = Manifest(manifest_path(str(path)), "both")
+    assert format_file(str(path), manifest=manifest, log=lambda message: None)["formatted"] == 1
+    assert "{other2," in path.read_text(encoding="utf-8")
+
+
+def test_broken_entry_is_kept(tmp_path):
+    path = tmp_path / "refs.bib"
+    path.write_text("@misc{broken,\n title = {Unclosed\n", encoding="utf-8")
+    messages = []
+    format_file(str(path), log=messages.append)
+    assert path.read_text(encoding="utf-8") == "@misc{broken,\n title = {Unclosed\n"
+    assert messages
+
+
+def test_manifest_is_reset_when_mode_changes(tmp_path):
+    path = tmp_path / "refs.bib"
+    path.write_text(ENTRY, encoding="utf-8")
+    format_file(str(path), log=lambda message: None)
+    assert Manifest(manifest_path(str(path)), "both").entries
+    assert not Manifest(manifest_path(str(path)), "short").entries
+
+
+def test_string_references_are_resolved_across_file(tmp_path):
+    path = tmp_path / "refs.bib"
+    path.write_text(
+        '@string{emnlp = "Proceedings of the 2014 Conference on Empirical Methods in Natural Language Processing (EMNLP)"}\n\n'
+        + ENTRY.replace('"Proceedings of the 2014 Conference on Empirical Methods in Natural Language Processing (EMNLP)"', "emnlp"),
+        encoding="utf-8",
+    )
+    messages = []
+    format_file(str(path), log=messages.append)
+    formatted = path.read_text(encoding="utf-8")
+    assert formatted.startswith('@string{emnlp = "Proceedings')
+    assert "Proc. of EMNLP" in formatted
+    assert messages == []
+
+    # @string の定義が変わったら、参照しているエントリも整形し直す
+    path.write_text(formatted.replace("2014 Conference on Empirical", "2015 Conference on Empirical", 1), encoding="utf-8")
+    assert format_file(str(path), log=messages.append)["formatted"] == 1
+
+
+def test_file_permissions_are_kept(tmp_path):
+    path = tmp_path / "refs.bib"
+    path.write_text(ENTRY + "% keep this note\n\n" + ENTRY.replace("pennington-2014-glove", "other"), encoding="utf-8")
+    os.chmod(path, 0o644)
+    format_file(str(path), log=lambda message: None)
+    formatted = path.read_text(encoding="utf-8")
+    assert "Proc. of EMNLP" in formatted
+    # エントリの後ろのコメントと空行は書かれたまま残す
+    assert '}\n% keep this note\n\n@inproceedings{other,' in formatted
+    assert stat.S_IMODE(path.stat().st_mode) == 0o644
+
+
+def test_manifest_is_reset_when_resources_change(tmp_path, monkeypatch):
+    import tools.watch
+
+    path = tmp_path / "refs.bib"
+    path.write_text(ENTRY, encoding="utf-8")
+    # 監視中と同じように、1つのマニフェストを使い続ける
+    manifest = Manifest(manifest_path(str(path)), "both")
+    assert format_file(str(path), manifest=manifest, log=lambda message: None)["formatted"] == 1
+    assert format_file(str(path), manifest=manifest, log=lambda message: None)["formatted"] == 0
+
+    # 略称辞書が更新されたら整形し直す
+    monkeypatch.setattr(tools.watch, "venue_dict_version", lambda: "new-dict")
+    assert format_file(str(path), manifest=manifest, log=lambda message: None)["formatted"] == 1
+    assert format_file(str(path), manifest=manifest, log=lambda message: None)["formatted"] == 0
+
+    # 出版版の索引が作り直されたら整形し直す
+    monkeypatch.setattr(tools.watch, "published_index_version", lambda: "new-index")
+    assert format_file(str(path), manifest=manifest, log=lambda message: None)["formatted"] == 1
+    # 変わった後の設定はマニフェストファイルにも残る
+    assert Manifest(manifest_path(str(path)), "both").settings["published_index"] == "new-index"
@@ -0,0 +1,155 @@
+# tools/build_published_index.py
+"""
+DBLP の XML ダンプや ACL Anthology の BibTeX から、arXiv論文の出版版を引く索引を作る。
+
+    python -m tools.build_published_index dblp.xml.gz anthology.bib.gz -o published_index.bin --venue "ACL|EMNLP|NAACL"
+
+- 出版版（会議・論文誌）のレコードは、正規化したタイトルをキーにする
+- arXiv のレコード（DBLP の CoRR、eprint のある BibTeX）は、タイトルが一致する出版版に arXiv ID のキーを張る
+- 同じタイトルの出版版が複数のファイルにある場合は、後に指定したファイルのものを使う
+  （DBLP の会議名は略称なので、正式名称を使いたい場合は Anthology を後に指定する）
+
+作った索引は環境変数 PUBLISHED_INDEX_PATH で指定する。
+"""
+
+import argparse
+import gzip
+import re
+from typing import Iterator
+
+import bibtexparser
+
+from bibtex.published_index import arxiv_index_key, normalize_title, title_index_key, write_index
+from tools.dblp import iter_dblp_records
+
+_ARXIV_URL = re.compile(r"arxiv\.org/abs/([^\s?#/]+(?:/\d+)?)", re.I)
+_DOI_URL = re.compile(r"^https?://(?:dx\.)?doi\.org/(.+)$", re.I)
+_PAGE_RANGE = re.compile(r"\s*[-–]+\s*")
+# BibTeX ダンプを何エントリずつまとめてパースするか
+BIB_CHUNK_ENTRIES = 1000
+
+
+def _published_fields(entry_type: str, venue_key: str, venue: str, year: str, pages: str, url: str, doi: str) -> dict[str, str]:
+    fields = {"entry_type": entry_type, venue_key: venue}
+    if year:
+        fields["year"] = year
+    if pages:
+        fields["pages"] = _PAGE_RANGE.sub("--", pages)
+    if url:
+        fields["url"] = url
+    if doi:
+        fields["doi"] = doi
+    return fields
+
+
+def iter_dblp_items(path: str) -> Iterator[tuple[str, str, dict[str, str] | str]]:
+    """DBLP のレコードを ("published", タイトル, フィールド) または ("arxiv", タイトル, arXiv ID) で返す。"""
+    for record in iter_dblp_records(path):
+        title = record.get("title", "").rstrip(".")
+        if not title:
+            continue
+        ees = record.get("ee", [])
+        if record["type"] == "article" and record.get("journal") == "CoRR":
+            for ee in ees:
+                if match := _ARXIV_URL.search(ee):
+                    yield "arxiv", title, match.group(1)
+                    break
+            continue
+        if record["type"] == "inproceedings":
+            venue_key, venue = "booktitle", record.get("booktitle", "")
+        elif record["type"] == "article":
+            venue_key, venue = "journal", record.get("journal", "")
+        else:
+            continue
+        doi = next((m.group(1) for ee in ees if (m := _DOI_URL.match(ee))), "")
+        url = ees[0] if ees else ""
+        yield "published", title, _published_fields(
+            record["type"], venue_key, venue, record.get("year", ""), record.get("pages", ""), url, doi
+        )
+
+
+def iter_bib_chunks(path: str) -> Iterator[str]:
+    """BibTeX ファイルを、行頭の @ で区切ったエントリ BIB_CHUNK_ENTRIES 件ずつの文字列で返す。"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        lines: list[str] = []
+        count = 0
+        for line in f:
+            if line.startswith("@"):
+                count += 1
+                if count > BIB_CHUNK_ENTRIES:
+                    yield "".join(lines)
+                    lines, count = [], 1
+            lines.append(line)
+        if lines:
+            yield "".join(lines)
+
+
+def iter_bib_items(path: str) -> Iterator[tuple[str, str, dict[str, str] | str]]:
+    """BibTeX のエントリを iter_dblp_items と同じ形式で返す。"""
+    for chunk in iter_bib_chunks(path):
+        for entry in bibtexparser.parse_string(chunk).entries:
+            fields = {key.lower(): str(field.value) for key, field in entry.fields_dict.items() if field.value}
+            title = fields.get("title", "")
+            if not title:
+                continue
+            eprint = fields.get("eprint")
+            if eprint and fields.get("archiveprefix", "").lower() == "arxiv":
+                yield "arxiv", title, eprint
+                continue
+            entry_type = entry.entry_type.lower()
+            if entry_type == "inproceedings" and fields.get("booktitle"):
+                venue_key = "booktitle"
+            elif entry_type == "article" and fields.get("journal") and not fields["journal"].lower().startswith(("arxiv", "corr")):
+                venue_key = "journal"
+            else:
+                continue
+            yield "published", title, _published_fields(
+                entry_type, venue_key, fields[venue_key], fields.get("year", ""), fields.get("pages", ""),
+                fields.get("url", ""), fields.get("doi", ""),
+            )
+
+
+def build_index(sources: list[str], output: str, venue_pattern: str | None = None) -> dict[str, int]:
+    """sources（.xml[.gz] は DBLP、.bib[.gz] は BibTeX）から索引を作り、件数を返す。"""
+    venue_re = re.compile(venue_pattern) if venue_pattern else None
+    published: dict[str, dict[str, str]] = {}
+    arxiv_titles: dict[str, str] = {}
+    for path in sources:
+        items = iter_bib_items(path) if ".bib" in path else iter_dblp_items(path)
+        for kind, title, value in items:
+            key = normalize_title(title)
+            if not key:
+                continue
+            if kind == "arxiv":
+                arxiv_titles[value] = key
+            elif venue_re is None or venue_re.search(value.get("booktitle") or value.get("journal") or ""):
+                published[key] = value
+
+    def records():
+        for key, fields in published.items():
+            yield title_index_key(key), fields
+        for arxiv_id, key in arxiv_titles.items():
+            if key in published:
+                yield arxiv_index_key(arxiv_id), published[key]
+
+    linked = sum(1 for key in arxiv_titles.values() if key in published)
+    total = write_index(output, records())
+    return {"published": len(published), "arxiv": len(arxiv_titles), "linked": linked, "records": total}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="arXiv論文の出版版を引く索引を作る")
+    parser.add_argument("sources", nargs="+", help="DBLP の XML（.xml / .xml.gz）または BibTeX（.bib / .bib.gz）")
+    parser.add_argument("-o", "--output", default="published_index.bin", help="出力する索引ファイル")
+    parser.add_argument("--venue", help="出版版として採用する会議名・論文誌名の正規表現（例: 'ACL|EMNLP'）")
+    args = parser.parse_args()
+
+    counts = build_index(args.sources, args.output, args.venue)
+    print(f"published: {counts['published']}")
+    print(f"arxiv:     {counts['arxiv']} ({counts['linked']} linked)")
+    print(f"records:   {counts['records']} -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
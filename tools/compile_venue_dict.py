@@ -0,0 +1,194 @@
+# tools/compile_venue_dict.py
+"""
+DBLP の XML ダンプや ACL Anthology のデータから、会議名・論文誌名の略称辞書を作る。
+
+    python -m tools.compile_venue_dict dblp.xml.gz acl-anthology/data/xml -o venue_abbreviations.json
+
+入力（ファイルの中身で判定する）:
+- DBLP の XML（.xml / .xml.gz）: proceedings レコードのタイトル（"..., ACL 2019, Florence, ..."）と booktitle
+- ACL Anthology の XML（data/xml のディレクトリまたはファイル）: 各巻の booktitle の "(EMNLP)" のような略称
+- BibTeX（.bib / .bib.gz）: booktitle / journal の "(EMNLP)" のような略称
+
+どの入力も一定のメモリで少しずつ読む。正式名称は BibTeXFormatterMiddleware.normalize_venue_name と
+同じ規則で正規化し、同じ名前に複数の略称があれば最も多いものを採用して、競合として報告する。
+--base の辞書（手書きの resources/venue_abbreviations.json）の項目はそのまま残し、優先する。
+--misses にボットが辞書に見つけられなかった名前の集計（venue_misses.py）を渡すと、
+作った辞書でそれらが引けるようになったかを確かめ、まだ引けない名前を回数の多い順に表示する。
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from collections import Counter, defaultdict
+from typing import Iterator
+
+import bibtexparser
+
+from bibtex.middleware.formatter import BibTeXFormatterMiddleware
+from tools.build_published_index import iter_bib_chunks
+from tools.dblp import iter_dblp_records, iter_xml_elements, open_dump
+
+# "ACL 2019" や "EMNLP-IJCNLP 2019" のような、略称と年からなる部分
+_ABBR_WITH_YEAR = re.compile(r"^([A-Z][A-Za-z0-9&/+\-]*[A-Za-z0-9])(?:[\s\-']+)(?:\d{4}|'\d{2}|\d{2})$")
+# DBLP の booktitle（"ACL (1)", "EMNLP/IJCNLP (Findings)" など）の末尾の括弧
+_BOOKTITLE_SUFFIX = re.compile(r"\s*\([^)]*\)\s*$")
+# 略称の抽出（process_venue_text）と正規化に使う
+_FORMATTER = BibTeXFormatterMiddleware()
+
+
+def _is_abbreviation(text: str) -> bool:
+    return bool(text) and len(text) <= 20 and " " not in text and any(c.isupper() for c in text[1:] or text)
+
+
+def _venue_pair(long_name: str, abbr: str | None, is_booktitle: bool = True) -> tuple[str, str] | None:
+    """正式名称と略称を辞書の (キー, 値) にする。使えない場合は None を返す。"""
+    cleaned, extracted = _FORMATTER.process_venue_text(long_name)
+    abbr = abbr or extracted
+    if not abbr or not _is_abbreviation(abbr):
+        return None
+    key = re.sub(r"\s+", " ", _FORMATTER.normalize_venue_name(cleaned, is_booktitle))
+    # 単語が1つの名前は略称と区別できないため辞書に入れない
+    if len(key.split()) < 2 or key == abbr:
+        return None
+    return key, abbr
+
+
+def iter_dblp_venues(path: str) -> Iterator[tuple[str, str]]:
+    """DBLP の proceedings レコードから (キー, 略称) を返す。"""
+    for record in iter_dblp_records(path):
+        if record["type"] != "proceedings":
+            continue
+        segments = [segment.strip() for segment in record.get("title", "").split(",")]
+        if not segments or not segments[0]:
+            continue
+        abbr = None
+        for segment in segments[1:]:
+            if match := _ABBR_WITH_YEAR.match(segment):
+                abbr = match.group(1)
+                break
+        if abbr is None and record.get("booktitle"):
+            candidate = _BOOKTITLE_SUFFIX.sub("", record["booktitle"])
+            if _is_abbreviation(candidate):
+                abbr = candidate
+        if pair := _venue_pair(segments[0], abbr):
+            yield pair
+
+
+def iter_anthology_venues(path: str) -> Iterator[tuple[str, str]]:
+    """ACL Anthology の XML の各巻の booktitle から (キー, 略称) を返す。"""
+    for meta in iter_xml_elements(path, {"meta"}):
+        booktitle = meta.find("booktitle")
+        if booktitle is None:
+            continue
+        if pair := _venue_pair(" ".join("".join(booktitle.itertext()).split()), None):
+            yield pair
+
+
+def iter_bib_venues(path: str) -> Iterator[tuple[str, str]]:
+    """BibTeX の booktitle / journal から (キー, 略称) を返す。"""
+    for chunk in iter_bib_chunks(path):
+        for entry in bibtexparser.parse_string(chunk).entries:
+            for key in ("booktitle", "journal"):
+                field = entry.fields_dict.get(key)
+                if field and (pair := _venue_pair(str(field.value), None, is_booktitle=key == "booktitle")):
+                    yield pair
+
+
+def _detect_source(path: str) -> str:
+    if ".bib" in path:
+        return "bib"
+    with open_dump(path) as f:
+        head = f.read(4096)
+    return "dblp" if b"<dblp" in head else "anthology"
+
+
+def iter_source_files(paths: list[str]) -> Iterator[str]:
+    """ディレクトリは中の .xml / .xml.gz / .bib / .bib.gz を名前順に展開する。"""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith((".xml", ".xml.gz", ".bib", ".bib.gz")):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def compile_venue_dict(sources: list[str], base: dict[str, str] | None = None, min_count: int = 1) -> tuple[dict[str, str], list[str]]:
+    """入力から辞書を作り、(辞書, 競合の報告) を返す。"""
+    readers = {"dblp": iter_dblp_venues, "anthology": iter_anthology_venues, "bib": iter_bib_venues}
+    counts: dict[str, Counter] = defaultdict(Counter)
+    for path in iter_source_files(sources):
+        for key, abbr in readers[_detect_source(path)](path):
+            counts[key][abbr] += 1
+
+    base = base or {}
+    venues = dict(base)
+    conflicts = []
+    for key in sorted(counts):
+        (abbr, count), *others = counts[key].most_common()
+        if key in base:
+            if abbr != base[key]:
+                conflicts.append(f"{key}: 既存の辞書の {base[key]} を残します（集計では {abbr}×{count}）")
+            continue
+        if count < min_count:
+            continue
+        if others:
+            detail = ", ".join(f"{a}×{c}" for a, c in counts[key].most_common())
+            conflicts.append(f"{key}: {detail} → {abbr}")
+        venues[key] = abbr
+    return venues, conflicts
+
+
+def covers(venues: dict[str, str], name: str, is_booktitle: bool) -> bool:
+    """build_short_venue と同じ規則で、name が辞書で引けるかどうかを返す。"""
+    if not is_booktitle:
+        return name in venues
+    words = name.split()
+    return any(" ".join(words[i:]) in venues for i in range(min(4, len(words))))
+
+
+def check_misses(venues: dict[str, str], misses: list[dict]) -> tuple[list[dict], list[dict]]:
+    """venue_misses.py が集計した名前を、辞書で引けるもの・引けないものに分ける。"""
+    covered, uncovered = [], []
+    for miss in misses:
+        (covered if covers(venues, miss["name"], miss["kind"] == "booktitle") else uncovered).append(miss)
+    return covered, uncovered
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="DBLP / ACL Anthology から略称辞書を作る")
+    parser.add_argument("sources", nargs="+", help="DBLP の XML、Anthology の XML（ディレクトリ可）、BibTeX")
+    parser.add_argument("-o", "--output", default="venue_abbreviations.json", help="出力する辞書ファイル")
+    parser.add_argument("--base", default="resources/venue_abbreviations.json", help="優先して残す既存の辞書（空文字なら使わない）")
+    parser.add_argument("--min-count", type=int, default=1, help="採用に必要な出現回数")
+    parser.add_argument("--misses", help="ボットが辞書に見つけられなかった名前の集計（VENUE_MISS_PATH のファイル）")
+    args = parser.parse_args()
+
+    base = {}
+    if args.base:
+        with open(args.base, "r", encoding="utf-8") as f:
+            base = json.load(f)
+    venues, conflicts = compile_venue_dict(args.sources, base=base, min_count=args.min_count)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(venues, f, ensure_ascii=False, indent=4)
+        f.write("\n")
+
+    for conflict in conflicts:
+        print(f"conflict: {conflict}", file=sys.stderr)
+    print(f"venues:    {len(venues)} ({len(venues) - len(base)} new)")
+    print(f"conflicts: {len(conflicts)}")
+    print(f"output:    {args.output}")
+
+    if args.misses:
+        with open(args.misses, "r", encoding="utf-8") as f:
+            covered, uncovered = check_misses(venues, json.load(f))
+        # 回数の多い順に、まだ辞書で引けない名前を表示する（手で略称を足す候補）
+        for miss in uncovered:
+            print(f"miss: {miss['kind']}: {miss['name']} ({miss['count']})", file=sys.stderr)
+        print(f"misses:    {len(covered)} covered, {len(uncovered)} uncovered")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# tools/dblp.py
+"""
+DBLP の XML ダンプ（dblp.xml / dblp.xml.gz）などの大きな XML を、一定のメモリで1件ずつ読む。
+
+XMLPullParser に少しずつ渡し、読み終えたレコードは木から取り除く。
+DBLP の XML は DTD で定義された文字実体参照（&uuml; など）を使うため、渡す前に数値参照に置き換える。
+"""
+
+import gzip
+import html.entities
+import re
+import xml.etree.ElementTree as ET
+from typing import IO, Iterator
+
+RECORD_TAGS = frozenset({
+    "article", "inproceedings", "proceedings", "book", "incollection", "phdthesis", "mastersthesis", "www",
+})
+# 複数回現れるフィールド
+LIST_FIELDS = frozenset({"author", "editor", "ee", "url"})
+_XML_ENTITIES = frozenset({b"amp", b"lt", b"gt", b"quot", b"apos"})
+_ENTITY = re.compile(rb"&([A-Za-z][A-Za-z0-9]*);")
+# 実体参照の最大長（途中で切れた参照を次の塊に回す判定に使う）
+_MAX_ENTITY = 16
+
+
+def open_dump(path: str) -> IO[bytes]:
+    """ダンプファイルを開く（.gz なら展開しながら読む）。"""
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def _replace_entity(match: re.Match) -> bytes:
+    name = match.group(1)
+    if name in _XML_ENTITIES:
+        return match.group(0)
+    codepoint = html.entities.name2codepoint.get(name.decode("ascii"))
+    return f"&#{codepoint};".encode("ascii") if codepoint else b"?"
+
+
+def iter_xml_elements(path: str, tags: frozenset[str] | set[str], chunk_size: int = 1 << 20) -> Iterator[ET.Element]:
+    """XML ファイルを少しずつパースし、tags のいずれかの要素を読み終えるたびに返す。
+
+    返した要素は、次の要素を読む前に木から取り除く（必要な値は受け取った側ですぐに取り出す）。
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root = None
+    pending = b""
+    with open_dump(path) as f:
+        while True:
+            chunk = f.read(chunk_size)
+            data = pending + chunk
+            pending = b""
+            cut = data.rfind(b"&")
+            if chunk and cut != -1 and len(data) - cut < _MAX_ENTITY and b";" not in data[cut:]:
+                data, pending = data[:cut], data[cut:]
+            parser.feed(_ENTITY.sub(_replace_entity, data))
+
+            for event, elem in parser.read_events():
+                if root is None and event == "start":
+                    root = elem
+                if event == "end" and elem.tag in tags:
+                    yield elem
+                    # 読み終えた要素を木から取り除き、メモリを一定に保つ
+                    elem.clear()
+                    root.clear()
+
+            if not chunk:
+                break
+    parser.close()
+
+
+def iter_dblp_records(path: str, chunk_size: int = 1 << 20) -> Iterator[dict]:
+    """DBLP のレコードを1件ずつ辞書で返す。
+
+    返す辞書には "type"（要素名）と "key" のほか、子要素の文字列が入る。
+    author / editor / ee / url はリストになる。
+    """
+    for elem in iter_xml_elements(path, RECORD_TAGS, chunk_size):
+        record = {"type": elem.tag, "key": elem.get("key", "")}
+        for child in elem:
+            text = "".join(child.itertext()).strip()
+            if child.tag in LIST_FIELDS:
+                record.setdefault(child.tag, []).append(text)
+            else:
+                record[child.tag] = text
+        yield record
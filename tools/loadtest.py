@@ -0,0 +1,263 @@
+# tools/loadtest.py
+"""
+署名付きの Slack イベントを lambda_function.lambda_handler に並行して送り込む負荷試験。
+
+実際の Slack には接続せず、遅延を模した FakeWebClient で Slack API の呼び出しを記録する。
+
+    python -m tools.loadtest --requests 200 --concurrency 16 --latency 0.05 --payload 2.0 --base64
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator
+
+from slack_sdk.signature import SignatureVerifier
+
+import lambda_function
+from admission import AdmissionController
+from dedup import InMemoryDedupStore
+
+SIGNING_SECRET = "loadtest-signing-secret"
+BOT_USER_ID = "UBOT"
+
+ENTRY_TEMPLATE = """@inproceedings{{author-{i}-paper,
+    title = "A Study of Neural Methods for Task {i}",
+    author = "Yamada, Taro and Suzuki, Hanako",
+    booktitle = "Proceedings of the 2020 Conference on Empirical Methods in Natural Language Processing (EMNLP)",
+    year = "2020",
+    pages = "{i}--{j}",
+}}
+"""
+
+
+class FakeWebClient:
+    """Slack API の呼び出しを記録し、遅延を模して応答するクライアント"""
+
+    def __init__(self, latency: float = 0.0, token: str = "xoxb-loadtest"):
+        """初期化
+
+        Args:
+            latency: 1回の API 呼び出しにかかる最大秒数（0〜latency の一様乱数で待つ）
+            token: client.token として返すトークン
+        """
+        self.latency = latency
+        self.token = token
+        self.calls: list[tuple[str, float]] = []
+        self._counter = 0
+        self._lock = threading.Lock()
+
+
+    def _call(self, method: str, **response) -> dict:
+        delay = random.uniform(0, self.latency) if self.latency else 0.0
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            self.calls.append((method, delay))
+            self._counter += 1
+            ts = f"1700000000.{self._counter:06d}"
+        return {"ok": True, "ts": ts, **response}
+
+
+    def auth_test(self, **kwargs) -> dict:
+        return self._call("auth_test", user_id=BOT_USER_ID)
+
+
+    def chat_postMessage(self, channel: str, text: str, **kwargs) -> dict:
+        return self._call("chat_postMessage", channel=channel)
+
+
+    def chat_update(self, channel: str, ts: str, text: str, **kwargs) -> dict:
+        return self._call("chat_update", channel=channel)
+
+
+    def files_upload_v2(self, **kwargs) -> dict:
+        return self._call("files_upload_v2")
+
+
+    def call_counts(self) -> Counter:
+        with self._lock:
+            return Counter(method for method, _ in self.calls)
+
+
+def sign_request(body: str, secret: str = SIGNING_SECRET, timestamp: int | None = None) -> dict[str, str]:
+    """Slack と同じ方式（v0 の HMAC-SHA256）で署名したヘッダーを返す。"""
+    timestamp = str(int(time.time()) if timestamp is None else timestamp)
+    basestring = f"v0:{timestamp}:{body}".encode("utf-8")
+    signature = "v0=" + hmac.new(secret.encode("utf-8"), basestring, hashlib.sha256).hexdigest()
+    return {
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": signature,
+        "Content-Type": "application/json",
+    }
+
+
+def make_event_callback(i: int, entries: int = 1, dm: bool = True) -> dict:
+    """i 番目のメッセージイベントの event_callback ペイロードを作る。"""
+    text = "\n".join(ENTRY_TEMPLATE.format(i=i * entries + k, j=i * entries + k + 10) for k in range(entries))
+    channel = f"D{i:08d}" if dm else "C00000000"
+    if not dm:
+        text = f"<@{BOT_USER_ID}> {text}"
+    return {
+        "type": "event_callback",
+        "event_id": f"Ev{i:010d}",
+        "event": {
+            "type": "message" if dm else "app_mention",
+            "channel": channel,
+            "channel_type": "im" if dm else "channel",
+            "user": f"U{i:08d}",
+            "text": text,
+            "ts": f"1700000000.{i:06d}",
+        },
+    }
+
+
+def make_lambda_event(payload: dict, version: str = "1.0", base64_encoded: bool = False, secret: str = SIGNING_SECRET) -> dict:
+    """API Gateway 1.0 / 2.0 形式の Lambda イベントを作る。"""
+    body = json.dumps(payload, ensure_ascii=False)
+    headers = sign_request(body, secret=secret)
+    if base64_encoded:
+        body = base64.b64encode(body.encode("utf-8")).decode("ascii")
+    if version == "2.0":
+        return {
+            "version": "2.0",
+            "routeKey": "POST /slack/events",
+            "rawPath": "/slack/events",
+            "headers": {k.lower(): v for k, v in headers.items()},
+            "requestContext": {"http": {"method": "POST", "path": "/slack/events"}},
+            "body": body,
+            "isBase64Encoded": base64_encoded,
+        }
+    return {
+        "resource": "/slack/events",
+        "path": "/slack/events",
+        "httpMethod": "POST",
+        "headers": headers,
+        "body": body,
+        "isBase64Encoded": base64_encoded,
+    }
+
+
+@contextmanager
+def patched_lambda(client: FakeWebClient, secret: str = SIGNING_SECRET) -> Iterator[None]:
+    """lambda_function のグローバルを負荷試験用に差し替え、終了後に元に戻す。"""
+    names = ("client", "signature_verifier", "dedup_store", "admission")
+    saved = {name: getattr(lambda_function, name) for name in names}
+    lambda_function.client = client
+    lambda_function.signature_verifier = SignatureVerifier(secret)
+    lambda_function.dedup_store = InMemoryDedupStore()
+    # 受付制御で待たされると処理経路の計測にならないため、予算を実質無制限にする
+    lambda_function.admission = AdmissionController(
+        user_rate=1e9, user_burst=1e9, channel_rate=1e9, channel_burst=1e9
+    )
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(lambda_function, name, value)
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """ソート済みの値の p パーセンタイル（最近傍順位法）を返す。"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def run_load_test(
+    requests: int = 100,
+    concurrency: int = 8,
+    latency: float = 0.0,
+    version: str = "1.0",
+    base64_encoded: bool = False,
+    entries: int = 1,
+    dm: bool = True,
+) -> dict:
+    """lambda_handler に並行してイベントを送り、スループットとレイテンシを集計する。
+
+    Args:
+        requests: 送るイベント数
+        concurrency: 並行数
+        latency: Slack API 1回あたりの最大遅延（秒）
+        version: API Gateway のペイロード形式（"1.0" または "2.0"）
+        base64_encoded: ボディを Base64 エンコードするかどうか
+        entries: 1メッセージあたりの BibTeX エントリ数
+        dm: DM として送るかどうか（False の場合はチャンネルでのメンション）
+    返り値:
+        集計結果の辞書
+    """
+    client = FakeWebClient(latency=latency)
+    events = [
+        make_lambda_event(make_event_callback(i, entries=entries, dm=dm), version=version, base64_encoded=base64_encoded)
+        for i in range(requests)
+    ]
+
+    def invoke(event):
+        started = time.perf_counter()
+        response = lambda_function.lambda_handler(event, None)
+        return time.perf_counter() - started, response["statusCode"]
+
+    with patched_lambda(client):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(invoke, events))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed": elapsed,
+        "throughput": requests / elapsed if elapsed else 0.0,
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "status": Counter(status for _, status in results),
+        "slack_calls": client.call_counts(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="lambda_handler の負荷試験")
+    parser.add_argument("--requests", type=int, default=100, help="送るイベント数")
+    parser.add_argument("--concurrency", type=int, default=8, help="並行数")
+    parser.add_argument("--latency", type=float, default=0.05, help="Slack API 1回あたりの最大遅延（秒）")
+    parser.add_argument("--payload", choices=["1.0", "2.0"], default="1.0", help="API Gateway のペイロード形式")
+    parser.add_argument("--base64", action="store_true", help="ボディを Base64 エンコードする")
+    parser.add_argument("--entries", type=int, default=1, help="1メッセージあたりのエントリ数")
+    parser.add_argument("--channel", action="store_true", help="DM ではなくチャンネルでのメンションとして送る")
+    args = parser.parse_args()
+
+    report = run_load_test(
+        requests=args.requests,
+        concurrency=args.concurrency,
+        latency=args.latency,
+        version=args.payload,
+        base64_encoded=args.base64,
+        entries=args.entries,
+        dm=not args.channel,
+    )
+    print(f"requests:    {report['requests']} (concurrency {report['concurrency']})")
+    print(f"elapsed:     {report['elapsed']:.3f} s")
+    print(f"throughput:  {report['throughput']:.1f} req/s")
+    print(
+        f"latency:     mean {report['mean'] * 1000:.1f} ms, p50 {report['p50'] * 1000:.1f} ms, "
+        f"p95 {report['p95'] * 1000:.1f} ms, p99 {report['p99'] * 1000:.1f} ms"
+    )
+    print(f"status:      {dict(report['status'])}")
+    print(f"slack calls: {dict(report['slack_calls'])}")
+
+
+if __name__ == "__main__":
+    main()
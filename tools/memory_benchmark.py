@@ -0,0 +1,102 @@
+# tools/memory_benchmark.py
+"""
+bibtex.simplify のメモリ使用量を tracemalloc で段階ごとに計測する。
+
+    python -m tools.memory_benchmark --sizes 1 100 1000 10000 50000
+
+段階:
+- parse: 文字列から Library を作る（分割・パース）
+- format: Library を整形して文字列にする（middleware・書き出し）
+- total: simplify_bibtex_entry 全体
+"""
+
+import argparse
+import gc
+import tracemalloc
+
+from bibtex.simplify import _parse_bibtex_entries, _iter_formatted_blocks, simplify_bibtex_entry
+
+ENTRY_TEMPLATE = """% entry {i}
+@inproceedings{{author-{i}-paper,
+    title = "A Study of {{Neural}} Methods for Task {i}: Analysis and Benchmark",
+    author = "Yamada, Taro  and
+      Suzuki, Hanako  and
+      Tanaka, Jiro",
+    booktitle = "Proceedings of the 2020 Conference on Empirical Methods in Natural Language Processing (EMNLP)",
+    month = nov,
+    year = "2020",
+    address = "Online",
+    publisher = "Association for Computational Linguistics",
+    url = "https://aclanthology.org/2020.emnlp-main.{i}/",
+    doi = "10.18653/v1/2020.emnlp-main.{i}",
+    pages = "{i}--{j}",
+    abstract = "{abstract}",
+}}
+"""
+
+ABSTRACT = "We propose a simple method for structured prediction and show that it improves results. " * 8
+
+
+def make_corpus(n_entries: int) -> str:
+    """計測用の BibTeX 文字列を作る。"""
+    return "\n".join(ENTRY_TEMPLATE.format(i=i, j=i + 10, abstract=ABSTRACT) for i in range(n_entries))
+
+
+def _measure(func, *args, **kwargs):
+    """func 実行中のピーク割り当て量と、実行後に残った割り当て量を返す。"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = func(*args, **kwargs)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak - before, current - before
+
+
+def measure_memory(n_entries: int) -> dict[str, dict[str, float]]:
+    """段階ごとのピーク割り当て量（バイト）とエントリあたりの値を返す。"""
+    # 初回呼び出し時の正規表現のコンパイルや辞書の読み込みを計測から除く
+    simplify_bibtex_entry(make_corpus(1))
+
+    raw_bib = make_corpus(n_entries)
+    report = {"input": {"peak": len(raw_bib.encode("utf-8")), "retained": 0}}
+
+    library, peak, retained = _measure(_parse_bibtex_entries, raw_bib)
+    report["parse"] = {"peak": peak, "retained": retained}
+
+    def format_all():
+        return "".join(_iter_formatted_blocks(library))
+
+    result, peak, retained = _measure(format_all)
+    report["format"] = {"peak": peak, "retained": retained}
+    del library, result
+
+    result, peak, retained = _measure(simplify_bibtex_entry, raw_bib)
+    report["total"] = {"peak": peak, "retained": retained}
+    del result
+
+    for stage in report.values():
+        stage["peak_per_entry"] = stage["peak"] / n_entries
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="bibtex.simplify のメモリ使用量を計測する")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} {'stage':>8} {'peak(KiB)':>12} {'retained(KiB)':>14} {'peak/entry(B)':>14}")
+    for n_entries in args.sizes:
+        report = measure_memory(n_entries)
+        for stage, values in report.items():
+            print(
+                f"{n_entries:>8} {stage:>8} {values['peak'] / 1024:>12.1f} "
+                f"{values['retained'] / 1024:>14.1f} {values['peak_per_entry']:>14.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
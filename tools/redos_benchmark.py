@@ -0,0 +1,94 @@
+# tools/redos_benchmark.py
+"""
+Slack から来る文字列を扱う関数に、正規表現のバックトラックを起こしやすい入力を与えて処理時間を測る。
+
+    python -m tools.redos_benchmark --sizes 1000 10000 50000 --random 200
+
+閉じていない括弧・中括弧・コードブロック、空白の長い連続、@ だけが続く文字列などを長さを変えて与え、
+長さを10倍にしたときに時間がおよそ10倍（線形）に収まっているかを確認する。
+--random を指定すると、記号を多く含むランダムな文字列でも最も遅かったものを表示する。
+"""
+
+import argparse
+import random
+import time
+from typing import Callable
+
+from bibtex.latex_lexer import lex
+from bibtex.middleware.formatter import BibTeXFormatterMiddleware
+from bibtex.title_case import format_title
+from slack_handler import looks_like_bibtex, parse_options
+
+# (名前, 長さ n の入力を作る関数)
+ADVERSARIAL_INPUTS: list[tuple[str, Callable[[int], str]]] = [
+    ("open parens", lambda n: "(" * n),
+    ("open full-width parens", lambda n: "（a" * (n // 2)),
+    ("parens then spaces", lambda n: "a(" + " " * (n - 3) + "x"),
+    ("open braces", lambda n: "{" * n),
+    ("braces and commands", lambda n: "{\\a" * (n // 3)),
+    ("spaces before year", lambda n: "a" + " " * (n - 5) + "x2020"),
+    ("dashes before year", lambda n: "a" + "-" * (n - 5) + "x2020"),
+    ("spaces before volume", lambda n: "a" + " " * (n - 6) + "Vol. x"),
+    ("repeated volume", lambda n: ", Vol. " * (n // 7)),
+    ("open code fences", lambda n: "```a" * (n // 4)),
+    ("at signs", lambda n: "@" * n),
+    ("entry starts", lambda n: "@a " * (n // 3)),
+]
+
+# 入力ごとに測る関数
+TARGETS: list[tuple[str, Callable[[str], object]]] = [
+    ("process_venue_text", BibTeXFormatterMiddleware().process_venue_text),
+    ("normalize_venue_name", BibTeXFormatterMiddleware.normalize_venue_name),
+    ("parse_options", parse_options),
+    ("lex", lex.__wrapped__),
+    ("format_title", format_title),
+    ("looks_like_bibtex", looks_like_bibtex),
+]
+
+RANDOM_ALPHABET = "({[)}]（）\\@`-–—,.:;  \t\nVol.No.2020aA"
+
+
+def _time(func: Callable[[str], object], text: str) -> float:
+    started = time.perf_counter()
+    func(text)
+    return time.perf_counter() - started
+
+
+def run_adversarial(sizes: list[int]) -> float:
+    """固定の入力を長さを変えて与え、結果を表示する。最も遅かった時間（秒）を返す。"""
+    worst = 0.0
+    header = "".join(f"{size:>12}" for size in sizes)
+    print(f"{'target':<22}{'input':<24}{header}")
+    for target_name, func in TARGETS:
+        for input_name, make in ADVERSARIAL_INPUTS:
+            times = [_time(func, make(size)) for size in sizes]
+            worst = max(worst, *times)
+            cells = "".join(f"{t * 1000:>10.2f}ms" for t in times)
+            print(f"{target_name:<22}{input_name:<24}{cells}")
+    return worst
+
+
+def run_random(count: int, size: int, seed: int = 0) -> None:
+    """記号の多いランダムな文字列を count 個与え、関数ごとに最も遅かった入力を表示する。"""
+    rng = random.Random(seed)
+    texts = ["".join(rng.choice(RANDOM_ALPHABET) for _ in range(size)) for _ in range(count)]
+    for target_name, func in TARGETS:
+        slowest, text = max((_time(func, text), text) for text in texts)
+        print(f"{target_name:<22}{slowest * 1000:>10.2f}ms  {text[:40]!r}...")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="バックトラックを起こしやすい入力で処理時間を測る")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="入力の長さ")
+    parser.add_argument("--random", type=int, default=0, help="ランダムな入力の数")
+    parser.add_argument("--random-size", type=int, default=5000, help="ランダムな入力の長さ")
+    args = parser.parse_args()
+
+    worst = run_adversarial(args.sizes)
+    print(f"worst: {worst * 1000:.2f} ms")
+    if args.random:
+        run_random(args.random, args.random_size)
+
+
+if __name__ == "__main__":
+    main()
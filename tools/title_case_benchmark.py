@@ -0,0 +1,98 @@
+# tools/title_case_benchmark.py
+"""
+タイトル整形の速度を、以前の実装（titlecase ライブラリ＋プレースホルダ置換）と比較する。
+
+    python -m tools.title_case_benchmark --titles 2000 --repeat 5
+"""
+
+import argparse
+import random
+import re
+import time
+
+from titlecase import set_small_word_list, titlecase
+
+from bibtex.title_case import format_title
+
+LEGACY_SMALL_WORDS = r"a|an|and|as|at|but|by|en|for|if|in|of|on|or|the|to|v\.?|via|vs\.?|with"
+
+WORDS = [
+    "a", "an", "the", "of", "and", "in", "on", "for", "to", "with", "via", "vs.", "by",
+    "deep", "learning", "neural", "networks", "language", "models", "analysis", "study", "towards",
+    "efficient", "robust", "state-of-the-art", "pre-trained", "large-scale", "BERT", "GPU", "NLP",
+    "iPhone", "e.g.", "U.S.", "{BERT}", "{GPU}s", "pre-{BERT}", "{Deep Learning}", "{LLM}-based",
+]
+
+
+def legacy_format_title(title: str) -> str:
+    """以前の TitleFormatterMiddleware._format_title（LaTeX コマンドを含まない場合）。"""
+    protected_parts = []
+
+    def protect_match(match):
+        protected_parts.append(match.group(0))
+        return f"<<protected-{len(protected_parts)-1}>>"
+
+    def protect_braces(match):
+        protected_parts.append(match.group(1))
+        return f"<<protected-{len(protected_parts)-1}>>"
+
+    title = re.sub(r"\{([^}]+)\}", protect_braces, title)
+
+    colon_match = re.search(r"[:：]", title)
+    if colon_match:
+        before_part = title[:colon_match.start()].strip()
+        if before_part and not re.search(r"\s", before_part):
+            if not before_part.startswith("<<protected-"):
+                prefix = title[:colon_match.start()]
+                protected_prefix = re.sub(r"\S+", protect_match, prefix, count=1)
+                title = protected_prefix + title[colon_match.start():]
+
+    formatted = titlecase(title)
+    for i, protected in enumerate(protected_parts):
+        formatted = formatted.replace(f"<<protected-{i}>>", protected)
+    return formatted
+
+
+def make_titles(n_titles: int, seed: int = 0) -> list[str]:
+    """計測用のタイトルを作る。"""
+    rng = random.Random(seed)
+    titles = []
+    for _ in range(n_titles):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(4, 16))]
+        if rng.random() < 0.3:
+            words[0] += ":"
+        titles.append(" ".join(words))
+    return titles
+
+
+def _time(func, titles: list[str], repeat: int) -> float:
+    """titles 全件の整形を repeat 回行い、最速の秒数を返す。"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for title in titles:
+            func(title)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="タイトル整形の速度を比較する")
+    parser.add_argument("--titles", type=int, default=2000, help="タイトル数")
+    parser.add_argument("--repeat", type=int, default=5, help="繰り返し回数（最速の値を使う）")
+    args = parser.parse_args()
+
+    set_small_word_list(LEGACY_SMALL_WORDS)
+    titles = make_titles(args.titles)
+    mismatches = sum(legacy_format_title(title) != format_title(title) for title in titles)
+
+    legacy = _time(legacy_format_title, titles, args.repeat)
+    current = _time(format_title, titles, args.repeat)
+    print(f"titles:   {len(titles)} (mismatches: {mismatches})")
+    print(f"legacy:   {legacy * 1000:.1f} ms ({legacy / len(titles) * 1e6:.1f} us/title)")
+    print(f"current:  {current * 1000:.1f} ms ({current / len(titles) * 1e6:.1f} us/title)")
+    print(f"speedup:  {legacy / current:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+# tools/watch.py
+"""
+ローカルの .bib ファイルを監視し、保存されるたびに整形して書き戻す。
+
+    python -m tools.watch references.bib -s
+
+保存されるたびにファイル全体を1回パースし（@string の参照もファイル全体で解決する）、
+ブロックの開始位置でファイルをまとまり（ブロックと、その後ろのコメント）に分ける。
+エントリのまとまりの内容のハッシュから整形結果を引くマニフェスト（.<ファイル名>.bibbot.json）を持ち、
+変わったまとまりのエントリだけを整形して、一時ファイルに書いてから置き換える（ファイルのパーミッションは元のまま）。
+整形結果そのもののハッシュもマニフェストに入れるため、書き戻したファイルを次に読んだときは何も整形し直さない。
+@string の定義、略称辞書、出版版の索引のいずれかが変わったら、結果が変わりうるため、すべて整形し直す
+（監視中に変わった場合も、次に保存されたときに整形し直す）。
+
+エントリ以外のまとまり（先頭のコメントや @string など）や解析に失敗したまとまりは、そのまま残す。
+エントリの後ろのコメントや空行も、書かれたまま残す。
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import stat
+import sys
+import tempfile
+import time
+
+from bibtexparser.library import Library
+from bibtexparser.model import Block, Entry, ImplicitComment, ParsingFailedBlock, String
+
+from bibtex.simplify import iter_formatted_entries, parse_library
+from load_resource import published_index_version, venue_dict_version
+
+MANIFEST_VERSION = 3
+
+
+def split_blocks(text: str, library: Library) -> list[tuple[str, Block | None]]:
+    """ファイルをブロックの開始位置で区切った (まとまり, ブロック) のリストを返す（連結すると元の文字列に戻る）。
+
+    先頭のコメントだけのまとまりのブロックは None になる。
+    """
+    starts: list[tuple[int, Block]] = []
+    position = 0
+    for block in library.blocks:
+        if isinstance(block, ImplicitComment):
+            continue
+        span = getattr(block, "span", None)
+        # 解析に失敗したブロックは位置を持たないため、raw を探す
+        start = span[0] if span is not None else text.find(block.raw, position)
+        if start < 0:
+            continue
+        starts.append((start, block))
+        position = start + 1
+
+    segments: list[tuple[str, Block | None]] = []
+    first = starts[0][0] if starts else len(text)
+    if first > 0:
+        segments.append((text[:first], None))
+    for i, (start, block) in enumerate(starts):
+        end = starts[i + 1][0] if i + 1 < len(starts) else len(text)
+        segments.append((text[start:end], block))
+    return segments
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def manifest_path(path: str) -> str:
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f".{name}.bibbot.json")
+
+
+class Manifest:
+    """まとまりのハッシュから整形結果を引く表
+
+    整形のモード、略称辞書・出版版の索引のバージョン、ファイルの @string の定義が変わったら、以前の結果は使わない。
+    """
+
+    # 整形するたびに確かめる設定
+    RESOURCES = ("venue_dict", "published_index", "strings")
+
+    def __init__(self, path: str, abbreviation_mode: str):
+        """初期化
+
+        Args:
+            path: マニフェストファイルのパス（なければ空の表から始める）
+            abbreviation_mode: "short", "long", "both"
+        """
+        self.path = path
+        self.settings = {"version": MANIFEST_VERSION, "mode": abbreviation_mode, **dict.fromkeys(self.RESOURCES)}
+        self.entries: dict[str, str] = {}
+        self.dirty = False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        saved = data.get("settings") or {}
+        if all(saved.get(key) == self.settings[key] for key in ("version", "mode")):
+            self.settings.update({key: saved.get(key) for key in self.RESOURCES})
+            outputs = data.get("outputs", [])
+            self.entries = {digest: outputs[i] for digest, i in data.get("index", {}).items()}
+
+
+    def use_resources(self, venue_dict: str, published_index: str, strings: str) -> None:
+        """略称辞書・出版版の索引のバージョンと、ファイルの @string の定義のハッシュを設定する。以前と違えば表を空にする。"""
+        resources = {"venue_dict": venue_dict, "published_index": published_index, "strings": strings}
+        if any(self.settings[key] != value for key, value in resources.items()):
+            self.settings.update(resources)
+            self.entries = {}
+            self.dirty = True
+
+
+    def get(self, segment: str) -> str | None:
+        return self.entries.get(_digest(segment))
+
+
+    def put(self, segment: str, formatted: str) -> None:
+        self.dirty = True
+        self.entries[_digest(segment)] = formatted
+        # 書き戻した後に読み直したときも、整形し直さずに済むようにする（ファイル末尾のまとまりは改行が1つになる）
+        self.entries[_digest(formatted)] = formatted
+        self.entries[_digest(formatted.rstrip("\n") + "\n")] = formatted
+
+
+    def prune(self, keep: set[str]) -> None:
+        """現在のファイルのまとまり（ハッシュが keep にあるもの）とその整形結果以外を捨てる。"""
+        outputs = {self.entries[digest] for digest in keep if digest in self.entries}
+        pruned = {digest: formatted for digest, formatted in self.entries.items() if digest in keep or formatted in outputs}
+        if len(pruned) != len(self.entries):
+            self.entries = pruned
+            self.dirty = True
+
+
+    def save(self) -> None:
+        """変更があればファイルに書き出す。"""
+        if self.dirty:
+            # 1つの整形結果を複数のハッシュから引くため、結果は1回だけ書く
+            positions: dict[str, int] = {}
+            index = {digest: positions.setdefault(formatted, len(positions)) for digest, formatted in self.entries.items()}
+            data = {"settings": self.settings, "outputs": list(positions), "index": index}
+            _write_atomic(self.path, json.dumps(data, ensure_ascii=False))
+            self.dirty = False
+
+
+def _write_atomic(path: str, text: str) -> None:
+    """同じディレクトリの一時ファイルに書いてから置き換える（既存のファイルのパーミッションを引き継ぐ）。"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".bibbot-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        try:
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _headline(segment: str) -> str:
+    return segment.strip().splitlines()[0]
+
+
+def format_file(path: str, abbreviation_mode: str = "both", manifest: Manifest | None = None, log=print) -> dict[str, int]:
+    """ファイルを整形して書き戻し、件数を返す。内容が変わらなければ書き込まない。
+
+    返り値:
+        {"segments": まとまりの数, "formatted": 整形したエントリの数, "reused": マニフェストの結果を使ったエントリの数}
+    """
+    manifest = manifest or Manifest(manifest_path(path), abbreviation_mode)
+    with open(path, "r", encoding="utf-8-sig") as f:
+        text = f.read()
+
+    library = parse_library(text)
+    manifest.use_resources(
+        venue_dict=venue_dict_version(),
+        published_index=published_index_version(),
+        strings=_digest("\n".join(block.raw for block in library.blocks if isinstance(block, String))),
+    )
+    segments = split_blocks(text, library)
+
+    outputs = [segment for segment, _ in segments]
+    stale: list[int] = []
+    reused = 0
+    for i, (segment, block) in enumerate(segments):
+        if isinstance(block, ParsingFailedBlock):
+            log(f"{_headline(segment)}: BibTeX の解析に失敗したため、そのまま残します。")
+        elif isinstance(block, Entry):
+            output = manifest.get(segment)
+            if output is None:
+                stale.append(i)
+            else:
+                outputs[i] = output
+                reused += 1
+
+    # 変わったエントリだけを整形する（エントリの後ろのコメントと空行はそのまま残す）
+    warnings: list[str] = []
+    formatted = iter_formatted_entries(
+        (segments[i][1] for i in stale), abbreviation_mode=abbreviation_mode, warning_callback=warnings.append
+    )
+    for i, entry_output in zip(stale, formatted):
+        segment, block = segments[i]
+        for message in warnings:
+            log(f"{_headline(segment)}: {message}")
+        warnings.clear()
+        start, end = block.span
+        output = entry_output.rstrip("\n") + segment[end - start:]
+        manifest.put(segment, output)
+        outputs[i] = output
+
+    result = "".join(outputs).rstrip("\n") + "\n" if outputs else text
+    if result != text:
+        _write_atomic(path, result)
+    manifest.prune({_digest(segment) for segment, _ in segments})
+    manifest.save()
+    return {"segments": len(segments), "formatted": len(stale), "reused": reused}
+
+
+def _stat(path: str) -> tuple[int, int] | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def watch(path: str, abbreviation_mode: str = "both", interval: float = 0.5) -> None:
+    """ファイルが保存されるたびに format_file を呼ぶ（Ctrl-C で終了）。"""
+    manifest = Manifest(manifest_path(path), abbreviation_mode)
+    last = None
+    while True:
+        current = _stat(path)
+        if current is not None and current != last:
+            started = time.perf_counter()
+            counts = format_file(path, abbreviation_mode, manifest, log=lambda message: print(message, file=sys.stderr))
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"{path}: {counts['formatted']} formatted, {counts['reused']} unchanged ({elapsed:.1f} ms)")
+            # 書き戻しによる更新は次の変更として扱わない
+            last = _stat(path)
+        time.sleep(interval)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=".bib ファイルを監視し、保存されるたびに整形する")
+    parser.add_argument("path", help="監視する .bib ファイル")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("-s", "--short", action="store_const", const="short", dest="mode", help="省略形のみ出力")
+    mode.add_argument("-l", "--long", action="store_const", const="long", dest="mode", help="原形のみ出力")
+    parser.add_argument("--interval", type=float, default=0.5, help="ファイルを確認する間隔（秒）")
+    parser.add_argument("--once", action="store_true", help="一度だけ整形して終了する")
+    args = parser.parse_args()
+
+    abbreviation_mode = args.mode or "both"
+    if args.once:
+        counts = format_file(args.path, abbreviation_mode, log=lambda message: print(message, file=sys.stderr))
+        print(f"{args.path}: {counts['formatted']} formatted, {counts['reused']} unchanged")
+        return
+    try:
+        watch(args.path, abbreviation_mode, args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
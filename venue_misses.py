@@ -0,0 +1,188 @@
+# venue_misses.py
+"""
+略称辞書に見つからなかった会議名・論文誌名の集計。
+
+build_short_venue が辞書を引けずにイニシャルで略称を作るたびに、正規化した名前（辞書のキーと同じ形）を記録する。
+記録は Space-Saving 法で上位 K 件だけを数えるため、どれだけ多くの種類の名前が来てもメモリは一定になる。
+一定時間ごとに、一定回数以上現れた名前だけをファイル（JSON）に足し込むか、ログに出力する。
+ユーザーやメッセージの情報は持たず、タイトルなども含めない。
+
+数えるのは実際に整形した回数だけで、FormatCache の結果を使い回したエントリ（編集されたメッセージの変わっていないエントリなど）は数えない。
+書き出しは記録したときと、イベントを処理し終えたとき（maybe_flush）に間隔を確かめて行う。
+常駐プロセス（server.py）は停止するときに flush を呼び、最後の間隔の分も書き出す。
+
+集計したファイルは tools/compile_venue_dict.py の --misses に渡すと、辞書に足りない名前の確認に使える。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable
+
+# 記録する名前の最大長（これより長いものは切り詰める）
+MAX_NAME_LENGTH = 200
+
+
+class SpaceSaving:
+    """Space-Saving 法による上位 K 件の頻度の推定
+
+    数える項目は最大 capacity 件。満杯のときに新しい項目が来たら、最も少ない項目と入れ替え、
+    その回数 + 1 から数え始める（入れ替え前の回数を誤差の上限として持つ）。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        # 項目 → [回数, 誤差の上限]
+        self._counts: dict[str, list[int]] = {}
+
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+
+    def add(self, item: str, count: int = 1) -> None:
+        counter = self._counts.get(item)
+        if counter is not None:
+            counter[0] += count
+            return
+        if len(self._counts) < self.capacity:
+            self._counts[item] = [count, 0]
+            return
+        # 辞書に見つからない場合だけ通る経路なので、最小の項目は線形に探す
+        victim = min(self._counts, key=lambda key: self._counts[key][0])
+        floor = self._counts.pop(victim)[0]
+        self._counts[item] = [floor + count, floor]
+
+
+    def top(self, n: int | None = None) -> list[tuple[str, int, int]]:
+        """(項目, 回数, 誤差の上限) を回数の多い順に返す。"""
+        items = sorted(((item, c, e) for item, (c, e) in self._counts.items()), key=lambda x: (-x[1], x[0]))
+        return items if n is None else items[:n]
+
+
+    def clear(self) -> None:
+        self._counts.clear()
+
+
+class VenueMissRecorder:
+    """辞書に見つからなかった名前を数え、定期的に書き出す"""
+
+    def __init__(
+        self,
+        capacity: int = 200,
+        min_count: int = 2,
+        flush_interval: float = 300.0,
+        path: str | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """初期化
+
+        Args:
+            capacity: 数える名前の最大数（Space-Saving のカウンタ数）
+            min_count: 書き出す名前の最小の回数（誤差を引いた回数で判定する）
+            flush_interval: 書き出す間隔（秒）
+            path: 足し込む JSON ファイル（None の場合はログに出力する）
+            clock: 時刻を返す関数（テスト用）
+        """
+        self.min_count = min_count
+        self.flush_interval = flush_interval
+        self.path = path
+        self._clock = clock
+        self._sketch = SpaceSaving(capacity)
+        self._lock = threading.Lock()
+        self._last_flush = clock()
+
+
+    def record(self, name: str, is_booktitle: bool) -> None:
+        """正規化済みの名前を1回記録する。前回の書き出しから flush_interval 経てば書き出す。"""
+        name = " ".join(name.split())[:MAX_NAME_LENGTH]
+        if not name:
+            return
+        kind = "booktitle" if is_booktitle else "journal"
+        with self._lock:
+            self._sketch.add(f"{kind}\t{name}")
+            due = self._clock() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+
+    def maybe_flush(self) -> None:
+        """前回の書き出しから flush_interval 経っていれば書き出す。"""
+        with self._lock:
+            due = len(self._sketch) > 0 and self._clock() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+
+    def snapshot(self) -> list[dict]:
+        """書き出す対象（誤差を引いても min_count 回以上の名前）を回数の多い順に返す。"""
+        with self._lock:
+            top = self._sketch.top()
+        misses = []
+        for item, count, error in top:
+            if count - error < self.min_count:
+                continue
+            kind, name = item.split("\t", 1)
+            misses.append({"name": name, "kind": kind, "count": count})
+        return misses
+
+
+    def flush(self) -> list[dict]:
+        """集計を書き出して数え直し、書き出した項目を返す。"""
+        misses = self.snapshot()
+        with self._lock:
+            self._sketch.clear()
+            self._last_flush = self._clock()
+        if not misses:
+            return misses
+        if self.path:
+            try:
+                self._merge_into_file(misses)
+            except OSError as e:
+                logging.warning("辞書に見つからなかった名前を書き出せませんでした: %s", e)
+        else:
+            logging.info("venue_misses %s", json.dumps(misses, ensure_ascii=False))
+        return misses
+
+
+    def _merge_into_file(self, misses: list[dict]) -> None:
+        """既存のファイルの回数に足し込み、一時ファイル経由で置き換える。"""
+        totals: dict[tuple[str, str], int] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for miss in json.load(f):
+                    totals[(miss["kind"], miss["name"])] = int(miss["count"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        for miss in misses:
+            key = (miss["kind"], miss["name"])
+            totals[key] = totals.get(key, 0) + miss["count"]
+
+        merged = [{"name": name, "kind": kind, "count": count} for (kind, name), count in totals.items()]
+        merged.sort(key=lambda miss: (-miss["count"], miss["name"]))
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(merged, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def create_venue_miss_recorder() -> VenueMissRecorder:
+    """環境変数の設定に応じて記録器を作成する。
+
+    - VENUE_MISS_PATH: 足し込む JSON ファイル（未設定ならログに出力する）
+    - VENUE_MISS_TOP_K: 数える名前の最大数
+    - VENUE_MISS_MIN_COUNT: 書き出す名前の最小の回数
+    - VENUE_MISS_FLUSH_INTERVAL: 書き出す間隔（秒）
+    """
+    return VenueMissRecorder(
+        capacity=int(os.environ.get("VENUE_MISS_TOP_K", 200)),
+        min_count=int(os.environ.get("VENUE_MISS_MIN_COUNT", 2)),
+        flush_interval=float(os.environ.get("VENUE_MISS_FLUSH_INTERVAL", 300)),
+        path=os.environ.get("VENUE_MISS_PATH") or None,
+    )
+
+
+# プロセス全体で共有する記録器
+venue_miss_recorder = create_venue_miss_recorder()